@@ -0,0 +1,19 @@
+"""
+ASGI config for ccdb5_api project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the project with an ASGI server and set CCDB_ASYNC_VIEWS=true to use
+the async search, states and trends handlers.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/stable/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ccdb5_api.settings")
+
+application = get_asgi_application()
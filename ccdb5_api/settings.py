@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 import django
 from django.utils.crypto import get_random_string
@@ -77,3 +78,93 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = "/static/"
+
+# Set CCDB_RESPONSE_CACHE to the alias of a configured cache to cache search,
+# states and trends responses per index version. Any Django cache backend
+# works, e.g. LocMemCache, FileBasedCache or RedisCache.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "responses": {
+        "BACKEND": os.environ.get(
+            "CCDB_RESPONSE_CACHE_BACKEND",
+            "django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.environ.get(
+            "CCDB_RESPONSE_CACHE_LOCATION", "ccdb-responses"
+        ),
+    },
+}
+
+CCDB_RESPONSE_CACHE = os.environ.get("CCDB_RESPONSE_CACHE")
+CCDB_RESPONSE_CACHE_TIMEOUT = int(
+    os.environ.get("CCDB_RESPONSE_CACHE_TIMEOUT", 300)
+)
+
+# Compress CSV and JSON exports with zstd or gzip for clients that send a
+# matching Accept-Encoding header. The level applies to either codec; zstd
+# needs the zstandard package.
+# Exports that can be resumed with Range requests are never encoded.
+CCDB_EXPORT_COMPRESSION = (
+    os.environ.get("CCDB_EXPORT_COMPRESSION", "true").lower() == "true"
+)
+CCDB_EXPORT_COMPRESSION_LEVEL = int(
+    os.environ.get("CCDB_EXPORT_COMPRESSION_LEVEL", 6)
+)
+
+# Exports requested with background=true are written to CCDB_EXPORT_JOB_DIR
+# by a pool of CCDB_EXPORT_JOB_WORKERS threads per process, and kept for
+# CCDB_EXPORT_JOB_TTL seconds. Share the directory between processes so any
+# of them can report on and serve a job.
+CCDB_EXPORT_JOB_DIR = os.environ.get(
+    "CCDB_EXPORT_JOB_DIR", os.path.join(tempfile.gettempdir(), "ccdb-exports")
+)
+CCDB_EXPORT_JOB_WORKERS = int(os.environ.get("CCDB_EXPORT_JOB_WORKERS", 2))
+CCDB_EXPORT_JOB_TTL = int(os.environ.get("CCDB_EXPORT_JOB_TTL", 3600))
+
+# With EXPORT_ENGINE=pit and no slices, CSV, JSON and NDJSON exports can be
+# resumed with a resume token or a Range request. Checkpoints are stored every
+# CCDB_EXPORT_CHECKPOINT_INTERVAL bytes in CCDB_EXPORT_CURSOR_CACHE for
+# CCDB_EXPORT_CURSOR_TTL seconds; use a shared cache with several processes.
+# A client may resume each export CCDB_EXPORT_MAX_RESUMES times without it
+# counting against the export throttles.
+CCDB_EXPORT_CURSOR_CACHE = os.environ.get(
+    "CCDB_EXPORT_CURSOR_CACHE", "default"
+)
+CCDB_EXPORT_CURSOR_TTL = int(os.environ.get("CCDB_EXPORT_CURSOR_TTL", 3600))
+CCDB_EXPORT_CHECKPOINT_INTERVAL = int(
+    os.environ.get("CCDB_EXPORT_CHECKPOINT_INTERVAL", 1024 * 1024)
+)
+CCDB_EXPORT_MAX_RESUMES = int(os.environ.get("CCDB_EXPORT_MAX_RESUMES", 3))
+
+# Unfiltered exports are served from full-dataset snapshots in
+# CCDB_EXPORT_SNAPSHOT_DIR, written by the build_export_snapshots command.
+# With CCDB_EXPORT_SNAPSHOT_ON_REFRESH, a process that detects an index
+# reload also rebuilds them in the background.
+CCDB_EXPORT_SNAPSHOT_DIR = os.environ.get("CCDB_EXPORT_SNAPSHOT_DIR")
+CCDB_EXPORT_SNAPSHOT_ON_REFRESH = (
+    os.environ.get("CCDB_EXPORT_SNAPSHOT_ON_REFRESH", "false").lower()
+    == "true"
+)
+
+# Filter sets registered with POST /filter-sets are stored in
+# CCDB_FILTER_SET_DIR, a directory all processes share; registration is
+# disabled while it is not set. A set may hold up to
+# CCDB_FILTER_SET_MAX_VALUES filter values and expires
+# CCDB_FILTER_SET_TTL seconds after it was last registered. No new sets
+# are accepted while CCDB_FILTER_SET_MAX_SETS live ones are stored.
+CCDB_FILTER_SET_DIR = os.environ.get("CCDB_FILTER_SET_DIR")
+CCDB_FILTER_SET_MAX_VALUES = int(
+    os.environ.get("CCDB_FILTER_SET_MAX_VALUES", 10000)
+)
+CCDB_FILTER_SET_TTL = int(os.environ.get("CCDB_FILTER_SET_TTL", 30 * 86400))
+CCDB_FILTER_SET_MAX_SETS = int(
+    os.environ.get("CCDB_FILTER_SET_MAX_SETS", 100000)
+)
+
+# Serve search, states and trends with async handlers that run independent
+# OpenSearch queries concurrently. Requires an ASGI server and aiohttp.
+CCDB_ASYNC_VIEWS = (
+    os.environ.get("CCDB_ASYNC_VIEWS", "false").lower() == "true"
+)
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from complaint_search.defaults import PARAMS
+from complaint_search.es_builders import is_all_field
+
+
+def canonical_hash(value):
+    """Return a stable digest for a JSON-serializable structure."""
+    encoded = json.dumps(
+        value, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def canonical_params(params, defaults=PARAMS):
+    """
+    Return a normalized copy of validated request params for use in keys.
+
+    List params are sorted, params equal to their default value are dropped
+    and the equivalent "all fields" choices are collapsed into one.
+    """
+    canonical = {}
+    for key, value in params.items():
+        if key == "field" and is_all_field(value):
+            value = "all"
+        if isinstance(value, (list, tuple)):
+            value = sorted(value)
+        if key in defaults and defaults[key] == value:
+            continue
+        canonical[key] = value
+    return canonical
+
+
+class IndexGeneration(object):
+    """
+    Track a process-wide counter that increases when the index is reloaded.
+
+    Callers report cheap signals, such as the alias target or the latest
+    `date_indexed` value, through `observe()`. A change in any signal that
+    has been seen before bumps the counter, which invalidates every
+    GenerationCache entry tagged with an older value.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signals = {}
+        self._checked = {}
+        self.value = 0
+
+    def is_due(self, signal, interval):
+        checked = self._checked.get(signal)
+        return checked is None or time.monotonic() - checked >= interval
+
+    def observe(self, signal, current):
+        with self._lock:
+            self._checked[signal] = time.monotonic()
+            if signal in self._signals and self._signals[signal] != current:
+                self.value += 1
+            self._signals[signal] = current
+            return self.value
+
+    def reset(self):
+        with self._lock:
+            self._signals.clear()
+            self._checked.clear()
+            self.value = 0
+
+
+class GenerationCache(object):
+    """
+    A thread-safe LRU cache for results computed from the complaint index.
+
+    Entries are tagged with the index generation they were computed
+    against. They are dropped when read with a different generation or
+    once they are older than `ttl` seconds.
+    """
+
+    def __init__(self, max_entries=128, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _is_fresh(self, entry, generation):
+        stored_generation, stored_at, _ = entry
+        if stored_generation != generation:
+            return False
+        if self.ttl and time.monotonic() - stored_at >= self.ttl:
+            return False
+        return True
+
+    def get(self, key, generation=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not self._is_fresh(entry, generation):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,94 @@
+import zlib
+
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+def available_encodings():
+    """Return the supported content codings, in order of preference."""
+    if zstandard is None:
+        return ("gzip",)
+    return ("zstd", "gzip")
+
+
+def negotiate_encoding(accept_encoding, encodings=None):
+    """
+    Return the preferred coding in `encodings` that an Accept-Encoding
+    header allows, or None to send the content uncompressed.
+    """
+    if encodings is None:
+        encodings = available_encodings()
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+
+    best = None
+    best_quality = 0.0
+    for coding in encodings:
+        quality = accepted.get(coding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def _gzip_compressor(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush,
+    )
+
+
+def _zstd_compressor(level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+        compressor.flush,
+    )
+
+
+_COMPRESSORS = {
+    "gzip": _gzip_compressor,
+    "zstd": _zstd_compressor,
+}
+
+
+def compress_stream(chunks, encoding, level=6):
+    """
+    Compress an iterable of str or bytes chunks with `encoding`.
+
+    The compressor is flushed after every chunk, so each chunk the
+    exporters produce is sent as soon as it is ready and can be decoded
+    by the client without waiting for the rest of the stream. Closing the
+    generator closes `chunks`.
+    """
+    compress, flush, finish = _COMPRESSORS[encoding](level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
@@ -0,0 +1,261 @@
+import asyncio
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+
+
+# Each component's cost, in units roughly worth one returned hit
+WEIGHTS = {
+    "clauses": 0.1,
+    "wildcards": 5000,
+    "term_buckets": 0.1,
+    "histogram_buckets": 0.1,
+    "hits": 1,
+    "highlights": 1,
+}
+
+# The date of the earliest complaint, which bounds date histograms whose
+# aggregation is not filtered by date
+EARLIEST_DATE = date(2011, 12, 1)
+
+# Days per date histogram bucket. Fixed intervals count as a day.
+_INTERVAL_DAYS = {"year": 365, "quarter": 91, "month": 30, "week": 7}
+
+# A wildcard at the start of a query_string term scans the whole term index
+_LEADING_WILDCARD = re.compile(r'(?:^|[\s(:"])[*?]')
+
+# The occurrences of a bool query that hold clauses
+_BOOL_OCCURRENCES = ("must", "should", "must_not", "filter")
+
+# Keys of a term-level query that are options, not the queried field
+_QUERY_OPTIONS = ("boost", "_name")
+
+ADMIT = "admit"
+DOWNGRADE = "downgrade"
+QUEUE = "queue"
+REJECT = "reject"
+
+
+class QueryTooExpensive(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = (
+        "This request is too expensive to run. Narrow the search, filters "
+        "or date range, or request fewer results."
+    )
+    default_code = "query_too_expensive"
+
+
+class QueryQueueFull(Throttled):
+    default_detail = "Too many expensive requests are running."
+    default_code = "query_queue_full"
+
+
+class QueryCost(object):
+    """
+    The estimated cost of an OpenSearch search body.
+
+    The components count the leaf clauses of the query and filters (each
+    value of a terms clause counts), leading wildcards, the aggregation
+    buckets that terms and date histogram aggregations may return, and the
+    hits returned and highlighted. `total` weighs them with WEIGHTS.
+    """
+
+    def __init__(self, **components):
+        for name in WEIGHTS:
+            setattr(self, name, components.get(name, 0))
+
+    @property
+    def total(self):
+        return sum(getattr(self, name) * WEIGHTS[name] for name in WEIGHTS)
+
+    def as_dict(self):
+        return dict(
+            {name: getattr(self, name) for name in WEIGHTS},
+            total=self.total,
+        )
+
+    def __repr__(self):
+        return "QueryCost({})".format(
+            ", ".join(
+                "{}={:g}".format(name, value)
+                for name, value in self.as_dict().items()
+            )
+        )
+
+
+def _parse_date(value, default):
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return default
+
+
+def _date_span(clause, span):
+    """Narrow a (start, end) span by a clause's date_received range."""
+    if "bool" in clause:
+        musts = clause["bool"].get("must", [])
+        if isinstance(musts, dict):
+            musts = [musts]
+        for must in musts:
+            span = _date_span(must, span)
+    elif "range" in clause and "date_received" in clause["range"]:
+        bounds = clause["range"]["date_received"]
+        span = (
+            max(span[0], _parse_date(bounds.get("from"), span[0])),
+            min(span[1], _parse_date(bounds.get("to"), span[1])),
+        )
+    return span
+
+
+def _histogram_buckets(histogram, span):
+    interval = histogram.get("calendar_interval") or histogram.get("interval")
+    days = max((span[1] - span[0]).days, 0) + 1
+    return -(-days // _INTERVAL_DAYS.get(interval, 1))
+
+
+def _field_value(query):
+    """Return the value a term-level query gives its field."""
+    for key, value in query.items():
+        if key not in _QUERY_OPTIONS:
+            return value
+    return None
+
+
+def _clauses(clause, cost):
+    for key, value in clause.items():
+        if key == "bool":
+            for occurrence in _BOOL_OCCURRENCES:
+                sub_clauses = value.get(occurrence, [])
+                if isinstance(sub_clauses, dict):
+                    sub_clauses = [sub_clauses]
+                for sub_clause in sub_clauses:
+                    _clauses(sub_clause, cost)
+        elif key == "match_all":
+            continue
+        elif key == "terms":
+            # A terms lookup is a single clause
+            values = _field_value(value)
+            cost.clauses += len(values) if isinstance(values, list) else 1
+        else:
+            cost.clauses += 1
+            if key == "query_string":
+                cost.wildcards += len(
+                    _LEADING_WILDCARD.findall(value.get("query", ""))
+                )
+            elif key == "wildcard":
+                pattern = _field_value(value)
+                if isinstance(pattern, dict):
+                    pattern = pattern.get("value", "")
+                if str(pattern)[:1] in ("*", "?"):
+                    cost.wildcards += 1
+
+
+def _buckets(aggs, cost, span, parents=1, in_terms=False):
+    for agg in aggs.values():
+        agg_span = span
+        buckets = 1
+        if "filter" in agg:
+            _clauses(agg["filter"], cost)
+            agg_span = _date_span(agg["filter"], span)
+        if "terms" in agg:
+            buckets = agg["terms"].get("size", 10)
+            # The sizes of nested facets, like sub-products, already cover
+            # every parent bucket
+            if not in_terms:
+                buckets *= parents
+            cost.term_buckets += buckets
+        elif "date_histogram" in agg:
+            buckets = parents * _histogram_buckets(
+                agg["date_histogram"], agg_span
+            )
+            cost.histogram_buckets += buckets
+        else:
+            buckets = parents
+        _buckets(
+            agg.get("aggs", {}),
+            cost,
+            agg_span,
+            buckets,
+            "terms" in agg,
+        )
+
+
+def estimate(body, today=None):
+    """Estimate the cost of running a search body."""
+    cost = QueryCost()
+    for key in ("query", "post_filter"):
+        if key in body:
+            _clauses(body[key], cost)
+    span = (EARLIEST_DATE, today or date.today())
+    _buckets(body.get("aggs", {}), cost, span)
+    cost.hits = body.get("size", 10)
+    if "highlight" in body:
+        cost.highlights = cost.hits
+    return cost
+
+
+def decide(cost, downgrade=None, queue=None, reject=None):
+    """
+    Return how to admit a request from its cost and the cost limits.
+
+    A request costing `downgrade` or more drops its optional parts first,
+    however expensive it is, and is then decided again without `downgrade`
+    from its new cost. Otherwise a request costing `reject` or more is
+    rejected, and one costing `queue` or more waits for a QueryQueue slot.
+    Pass no `downgrade` for a request that cannot be downgraded. A limit
+    that is not set is not applied.
+    """
+    total = cost.total
+    if downgrade and total >= downgrade:
+        return DOWNGRADE
+    if reject and total >= reject:
+        return REJECT
+    if queue and total >= queue:
+        return QUEUE
+    return ADMIT
+
+
+class QueryQueue(object):
+    """
+    Limit how many queued requests run at once in this process.
+
+    A request waits up to `timeout` seconds for one of the `slots`, and is
+    throttled with QueryQueueFull if none frees up.
+    """
+
+    def __init__(self, slots, timeout):
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(slots)
+
+    def acquire(self):
+        if not self._semaphore.acquire(timeout=self.timeout):
+            raise QueryQueueFull(wait=self.timeout)
+
+    async def acquire_async(self, poll_interval=0.05):
+        """
+        Like acquire, without blocking the event loop. The semaphore is
+        polled rather than waited on in a worker thread, so a request
+        cancelled while waiting cannot leave behind a thread that later
+        takes a slot nobody releases.
+        """
+        deadline = time.monotonic() + self.timeout
+        while not self._semaphore.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise QueryQueueFull(wait=self.timeout)
+            await asyncio.sleep(poll_interval)
+
+    def release(self):
+        self._semaphore.release()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
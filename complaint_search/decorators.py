@@ -1,5 +1,7 @@
 import logging
 
+from django.http import JsonResponse
+
 from opensearchpy import TransportError
 from rest_framework import status
 from rest_framework.exceptions import APIException
@@ -9,24 +11,57 @@ from rest_framework.response import Response
 log = logging.getLogger(__name__)
 
 
+def _error_response(request, error):
+    if isinstance(error, TransportError):
+        log.error(
+            "OpenSearch %s on %s: %s",
+            type(error).__name__,
+            request.path,
+            error,
+        )
+
+        status_code = 424  # HTTP_424_FAILED_DEPENDENCY
+        res = {"error": "There was an error calling OpenSearch"}
+    else:
+        log.exception("Unhandled error on %s", request.path)
+
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        res = {"error": "There was a problem retrieving your request"}
+    return res, status_code
+
+
 def catch_es_error(function):
     def wrap(request, *args, **kwargs):
         try:
             return function(request, *args, **kwargs)
         except APIException:
             raise
-        except TransportError as te:
-            log.error("OpenSearch %s on %s: %s", type(te).__name__, request.path, te)
-
-            status_code = 424  # HTTP_424_FAILED_DEPENDENCY
-            res = {"error": "There was an error calling OpenSearch"}
+        except Exception as error:
+            res, status_code = _error_response(request, error)
             return Response(res, status=status_code)
-        except Exception:
-            log.exception("Unhandled error on %s", request.path)
 
-            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            res = {"error": "There was a problem retrieving your request"}
-            return Response(res, status=status_code)
+    wrap.__doc__ = function.__doc__
+    wrap.__name__ = function.__name__
+    return wrap
+
+
+def catch_es_error_async(function):
+    """Like catch_es_error, for async views that render their own JSON."""
+
+    async def wrap(request, *args, **kwargs):
+        try:
+            return await function(request, *args, **kwargs)
+        except APIException as error:
+            response = JsonResponse(
+                {"detail": error.detail}, status=error.status_code
+            )
+            # As DRF's exception handler does for throttled requests
+            if getattr(error, "wait", None):
+                response["Retry-After"] = "%d" % error.wait
+            return response
+        except Exception as error:
+            res, status_code = _error_response(request, error)
+            return JsonResponse(res, status=status_code)
 
     wrap.__doc__ = function.__doc__
     wrap.__name__ = function.__name__
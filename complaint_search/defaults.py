@@ -62,11 +62,26 @@ SOURCE_FIELDS = (
     "zip_code",
 )
 
+# The text fields a "multi_match" or "copy_to" search of all fields covers.
+# Only the ALL_FIELDS environment variable overrides this list; the index's
+# mapping is not read. Each may be boosted, e.g. "company^2".
+ALL_FIELDS_DEFAULT = (
+    "complaint_what_happened",
+    "company_public_response",
+    "company",
+    "issue",
+    "product",
+    "sub_issue",
+    "sub_product",
+)
+
 EXCLUDE_PREFIX = "not_"
 
 EXPORT_FORMATS = (
     "csv",
     "json",
+    "ndjson",
+    "parquet",
 )
 
 CSV_ORDERED_HEADERS = OrderedDict(
@@ -94,9 +109,48 @@ AGG_EXCLUDE_FIELDS = ["zip_code"]
 
 CHUNK_SIZE = 512
 
+# Characters of CSV or JSON buffered before each chunk of an export is sent
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Whether a JSON export writes whole scan hits or only their _source
+JSON_EXPORT_PROJECTIONS = ("hit", "source")
+
+# Parquet exports write a row group for every batch of this many rows
+PARQUET_BATCH_SIZE = 10000
+
+# Typed and dictionary-encoded Parquet export columns. Other columns are
+# written as strings.
+PARQUET_DATE_FIELDS = ("date_received", "date_sent_to_company")
+PARQUET_BOOLEAN_FIELDS = ("timely",)
+PARQUET_DICTIONARY_FIELDS = (
+    "company",
+    "company_public_response",
+    "company_response",
+    "issue",
+    "product",
+    "state",
+    "sub_issue",
+    "sub_product",
+    "submitted_via",
+    "tags",
+)
+
+# Export formats that are compressed for clients that accept it. Parquet
+# files are already compressed.
+COMPRESSIBLE_EXPORT_FORMATS = ("csv", "json", "ndjson")
+
+# Export formats that can be resumed with a Range request. A Parquet file's
+# bytes depend on every row group before them.
+RESUMABLE_EXPORT_FORMATS = ("csv", "json", "ndjson")
+
+# Formats written as full-dataset snapshots by build_export_snapshots
+SNAPSHOT_FORMATS = ("csv", "json")
+
 FORMAT_CONTENT_TYPE_MAP = {
     "json": "application/json",
     "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
 }
 
 DATA_SUB_LENS_MAP = {
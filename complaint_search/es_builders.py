@@ -1,5 +1,4 @@
 import abc
-import copy
 import re
 from collections import OrderedDict, defaultdict
 
@@ -13,41 +12,108 @@ from complaint_search.defaults import (
     AGG_SUBISSUE_DEFAULT,
     AGG_SUBPRODUCT_DEFAULT,
     AGG_ZIPCODE_DEFAULT,
+    ALL_FIELDS_DEFAULT,
     DATA_SUB_LENS_MAP,
     DELIMITER,
     EXCLUDE_PREFIX,
     EXPORT_FORMATS,
-    PARAMS,
     SOURCE_FIELDS,
     TREND_DEPTH_DEFAULT,
 )
+from complaint_search.params import SearchParams
 
 
 def is_all_field(field):
     return field in ["all", "_all"]
 
 
-def build_search_terms(search_term, field):
-    has_symbols = re.match(r"^[A-Za-z\d\s]+$", search_term) is None
-    has_keywords = any(
-        keyword in search_term for keyword in ("AND", "OR", "NOT", "TO")
-    )
-    all_fields = is_all_field(field)
+class AllFieldsQuery(object):
+    """
+    Build the query and highlighting of a search of all fields.
+
+    The "query_string" strategy expands to every mapped field, including
+    keyword and date fields, and highlights them all. "multi_match" only
+    searches a curated list of text fields, optionally boosted, as if they
+    were one field (a cross_fields query), and "copy_to" searches a single
+    catch-all field the index copies those fields into. Both highlight only
+    the curated fields. A search term using query_string syntax stays a
+    query_string, limited to the same fields.
+    """
 
-    if has_symbols or has_keywords:
+    STRATEGIES = ("query_string", "multi_match", "copy_to")
+
+    def __init__(
+        self,
+        strategy="query_string",
+        fields=ALL_FIELDS_DEFAULT,
+        copy_to_field=None,
+    ):
+        if strategy not in self.STRATEGIES or (
+            strategy == "copy_to" and not copy_to_field
+        ):
+            strategy = "query_string"
+        self.strategy = strategy
+        self.fields = list(fields)
+        self.copy_to_field = copy_to_field
+
+    def query(self, search_term, has_syntax):
+        if self.strategy == "multi_match":
+            if has_syntax:
+                return {
+                    "query_string": {
+                        "query": search_term,
+                        "fields": self.fields,
+                    }
+                }
+            return {
+                "multi_match": {
+                    "query": search_term,
+                    "fields": self.fields,
+                    "type": "cross_fields",
+                    "operator": "and",
+                }
+            }
+
+        field = self.copy_to_field if self.strategy == "copy_to" else "*"
+        if has_syntax:
+            return {
+                "query_string": {"query": search_term, "default_field": field}
+            }
+        if self.strategy == "copy_to":
+            return {
+                "match": {field: {"query": search_term, "operator": "and"}}
+            }
         return {
             "query_string": {
                 "query": search_term,
-                "default_field": "*" if all_fields else field,
+                "default_field": field,
+                "default_operator": "AND",
             }
         }
 
-    elif all_fields:
+    def highlight_fields(self):
+        if self.strategy == "query_string":
+            return {"*": {}}
+        # Highlight the source fields, without their boosts
+        return {field.split("^")[0]: {} for field in self.fields}
+
+
+def build_search_terms(search_term, field, all_fields=None):
+    has_symbols = re.match(r"^[A-Za-z\d\s]+$", search_term) is None
+    has_keywords = any(
+        keyword in search_term for keyword in ("AND", "OR", "NOT", "TO")
+    )
+
+    if is_all_field(field):
+        return (all_fields or AllFieldsQuery()).query(
+            search_term, has_symbols or has_keywords
+        )
+
+    if has_symbols or has_keywords:
         return {
             "query_string": {
                 "query": search_term,
-                "default_field": "*",
-                "default_operator": "AND",
+                "default_field": field,
             }
         }
 
@@ -55,8 +121,8 @@ def build_search_terms(search_term, field):
     return {"match": {field: {"query": search_term, "operator": "and"}}}
 
 
-class BaseBuilder(object):
-    __metaclass__ = abc.ABCMeta
+class FilterFieldsMixin(object):
+    """The filter fields of the API and their names in OpenSearch."""
 
     # Filters for those with string type
     _OPTIONAL_FILTERS = (
@@ -98,22 +164,82 @@ class BaseBuilder(object):
     def _get_child(self, field):
         return self._OPTIONAL_FILTERS_CHILD_MAP.get(field)
 
-    def __init__(self):
-        self.params = {}
+
+class BaseBuilder(FilterFieldsMixin):
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, params=None):
+        if not isinstance(params, SearchParams):
+            params = SearchParams(params or {})
+        self.params = params
 
     def add(self, **kwargs):
-        self.params.update(**kwargs)
+        self.params = self.params.replace(**kwargs)
+
+    def use_filters(self, filters):
+        """Build filters from a FilterCompiler shared with other builders."""
+        self._filters = filters
+
+    @property
+    def filters(self):
+        # Compiled from the params on first use, like the builders' other
+        # lazily built clauses
+        if getattr(self, "_filters", None) is None:
+            self._filters = FilterCompiler(self.params)
+        return self._filters
 
     @abc.abstractmethod
     def build(self):
         """Method that will build the body dictionary."""
 
+
+class FilterCompiler(FilterFieldsMixin):
+    """
+    Compile the filter params of a request into OpenSearch clauses once.
+
+    The date range clauses and each field's include and exclude clauses are
+    built when the compiler is created. Every filter returned by `build()`
+    gets new `must` and `must_not` lists that reference those prebuilt
+    clauses, so the post filter and each facet of the aggregations share
+    one set of structures. Callers may append to the lists, but must not
+    modify the clauses in them.
+    """
+
+    def __init__(self, params):
+        if not isinstance(params, SearchParams):
+            params = SearchParams(params)
+        self.params = params
+        self.include_clauses, self.exclude_clauses = (
+            self._build_clauses_dictionary()
+        )
+        self.date_received = self._build_date_range_filter(
+            self.params.get("date_received_min"),
+            self.params.get("date_received_max"),
+            "date_received",
+        )
+        self.company_received = self._build_date_range_filter(
+            self.params.get("company_received_min"),
+            self.params.get("company_received_max"),
+            "date_sent_to_company",
+        )
+        self._includes = self._compile(self.include_clauses)
+        self._excludes = list(self._compile(self.exclude_clauses).values())
+        # if there are multiple not clauses, they need to be grouped
+        # ~A AND ~B AND ~C is not the same as ~(A AND B AND C)
+        self._grouped_excludes = self._excludes
+        if len(self._excludes) > 1:
+            self._grouped_excludes = [{"bool": {"must": self._excludes}}]
+
     # This creates all the bool should filter clauses for a field
     def _build_bool_clauses(self, field, value_list):
         assert value_list
 
         es_field_name = self._get_es_name(field)
 
+        # The values of a registered filter set, looked up by OpenSearch
+        if isinstance(value_list, dict):
+            return {"terms": {es_field_name: value_list}}
+
         # The most common property for data is to not have a child element
         if not self._has_child(field):
             return {"terms": {es_field_name: value_list}}
@@ -177,61 +303,79 @@ class BaseBuilder(object):
 
         return date_clause
 
-    def _build_dsl_filter(
-        self,
-        include_clauses,
-        exclude_clauses,
-        include_dates=True,
-        single_not_clause=True,
-    ):
-        and_clauses = []
-
-        # date_received
-        date_received = self._build_date_range_filter(
-            self.params.get("date_received_min"),
-            self.params.get("date_received_max"),
-            "date_received",
-        )
-
-        if date_received and include_dates:
-            and_clauses.append(date_received)
-
-        company_filter = self._build_date_range_filter(
-            self.params.get("company_received_min"),
-            self.params.get("company_received_max"),
-            "date_sent_to_company",
-        )
-
-        if company_filter:
-            and_clauses.append(company_filter)
-
-        # Create filter clauses for all other filters
-        for item, clauses in include_clauses.items():
+    def _compile(self, clauses_dictionary):
+        compiled = OrderedDict()
+        for item, clauses in clauses_dictionary.items():
             if not self._has_child(item):
                 # Create the field level AND query that must match
-                and_clauses.append(clauses)
+                compiled[item] = clauses
             else:
                 # These get added as compound OR clauses
-                or_clause = {"bool": {"should": clauses}}
-                and_clauses.append(or_clause)
+                compiled[item] = {"bool": {"should": clauses}}
+        return compiled
 
-        not_clauses = []
-        for item, clauses in exclude_clauses.items():
-            if not self._has_child(item):
-                # Create the field level AND query that must match
-                not_clauses.append(clauses)
-            else:
-                # These get added as compound OR clauses
-                or_clause = {"bool": {"should": clauses}}
-                not_clauses.append(or_clause)
+    def _dates(self, include_dates=True):
+        and_clauses = []
+        if self.date_received and include_dates:
+            and_clauses.append(self.date_received)
+        if self.company_received:
+            and_clauses.append(self.company_received)
+        return and_clauses
+
+    def build(self, without=None, include_dates=True, single_not_clause=True):
+        """
+        Return the bool filter for the request, leaving out the include
+        clause of the field named by `without`.
+        """
+        and_clauses = self._dates(include_dates)
+        and_clauses.extend(
+            clause
+            for item, clause in self._includes.items()
+            if item != without
+        )
+        if single_not_clause:
+            not_clauses = list(self._grouped_excludes)
+        else:
+            not_clauses = list(self._excludes)
+        return {"bool": {"must": and_clauses, "must_not": not_clauses}}
 
-        # if there are multiple not clauses, they need to be grouped
-        # ~A AND ~B AND ~C is not the same as ~(A AND B AND C)
-        if len(not_clauses) > 1 and single_not_clause:
-            grouping = {"bool": {"must": not_clauses}}
-            not_clauses = [grouping]
+    def build_dates(self):
+        """Return a bool filter with only the date range clauses."""
+        return {"bool": {"must": self._dates(), "must_not": []}}
+
+    def build_common(self, fields):
+        """
+        Return the bool filter that the filters leaving out any one of
+        `fields` have in common: the dates, the excludes and the include
+        clauses of every other field.
+        """
+        and_clauses = self._dates()
+        and_clauses.extend(
+            clause
+            for item, clause in self._includes.items()
+            if item not in fields
+        )
+        return {
+            "bool": {
+                "must": and_clauses,
+                "must_not": list(self._grouped_excludes),
+            }
+        }
 
-        return {"bool": {"must": and_clauses, "must_not": not_clauses}}
+    def build_includes(self, fields, without=None):
+        """
+        Return a bool filter of the include clauses of `fields`, leaving out
+        the clause of the field named by `without`.
+        """
+        return {
+            "bool": {
+                "must": [
+                    clause
+                    for item, clause in self._includes.items()
+                    if item in fields and item != without
+                ]
+            }
+        }
 
 
 class SearchBuilder(BaseBuilder):
@@ -244,8 +388,11 @@ class SearchBuilder(BaseBuilder):
     A `search_after` parameter was added in 2021 to handle deep pagination.
     """
 
-    def __init__(self):
-        self.params = copy.deepcopy(PARAMS)
+    all_fields = AllFieldsQuery()
+
+    def use_all_fields(self, all_fields):
+        """Search and highlight all fields with an AllFieldsQuery."""
+        self.all_fields = all_fields
 
     def _build_highlight(self):
         highlight = {
@@ -254,7 +401,7 @@ class SearchBuilder(BaseBuilder):
             "fragment_size": 500,
         }
         if is_all_field(self.params.get("field")):
-            highlight["fields"] = {"*": {}}
+            highlight["fields"] = self.all_fields.highlight_fields()
         else:
             highlight["fields"] = {self.params.get("field"): {}}
 
@@ -273,6 +420,9 @@ class SearchBuilder(BaseBuilder):
         source = list(SOURCE_FIELDS)
         if self.params.get("format") in EXPORT_FORMATS:
             source.remove("has_narrative")
+        fields = self.params.get("fields")
+        if fields:
+            source = [field for field in source if field in fields]
         return source
 
     def build(self):
@@ -295,7 +445,7 @@ class SearchBuilder(BaseBuilder):
         search_term = self.params.get("search_term")
         if search_term:
             search["query"] = build_search_terms(
-                search_term, self.params.get("field")
+                search_term, self.params.get("field"), self.all_fields
             )
 
         # pagination
@@ -308,8 +458,7 @@ class SearchBuilder(BaseBuilder):
 
 class PostFilterBuilder(BaseBuilder):
     def build(self):
-        include_clauses, exclude_clauses = self._build_clauses_dictionary()
-        return self._build_dsl_filter(include_clauses, exclude_clauses)
+        return self.filters.build()
 
 
 class AggregationBuilder(BaseBuilder):
@@ -337,10 +486,8 @@ class AggregationBuilder(BaseBuilder):
         "sub_product.raw": AGG_SUBPRODUCT_DEFAULT,  # 90
     }
 
-    def __init__(self):
-        BaseBuilder.__init__(self)
-        self.include_clauses = None
-        self.exclude_clauses = None
+    def __init__(self, params=None):
+        BaseBuilder.__init__(self, params)
         self.exclude = []
 
     def add_exclude(self, field_name_list):
@@ -369,13 +516,6 @@ class AggregationBuilder(BaseBuilder):
         return field_agg
 
     def build_one(self, field_name):
-        # Lazy initialization
-        if not self.include_clauses:
-            (
-                self.include_clauses,
-                self.exclude_clauses,
-            ) = self._build_clauses_dictionary()
-
         field_aggs = {}
 
         es_field_name = self._OPTIONAL_FILTERS_PARAM_TO_ES_MAP.get(
@@ -400,15 +540,8 @@ class AggregationBuilder(BaseBuilder):
                 }
             }
 
-        # Create a subset of the filters
-        incl_subset = {
-            k: v for k, v in self.include_clauses.items() if k != field_name
-        }
-
-        # Add the aggregation filters
-        field_aggs["filter"] = self._build_dsl_filter(
-            incl_subset, self.exclude_clauses
-        )
+        # Add the aggregation filters, without the field's own filter
+        field_aggs["filter"] = self.filters.build(without=field_name)
         return field_aggs
 
     def build(self):
@@ -435,6 +568,67 @@ class AggregationBuilder(BaseBuilder):
         return aggs
 
 
+class SharedFilterAggregationBuilder(AggregationBuilder):
+    """
+    Build the search aggregations with the filters they share factored out.
+
+    Each facet's filter only leaves out the facet's own include clause, so
+    the dates, the excludes and the include clauses of fields without a
+    facet are common to all of them and are applied once, by a filter
+    aggregation wrapping the facets. Inside it, a facet whose field is
+    filtered keeps the include clauses of the other filtered facets. The
+    facets of unfiltered fields would all have the same filter, so they are
+    grouped under one more filter aggregation.
+
+    `unwrap()` turns the aggregations of a response back into the shape
+    that AggregationBuilder's aggregations return.
+    """
+
+    SHARED = "_shared_filter"
+    UNFILTERED = "_unfiltered_facets"
+
+    def build(self):
+        aggs = super(SharedFilterAggregationBuilder, self).build()
+        filtered = [
+            field_name
+            for field_name in aggs
+            if field_name in self.filters.include_clauses
+        ]
+        shared = {"filter": self.filters.build_common(aggs), "aggs": {}}
+        unfiltered = {
+            "filter": self.filters.build_includes(filtered),
+            "aggs": {},
+        }
+        for field_name, field_aggs in aggs.items():
+            if field_name in filtered:
+                field_aggs["filter"] = self.filters.build_includes(
+                    filtered, without=field_name
+                )
+                shared["aggs"][field_name] = field_aggs
+            else:
+                unfiltered["aggs"].update(field_aggs["aggs"])
+        if unfiltered["aggs"]:
+            shared["aggs"][self.UNFILTERED] = unfiltered
+        return {self.SHARED: shared}
+
+    @classmethod
+    def unwrap(cls, aggregations):
+        shared = aggregations.pop(cls.SHARED, None)
+        if shared is None:
+            return aggregations
+        unfiltered = shared.pop(cls.UNFILTERED, None)
+        shared.pop("doc_count", None)
+        facets = dict(shared)
+        if unfiltered:
+            doc_count = unfiltered.pop("doc_count", None)
+            for field_name, agg in unfiltered.items():
+                facets[field_name] = {"doc_count": doc_count, field_name: agg}
+        for field_name in cls._AGG_FIELDS:
+            if field_name in facets:
+                aggregations[field_name] = facets[field_name]
+        return aggregations
+
+
 class StateAggregationBuilder(BaseBuilder):
     _AGG_FIELDS = (
         "issue",
@@ -456,23 +650,14 @@ class StateAggregationBuilder(BaseBuilder):
         "tags": "tags",
     }
 
-    def __init__(self):
-        BaseBuilder.__init__(self)
-        self.include_clauses = None
-        self.exclude_clauses = None
+    def __init__(self, params=None):
+        BaseBuilder.__init__(self, params)
         self.exclude = []
 
     def add_exclude(self, field_name_list):
         self.exclude += field_name_list
 
     def build_one(self, field_name):
-        # Lazy initialization
-        if not self.include_clauses:
-            (
-                self.include_clauses,
-                self.exclude_clauses,
-            ) = self._build_clauses_dictionary()
-
         field_aggs = {"filter": {}}
 
         es_field_name = self._OPTIONAL_FILTERS_PARAM_TO_ES_MAP.get(
@@ -504,17 +689,9 @@ class StateAggregationBuilder(BaseBuilder):
                 "issue": {"terms": {"field": "issue.raw"}},
             }
 
-            filtered_includes = copy.deepcopy(self.include_clauses)
-            if "state" in filtered_includes:
-                del filtered_includes["state"]
-
-            field_aggs["filter"] = self._build_dsl_filter(
-                filtered_includes, self.exclude_clauses
-            )
+            field_aggs["filter"] = self.filters.build(without="state")
         else:
-            field_aggs["filter"] = self._build_dsl_filter(
-                self.include_clauses, self.exclude_clauses
-            )
+            field_aggs["filter"] = self.filters.build()
 
         return field_aggs
 
@@ -543,21 +720,10 @@ class LensAggregationBuilder(BaseBuilder):
         "tags": "tags",
     }
 
-    def __init__(self):
-        super(LensAggregationBuilder, self).__init__()
-        self._include_clauses = None
-        self.exclude_clauses = None
+    def __init__(self, params=None):
+        super(LensAggregationBuilder, self).__init__(params)
         self.exclude = []
 
-    @property
-    def include_clauses(self):
-        if not self._include_clauses:
-            (
-                self._include_clauses,
-                self.exclude_clauses,
-            ) = self._build_clauses_dictionary()
-        return self._include_clauses
-
     def add_exclude(self, field_name_list):
         self.exclude += field_name_list
 
@@ -574,11 +740,8 @@ class LensAggregationBuilder(BaseBuilder):
         }
 
         # Add filter clauses
-        agg["filter"] = self._build_dsl_filter(
-            self.include_clauses,
-            self.exclude_clauses,
-            include_dates=include_date_filter,
-            single_not_clause=False,
+        agg["filter"] = self.filters.build(
+            include_dates=include_date_filter, single_not_clause=False
         )
 
         return agg
@@ -636,9 +799,7 @@ class TrendsAggregationBuilder(LensAggregationBuilder):
         )
 
         # Add the filters
-        field_aggs["filter"] = self._build_dsl_filter(
-            self.include_clauses, self.exclude_clauses, single_not_clause=False
-        )
+        field_aggs["filter"] = self.filters.build(single_not_clause=False)
 
         return field_aggs
 
@@ -690,7 +851,7 @@ class TrendsAggregationBuilder(LensAggregationBuilder):
 
     def build(self):
         if not self.params.get("trend_depth"):
-            self.params["trend_depth"] = TREND_DEPTH_DEFAULT
+            self.params = self.params.replace(trend_depth=TREND_DEPTH_DEFAULT)
 
         aggs = {}
 
@@ -714,7 +875,7 @@ class TrendsAggregationBuilder(LensAggregationBuilder):
                         self.params["trend_interval"],
                     )
         elif "focus" in self.params:
-            self.params["trend_depth"] = 10
+            self.params = self.params.replace(trend_depth=10)
             for field_name in DATA_SUB_LENS_MAP.get(self.params["lens"]) + (
                 self.params["lens"],
             ):
@@ -764,8 +925,6 @@ class DateRangeBucketsBuilder(BaseBuilder):
         }
 
         # Add date filter clause
-        agg["dateRangeBuckets"]["filter"] = self._build_dsl_filter(
-            {}, {}, include_dates=True, single_not_clause=False
-        )
+        agg["dateRangeBuckets"]["filter"] = self.filters.build_dates()
 
         return agg
@@ -1,29 +1,67 @@
-import copy
 import logging
 import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from math import ceil
 from urllib.parse import quote
 
+from django.dispatch import Signal
+
 from flags.state import flag_enabled
-from opensearchpy import OpenSearch, helpers
+from opensearchpy import OpenSearch, TransportError, helpers
+from rest_framework.exceptions import ValidationError
 
+from complaint_search.cache import (
+    GenerationCache,
+    IndexGeneration,
+    canonical_hash,
+)
+from complaint_search.cost import (
+    DOWNGRADE,
+    QUEUE,
+    REJECT,
+    QueryQueue,
+    QueryTooExpensive,
+    decide,
+)
+from complaint_search.cost import estimate as estimate_cost
 from complaint_search.defaults import (
+    ALL_FIELDS_DEFAULT,
     CSV_ORDERED_HEADERS,
+    EXPORT_CHUNK_SIZE,
     EXPORT_FORMATS,
     MAX_PAGINATION_DEPTH,
     PAGINATION_BATCH,
-    PARAMS,
 )
 from complaint_search.es_builders import (
     AggregationBuilder,
+    AllFieldsQuery,
     DateRangeBucketsBuilder,
+    FilterCompiler,
     PostFilterBuilder,
     SearchBuilder,
+    SharedFilterAggregationBuilder,
     StateAggregationBuilder,
     TrendsAggregationBuilder,
 )
-from complaint_search.export import OpenSearchExporter
+from complaint_search.export import OpenSearchExporter, closing_scan
+from complaint_search.filter_sets import (
+    filter_set_id,
+    get_filter_set,
+    get_filter_sets,
+    merge_filters,
+    normalize,
+)
+from complaint_search.parallel import prefetch, sliced_scan
+from complaint_search.params import SearchParams
+from complaint_search.pit import close_pit, open_pit, pit_scan
+from complaint_search.transport import (
+    POOL_STATS,
+    InstrumentedConnection,
+    JitteredTransport,
+)
 
 
 log = logging.getLogger(__name__)
@@ -33,11 +71,163 @@ _ES_PORT = os.environ.get("ES_PORT", "9200")
 _ES_URL = f"http://{_ES_HOST}:{_ES_PORT}"
 _ES_USER = os.environ.get("ES_USER", "")
 _ES_PASSWORD = os.environ.get("ES_PASSWORD", "")
-_ES_POOL = int(os.getenv("ES_POOL_MAXSIZE", 1))
 _ES_INSTANCE = None
 
+# Transport settings. ES_HOSTS is a comma-separated list of host[:port]
+# nodes that takes precedence over ES_HOST/ES_PORT. Connections are kept
+# alive in a pool of ES_POOL_MAXSIZE per node, shared by the threads of a
+# worker process; with ES_POOL_BLOCK, threads wait up to ES_POOL_TIMEOUT
+# seconds for a free connection rather than opening a throwaway one.
+_ES_HOSTS = [
+    host.strip()
+    for host in os.environ.get("ES_HOSTS", "").split(",")
+    if host.strip()
+]
+_ES_POOL = int(os.getenv("ES_POOL_MAXSIZE", 10))
+_ES_POOL_BLOCK = os.environ.get("ES_POOL_BLOCK", "false").lower() == "true"
+_ES_POOL_TIMEOUT = float(os.environ.get("ES_POOL_TIMEOUT", 10))
+_ES_HTTP_COMPRESS = (
+    os.environ.get("ES_HTTP_COMPRESS", "false").lower() == "true"
+)
+_ES_MAX_RETRIES = int(os.environ.get("ES_MAX_RETRIES", 3))
+_ES_RETRY_ON_TIMEOUT = (
+    os.environ.get("ES_RETRY_ON_TIMEOUT", "false").lower() == "true"
+)
+_ES_RETRY_BACKOFF = float(os.environ.get("ES_RETRY_BACKOFF", 0.1))
+_ES_RETRY_BACKOFF_MAX = float(os.environ.get("ES_RETRY_BACKOFF_MAX", 2))
+_ES_SNIFF_ON_START = (
+    os.environ.get("ES_SNIFF_ON_START", "false").lower() == "true"
+)
+_ES_SNIFF_ON_CONNECTION_FAIL = (
+    os.environ.get("ES_SNIFF_ON_CONNECTION_FAIL", "false").lower() == "true"
+)
+_ES_SNIFFER_TIMEOUT = os.environ.get("ES_SNIFFER_TIMEOUT")
+# Seconds between log lines with the transport counters; 0 turns them off
+_ES_STATS_LOG_INTERVAL = float(os.environ.get("ES_STATS_LOG_INTERVAL", 300))
+_STATS_LOGGED_AT = None
+
+# Request timeouts in seconds. ES_TIMEOUT applies to any endpoint without
+# its own ES_<ENDPOINT>_TIMEOUT setting.
+_ES_TIMEOUT = float(os.environ.get("ES_TIMEOUT", 100))
+_ES_TIMEOUTS = {
+    endpoint: float(os.environ[f"ES_{endpoint.upper()}_TIMEOUT"])
+    for endpoint in ("search", "suggest", "document", "states", "trends")
+    if os.environ.get(f"ES_{endpoint.upper()}_TIMEOUT")
+}
+_ES_EXPORT_TIMEOUT = float(os.environ.get("ES_EXPORT_TIMEOUT", 3000))
+
+# Exports are buffered and streamed in chunks of this many characters.
+_EXPORT_CHUNK_SIZE = int(
+    os.environ.get("EXPORT_CHUNK_SIZE", EXPORT_CHUNK_SIZE)
+)
+
+# JSON exports write whole scan hits unless EXPORT_JSON_PROJECTION is
+# "source". Disabling EXPORT_ENFORCE_LIMIT skips the count search that checks
+# a JSON export against MAX_DOWNLOAD_SIZE.
+_EXPORT_JSON_PROJECTION = os.environ.get("EXPORT_JSON_PROJECTION", "hit")
+_EXPORT_ENFORCE_LIMIT = (
+    os.environ.get("EXPORT_ENFORCE_LIMIT", "true").lower() == "true"
+)
+
+# Exports page through a 10 minute scroll by default. EXPORT_ENGINE=pit
+# pages through a point in time with search_after instead, which only has to
+# stay alive between pages and is released when the download ends.
+_EXPORT_ENGINE = os.environ.get("EXPORT_ENGINE", "scroll")
+_EXPORT_PIT_PAGE_SIZE = int(os.environ.get("EXPORT_PIT_PAGE_SIZE", 1000))
+_EXPORT_PIT_KEEP_ALIVE = os.environ.get("EXPORT_PIT_KEEP_ALIVE", "1m")
+_EXPORT_PIT_PAGE_TIMEOUT = float(
+    os.environ.get("EXPORT_PIT_PAGE_TIMEOUT", 60)
+)
+
+# Set EXPORT_SLICES above 1 to fetch exports as parallel slices, each read
+# by a worker thread into a queue of up to EXPORT_QUEUE_DEPTH batches.
+# Slices are merged in arrival order ("unordered") or in the search's sort
+# order ("ordered"). ES_POOL_MAXSIZE should be at least EXPORT_SLICES.
+_EXPORT_SLICES = int(os.environ.get("EXPORT_SLICES", 1))
+_EXPORT_SLICE_ORDER = os.environ.get("EXPORT_SLICE_ORDER", "unordered")
+_EXPORT_QUEUE_DEPTH = int(os.environ.get("EXPORT_QUEUE_DEPTH", 4))
+
+# Set EXPORT_PREFETCH_DEPTH to read up to that many pages of an unsliced
+# export ahead on a background thread while earlier pages are sent.
+_EXPORT_PREFETCH_DEPTH = int(os.environ.get("EXPORT_PREFETCH_DEPTH", 0))
+
+# Batch size for scroll requests
+_SCROLL_PAGE_SIZE = 7000
+
 _COMPLAINT_ES_INDEX = os.environ.get("COMPLAINT_ES_INDEX", "complaint-index")
 
+# The _meta block only changes when the index is reloaded, so it is cached
+# per process. Entries expire after ES_META_CACHE_TTL seconds, or sooner if
+# the index generation changes. Set ES_ALIAS_CHECK_INTERVAL to poll the
+# alias target every N seconds as an additional reload signal.
+_META_CACHE_TTL = int(os.environ.get("ES_META_CACHE_TTL", 300))
+_ALIAS_CHECK_INTERVAL = int(os.environ.get("ES_ALIAS_CHECK_INTERVAL", 0))
+_INDEX_GENERATION = IndexGeneration()
+_META_CACHE = GenerationCache(max_entries=1, ttl=_META_CACHE_TTL)
+
+# Sent with the new generation when a reload of the index is detected
+index_refreshed = Signal()
+
+# Sort keys harvested for search-after pagination are shared between
+# requests for the same query, so paging through results only harvests
+# once. The cache is LRU-bounded and invalidated with the index generation.
+_BREAK_POINT_CACHE = GenerationCache(
+    max_entries=int(os.environ.get("ES_BREAK_POINT_CACHE_SIZE", 256)),
+    ttl=int(os.environ.get("ES_BREAK_POINT_CACHE_TTL", 3600)),
+)
+
+# The trends dateRangeBuckets histogram ignores the user's filters, so it is
+# cached by its request body for the current index generation.
+_DATE_BUCKET_CACHE = GenerationCache(
+    max_entries=int(os.environ.get("ES_DATE_BUCKET_CACHE_SIZE", 64)),
+    ttl=int(os.environ.get("ES_DATE_BUCKET_CACHE_TTL", 3600)),
+)
+
+# When enabled, the search, break point harvest and _meta lookups for a
+# default-format search are sent together as a single _msearch request.
+_ES_MSEARCH = os.environ.get("ES_MSEARCH", "false").lower() == "true"
+
+# How the search aggregations are filtered. "facet" gives every facet a
+# copy of the request's filters; "shared" applies the clauses the facets
+# have in common once, which makes heavily filtered requests much smaller.
+_AGG_FILTER_PLAN = os.environ.get("AGG_FILTER_PLAN", "facet")
+
+# Registered filter sets are also stored in FILTER_SET_INDEX, when set, so
+# search bodies can reference their values with terms lookups.
+_FILTER_SET_INDEX = os.environ.get("FILTER_SET_INDEX")
+
+# The filter sets this process has refreshed FILTER_SET_INDEX for
+_REFRESHED_FILTER_SETS = set()
+
+# How a search of all fields is run: "query_string" over every mapped field,
+# "multi_match" over ALL_FIELDS, a comma-separated list of text fields that
+# may be boosted (e.g. "company^2"), or "copy_to", a match on the catch-all
+# ALL_FIELDS_COPY_TO field the index copies those fields into.
+_ALL_FIELDS_STRATEGY = os.environ.get("ALL_FIELDS_STRATEGY", "query_string")
+_ALL_FIELDS = [
+    field.strip()
+    for field in os.environ.get("ALL_FIELDS", ",".join(ALL_FIELDS_DEFAULT))
+    .split(",")
+    if field.strip()
+]
+_ALL_FIELDS_COPY_TO = os.environ.get("ALL_FIELDS_COPY_TO")
+
+# Admission control from the estimated cost of a request's body (see
+# complaint_search.cost). A default-format search costing QUERY_COST_DOWNGRADE
+# or more runs without aggregations or highlighting, a request costing
+# QUERY_COST_QUEUE or more waits up to QUERY_COST_QUEUE_TIMEOUT seconds for
+# one of QUERY_COST_QUEUE_SLOTS per process, and one costing
+# QUERY_COST_REJECT or more is rejected. Unset limits are not applied, and
+# every request's cost is logged.
+_QUERY_COST_DOWNGRADE = float(os.environ.get("QUERY_COST_DOWNGRADE", 0))
+_QUERY_COST_QUEUE = float(os.environ.get("QUERY_COST_QUEUE", 0))
+_QUERY_COST_REJECT = float(os.environ.get("QUERY_COST_REJECT", 0))
+_QUERY_COST_QUEUE_SLOTS = int(os.environ.get("QUERY_COST_QUEUE_SLOTS", 2))
+_QUERY_COST_QUEUE_TIMEOUT = float(
+    os.environ.get("QUERY_COST_QUEUE_TIMEOUT", 10)
+)
+_QUERY_QUEUE = None
+
 
 # -----------------------------------------------------------------------------
 # Trends Operations
@@ -136,24 +326,155 @@ def process_trends_response(response):
     return response
 
 
+def _get_es_host_url(host=None):
+    if host is None:
+        host = f"{_ES_HOST}:{_ES_PORT}"
+    if _ES_USER and _ES_PASSWORD:
+        encoded_username = quote(_ES_USER)
+        encoded_password = quote(_ES_PASSWORD)
+        host = f"{encoded_username}:{encoded_password}@{host}"
+    return f"http://{host}"
+
+
+def _get_es_hosts():
+    if _ES_HOSTS:
+        return [_get_es_host_url(host) for host in _ES_HOSTS]
+    return [_get_es_host_url()]
+
+
+def _get_es_options():
+    """Return the client options shared by the sync and async clients."""
+    options = {
+        "use_ssl": (str(_ES_PORT) == "443"),
+        "timeout": _ES_TIMEOUT,
+        "pool_maxsize": _ES_POOL,
+        "http_compress": _ES_HTTP_COMPRESS,
+        "max_retries": _ES_MAX_RETRIES,
+        "retry_on_timeout": _ES_RETRY_ON_TIMEOUT,
+        "sniff_on_start": _ES_SNIFF_ON_START,
+        "sniff_on_connection_fail": _ES_SNIFF_ON_CONNECTION_FAIL,
+    }
+    if _ES_SNIFFER_TIMEOUT:
+        options["sniffer_timeout"] = float(_ES_SNIFFER_TIMEOUT)
+    return options
+
+
 def _get_es():
     global _ES_INSTANCE
     if _ES_INSTANCE is None:
-        host = _ES_HOST
-        if _ES_USER and _ES_PASSWORD:
-            encoded_username = quote(_ES_USER)
-            encoded_password = quote(_ES_PASSWORD)
-            host = f"{encoded_username}:{encoded_password}@{host}"
-
         _ES_INSTANCE = OpenSearch(
-            f"http://{host}:{_ES_PORT}",
-            use_ssl=(str(_ES_PORT) == "443"),
-            timeout=100,
-            pool_maxsize=_ES_POOL
+            _get_es_hosts(),
+            transport_class=JitteredTransport,
+            connection_class=InstrumentedConnection,
+            pool_block=_ES_POOL_BLOCK,
+            pool_timeout=_ES_POOL_TIMEOUT,
+            retry_backoff=_ES_RETRY_BACKOFF,
+            retry_backoff_max=_ES_RETRY_BACKOFF_MAX,
+            after_request=_log_transport_stats,
+            **_get_es_options(),
         )
     return _ES_INSTANCE
 
 
+def _get_query_queue():
+    global _QUERY_QUEUE
+    if _QUERY_QUEUE is None:
+        _QUERY_QUEUE = QueryQueue(
+            _QUERY_COST_QUEUE_SLOTS, _QUERY_COST_QUEUE_TIMEOUT
+        )
+    return _QUERY_QUEUE
+
+
+def _estimate_cost(endpoint, body):
+    """Estimate the cost of a body, or log why it cannot be and return None."""
+    try:
+        return estimate_cost(body)
+    except Exception:
+        log.exception("Unable to estimate the query cost of %s", endpoint)
+        return None
+
+
+def _admit(endpoint, body, downgrade=None):
+    """
+    Decide how to run a request from the estimated cost of its body.
+
+    Return the body to send, whether it must wait for a slot of the query
+    queue, and whether it was downgraded. A request over the downgrade
+    limit is rebuilt by calling `downgrade`, when given, before it can be
+    queued or rejected; requests without one, or that `downgrade` leaves
+    unchanged, are queued or rejected at their full cost. A body whose
+    cost cannot be estimated is admitted.
+    """
+    cost = _estimate_cost(endpoint, body)
+    if cost is None:
+        return body, False, False
+    decision = decide(
+        cost,
+        _QUERY_COST_DOWNGRADE if downgrade else None,
+        _QUERY_COST_QUEUE,
+        _QUERY_COST_REJECT,
+    )
+    log.info("Query cost of %s: %r, %s", endpoint, cost, decision)
+    downgraded = False
+    if decision == DOWNGRADE:
+        downgraded_body = downgrade()
+        # A request with nothing left to drop is not reported as downgraded
+        downgraded = downgraded_body != body
+        if downgraded:
+            body = downgraded_body
+            cost = _estimate_cost(endpoint, body)
+            if cost is None:
+                return body, False, True
+            log.info("Downgraded query cost of %s: %r", endpoint, cost)
+        decision = decide(cost, None, _QUERY_COST_QUEUE, _QUERY_COST_REJECT)
+    if decision == REJECT:
+        raise QueryTooExpensive()
+    return body, decision == QUEUE, downgraded
+
+
+@contextmanager
+def _query_slot(queued):
+    if queued:
+        with _get_query_queue().slot():
+            yield
+    else:
+        yield
+
+
+def _timeout(endpoint):
+    """Return request options for an endpoint-specific timeout, if any."""
+    if endpoint in _ES_TIMEOUTS:
+        return {"request_timeout": _ES_TIMEOUTS[endpoint]}
+    return {}
+
+
+def get_transport_stats():
+    """
+    Return connection pool counters for this worker process, for monitoring.
+
+    Includes the number of pool checkouts, connections currently in use,
+    seconds spent waiting for a free connection and retried requests.
+    """
+    stats = POOL_STATS.snapshot()
+    stats["pool_maxsize"] = _ES_POOL
+    stats["hosts"] = len(_ES_HOSTS) or 1
+    return stats
+
+
+def _log_transport_stats():
+    """Log get_transport_stats() at most every ES_STATS_LOG_INTERVAL."""
+    global _STATS_LOGGED_AT
+    if not _ES_STATS_LOG_INTERVAL:
+        return
+    now = time.monotonic()
+    if _STATS_LOGGED_AT is None:
+        # Start counting the interval from the first request
+        _STATS_LOGGED_AT = now
+    elif now - _STATS_LOGGED_AT >= _ES_STATS_LOG_INTERVAL:
+        _STATS_LOGGED_AT = now
+        log.info("OpenSearch transport: %s", get_transport_stats())
+
+
 def _get_now():
     return datetime.now()
 
@@ -177,9 +498,51 @@ def _is_data_stale(last_updated_time):
     return False
 
 
-def _get_meta():
+def _get_alias_target():
+    """Return the concrete index names behind the complaint index alias."""
+    try:
+        res = _get_es().indices.get_alias(index=_COMPLAINT_ES_INDEX)
+    except TransportError as te:
+        log.warning("Unable to resolve %s: %s", _COMPLAINT_ES_INDEX, te)
+        return None
+    return ",".join(sorted(res))
+
+
+def _observe_index(signal, current):
+    previous = _INDEX_GENERATION.value
+    generation = _INDEX_GENERATION.observe(signal, current)
+    if generation != previous:
+        index_refreshed.send(sender=None, generation=generation)
+    return generation
+
+
+def get_index_generation():
+    """
+    Return a token identifying the currently loaded complaint index.
+
+    The token changes when a refreshed _meta block reports a new
+    `last_indexed` date, or, if alias checks are enabled, when the index
+    alias is pointed at a different index.
+    """
+    if _ALIAS_CHECK_INTERVAL and _INDEX_GENERATION.is_due(
+        "alias", _ALIAS_CHECK_INTERVAL
+    ):
+        target = _get_alias_target()
+        if target is not None:
+            _observe_index("alias", target)
+    return _INDEX_GENERATION.value
+
+
+def _reset_caches():
+    _INDEX_GENERATION.reset()
+    _META_CACHE.clear()
+    _BREAK_POINT_CACHE.clear()
+    _DATE_BUCKET_CACHE.clear()
+
+
+def _get_index_stats_body():
     # Hard code noon Eastern Time zone since that is where it is built
-    body = {
+    return {
         # size: 0 here to prevent taking too long since we only needed max_date
         "size": 0,
         "aggs": {
@@ -197,23 +560,82 @@ def _get_meta():
             },
         },
     }
-    max_date_res = _get_es().search(index=_COMPLAINT_ES_INDEX, body=body)
-    count_res = _get_es().count(index=_COMPLAINT_ES_INDEX)
 
-    result = {
-        "license": "CC0",
+
+def _parse_index_stats(max_date_res, total_record_count):
+    return {
         "last_updated": max_date_res["aggregations"]["max_date"].get(
             "value_as_string"
         ),
         "last_indexed": max_date_res["aggregations"]["max_indexed_date"].get(
             "value_as_string"
         ),
-        "total_record_count": count_res["count"],
-        "is_data_stale": _is_data_stale(
-            max_date_res["aggregations"]["max_date"].get("value_as_string")
-        ),
+        "total_record_count": total_record_count,
+    }
+
+
+def _get_index_stats():
+    body = _get_index_stats_body()
+    max_date_res = _get_es().search(index=_COMPLAINT_ES_INDEX, body=body)
+    count_res = _get_es().count(index=_COMPLAINT_ES_INDEX)
+    return _parse_index_stats(max_date_res, count_res["count"])
+
+
+def _cache_index_stats(stats):
+    generation = _observe_index("last_indexed", stats["last_indexed"])
+    _META_CACHE.set("meta", stats, generation)
+
+
+def _get_cached_index_stats():
+    stats = _META_CACHE.get("meta", get_index_generation())
+    if stats is None:
+        stats = _get_index_stats()
+        _cache_index_stats(stats)
+    return stats
+
+
+def get_index_version():
+    """
+    Return a version string for the loaded index and its last_indexed date.
+
+    Unlike the process-local generation counter, the version is derived
+    from the index itself, so it is consistent across worker processes and
+    suitable for shared caches and HTTP validators.
+    """
+    return _index_version(_get_cached_index_stats())
+
+
+def _index_version(stats):
+    version = "{}:{}".format(
+        stats["last_indexed"], stats["total_record_count"]
+    )
+    return version, stats["last_indexed"]
+
+
+def _meta_flags(stats):
+    return {
+        "is_data_stale": _is_data_stale(stats["last_updated"]),
         "has_data_issue": bool(flag_enabled("CCDB_TECHNICAL_ISSUES")),
     }
+
+
+def get_meta_flags():
+    """
+    Return the _meta flags of a search, which can change while the index
+    version does not, so cached responses must be keyed on them too.
+    """
+    return _meta_flags(_get_cached_index_stats())
+
+
+def _get_meta():
+    stats = _get_cached_index_stats()
+    result = {
+        "license": "CC0",
+        "last_updated": stats["last_updated"],
+        "last_indexed": stats["last_indexed"],
+        "total_record_count": stats["total_record_count"],
+    }
+    result.update(_meta_flags(stats))
     return result
 
 
@@ -251,111 +673,516 @@ def parse_search_after(params):
     return [score, _id]
 
 
+def _build_pagination_body(body, params):
+    """Return a lightweight copy of a search body for harvesting sort keys."""
+    # When determining break points, we don't need to recompute
+    # aggregations, re-highlight, or return result source. Only top-level
+    # keys are changed, so the rest of the body is shared.
+    pagination_body = {
+        key: value
+        for key, value in body.items()
+        if key not in ("aggs", "highlight", "search_after")
+    }
+    pagination_body["_source"] = False
+    pagination_body["track_total_hits"] = False
+
+    # cleaner to get page from frontend, but 'frm' works for now
+    user_batch_size = body["size"]
+    page = params.get("frm", user_batch_size) / user_batch_size
+    pagination_body["size"] = get_pagination_query_size(page, user_batch_size)
+    return pagination_body
+
+
+def _msearch(bodies):
+    """Run several search bodies against the index in one round trip."""
+    lines = []
+    for body in bodies:
+        lines.append({})
+        lines.append(body)
+    res = _get_es().msearch(
+        index=_COMPLAINT_ES_INDEX, body=lines, **_timeout("search")
+    )
+    responses = res["responses"]
+    for response in responses:
+        if "error" in response:
+            error = response["error"]
+            if isinstance(error, dict):
+                error = error.get("type", error)
+            raise TransportError(
+                response.get("status", "N/A"), error, response["error"]
+            )
+    return responses
+
+
+def _pagination_cache_key(pagination_body):
+    # The harvest size grows with the requested page, and harvests always
+    # start from the first result, so neither is part of the key.
+    return canonical_hash(
+        {
+            key: value
+            for key, value in pagination_body.items()
+            if key not in ("size", "search_after")
+        }
+    )
+
+
+def _plan_harvest(pagination_body):
+    """
+    Return the cached sort keys for a pagination body, along with the body
+    of the incremental harvest still needed to reach its size, if any.
+    """
+    entry = _BREAK_POINT_CACHE.get(
+        _pagination_cache_key(pagination_body), get_index_generation()
+    )
+    sort_keys, exhausted = entry if entry else ([], False)
+    needed = pagination_body["size"] - len(sort_keys)
+    if needed <= 0 or exhausted:
+        return sort_keys, None
+    harvest_body = dict(pagination_body, size=needed)
+    if sort_keys:
+        harvest_body["search_after"] = sort_keys[-1]
+    return sort_keys, harvest_body
+
+
+def _store_harvest(pagination_body, sort_keys, harvest_body, harvest_res):
+    """Extend the cached sort keys with a harvest and return them."""
+    new_keys = [hit.get("sort") for hit in harvest_res["hits"]["hits"]]
+    sort_keys = sort_keys + new_keys
+    exhausted = len(new_keys) < harvest_body["size"]
+    _BREAK_POINT_CACHE.set(
+        _pagination_cache_key(pagination_body),
+        (sort_keys, exhausted),
+        get_index_generation(),
+    )
+    return sort_keys
+
+
+def _harvest_sort_keys(body, params):
+    """Return the sort keys needed to compute break points for a search."""
+    pagination_body = _build_pagination_body(body, params)
+    sort_keys, harvest_body = _plan_harvest(pagination_body)
+    if harvest_body:
+        log.info(
+            "Harvesting break points using %s/%s/_search with %s",
+            _ES_URL,
+            _COMPLAINT_ES_INDEX,
+            harvest_body,
+        )
+        harvest_res = _get_es().search(
+            index=_COMPLAINT_ES_INDEX, body=harvest_body, **_timeout("search")
+        )
+        sort_keys = _store_harvest(
+            pagination_body, sort_keys, harvest_body, harvest_res
+        )
+    return sort_keys[: pagination_body["size"]]
+
+
+def _search_batched(body, params):
+    """
+    Send a default-format search and its supporting lookups as one _msearch.
+
+    The break point harvest is sent speculatively whenever results are
+    paged and the cached sort keys don't already cover the requested page,
+    since the hit total is not known up front. The _meta lookup is only
+    included when the cached index stats are missing or stale, and uses
+    track_total_hits in place of a separate count() call.
+
+    Returns the search response and the harvested sort keys, if any.
+    """
+    bodies = [body]
+    sort_keys = None
+    harvest_body = None
+    if body["size"]:
+        pagination_body = _build_pagination_body(body, params)
+        sort_keys, harvest_body = _plan_harvest(pagination_body)
+        if harvest_body:
+            bodies.append(harvest_body)
+    needs_stats = _META_CACHE.get("meta", get_index_generation()) is None
+    if needs_stats:
+        stats_body = _get_index_stats_body()
+        stats_body["track_total_hits"] = True
+        bodies.append(stats_body)
+
+    log.info(
+        "Requesting %s/%s/_msearch with %s",
+        _ES_URL,
+        _COMPLAINT_ES_INDEX,
+        bodies,
+    )
+    responses = _msearch(bodies)
+
+    if needs_stats:
+        stats_res = responses.pop()
+        _cache_index_stats(
+            _parse_index_stats(stats_res, stats_res["hits"]["total"]["value"])
+        )
+    if harvest_body:
+        sort_keys = _store_harvest(
+            pagination_body, sort_keys, harvest_body, responses[1]
+        )
+    if sort_keys is not None:
+        sort_keys = sort_keys[: pagination_body["size"]]
+    return responses[0], sort_keys
+
+
+def register_filter_set(filters, name=None):
+    """
+    Store a validated filter set and return its record, indexing its
+    filters in FILTER_SET_INDEX for terms lookups when that is set.
+    """
+    filter_sets = get_filter_sets()
+    filters = normalize(filters)
+    set_id = filter_set_id(filters)
+    record = filter_sets.get(set_id)
+    if record is not None and record["lookup_index"] == _FILTER_SET_INDEX:
+        return record
+    lookup_index = None
+    if _FILTER_SET_INDEX:
+        try:
+            _get_es().index(
+                index=_FILTER_SET_INDEX,
+                id=set_id,
+                body=filters,
+            )
+            lookup_index = _FILTER_SET_INDEX
+        except TransportError as te:
+            log.warning("Unable to index filter set %s: %s", set_id, te)
+    return filter_sets.register(filters, name=name, lookup_index=lookup_index)
+
+
+def _request_params(kwargs, **changes):
+    """Return the params of a request, with its filter set's filters."""
+    params = SearchParams(kwargs, **changes)
+    set_id = params.get("filter_set")
+    if not set_id:
+        return params
+    record = get_filter_set(set_id)
+    if record is None:
+        raise ValidationError({"filter_set": ["Unknown filter set"]})
+    lookup_index = _FILTER_SET_INDEX
+    if (
+        lookup_index
+        and record["lookup_index"] == lookup_index
+        and not _refresh_filter_set(set_id)
+    ):
+        lookup_index = None
+    return params.replace(**merge_filters(params, record, lookup_index))
+
+
+def _refresh_filter_set(set_id):
+    """
+    Make a filter set indexed without a refresh searchable the first time
+    this process uses it. Returns False if its values must be used instead.
+    """
+    if set_id in _REFRESHED_FILTER_SETS:
+        return True
+    try:
+        _get_es().indices.refresh(index=_FILTER_SET_INDEX)
+    except TransportError as te:
+        log.warning("Unable to refresh filter set %s: %s", set_id, te)
+        return False
+    _REFRESHED_FILTER_SETS.add(set_id)
+    return True
+
+
+def _search_params(**kwargs):
+    params = _request_params(kwargs)
+    search_after = parse_search_after(params)
+    if search_after:
+        params = params.replace(search_after=search_after)
+    return params
+
+
+def _search_builder(params):
+    search_builder = SearchBuilder(params)
+    search_builder.use_all_fields(
+        AllFieldsQuery(_ALL_FIELDS_STRATEGY, _ALL_FIELDS, _ALL_FIELDS_COPY_TO)
+    )
+    return search_builder
+
+
+def _build_search_body(params, agg_exclude=None):
+    search_builder = _search_builder(params)
+    body = search_builder.build()
+    # The post filter and every facet share one compilation of the filters
+    filters = FilterCompiler(params)
+    post_filter_builder = PostFilterBuilder(params)
+    post_filter_builder.use_filters(filters)
+    body["post_filter"] = post_filter_builder.build()
+    body["track_total_hits"] = True
+    if params.get("format") == "default" and not params.get("no_aggs"):
+        if _AGG_FILTER_PLAN == "shared":
+            aggregation_builder = SharedFilterAggregationBuilder(params)
+        else:
+            aggregation_builder = AggregationBuilder(params)
+        aggregation_builder.use_filters(filters)
+        if agg_exclude:
+            aggregation_builder.add_exclude(agg_exclude)
+        body["aggs"] = aggregation_builder.build()
+    return body
+
+
+def _has_more_pages(res, body):
+    hit_total = res["hits"]["total"]["value"]
+    return bool(res["hits"]["hits"] and hit_total and hit_total > body["size"])
+
+
+def _unwrap_aggs(res):
+    """Restore the facets of a search planned with shared filters."""
+    if "aggregations" in res:
+        SharedFilterAggregationBuilder.unwrap(res["aggregations"])
+    return res
+
+
+def _add_search_meta(res, body, sort_keys=None, downgraded=False):
+    break_points = {}
+    if sort_keys:
+        break_points = get_break_points(
+            [{"sort": sort_key} for sort_key in sort_keys], body["size"]
+        )
+    res["_meta"] = _get_meta()
+    res["_meta"]["break_points"] = break_points
+    if downgraded:
+        # Admission control dropped the aggregations and highlighting
+        res["_meta"]["downgraded"] = True
+    return res
+
+
+def _export_headers(params):
+    """Return the CSV and Parquet columns for the requested `fields`."""
+    fields = params.get("fields")
+    if not fields:
+        return CSV_ORDERED_HEADERS
+    return OrderedDict(
+        (key, header)
+        for key, header in CSV_ORDERED_HEADERS.items()
+        if key in fields
+    )
+
+
+def _export_page_size():
+    if _EXPORT_ENGINE == "pit":
+        return _EXPORT_PIT_PAGE_SIZE
+    return _SCROLL_PAGE_SIZE
+
+
+def _export_scan(body, pit_id=None, preserve_order=False):
+    if _EXPORT_ENGINE == "pit":
+        return pit_scan(
+            client=_get_es(),
+            query=body,
+            index=_COMPLAINT_ES_INDEX,
+            size=_EXPORT_PIT_PAGE_SIZE,
+            keep_alive=_EXPORT_PIT_KEEP_ALIVE,
+            request_timeout=_EXPORT_PIT_PAGE_TIMEOUT,
+            pit_id=pit_id,
+        )
+    return helpers.scan(
+        client=_get_es(),
+        query=body,
+        scroll="10m",
+        index=_COMPLAINT_ES_INDEX,
+        size=_SCROLL_PAGE_SIZE,
+        request_timeout=_ES_EXPORT_TIMEOUT,
+        preserve_order=preserve_order,
+    )
+
+
+def _sliced_export_scan(body):
+    """
+    Fetch an export as EXPORT_SLICES slices in parallel.
+
+    With EXPORT_SLICE_ORDER=ordered the slices are merged in the search
+    body's sort order, which is date_received for the created_date sorts.
+    Slices of a point-in-time export share one point in time.
+    """
+    ordered = _EXPORT_SLICE_ORDER == "ordered" and "sort" in body
+    reverse = False
+    if ordered:
+        sort_field = next(iter(body["sort"][0]))
+        reverse = body["sort"][0][sort_field]["order"] == "desc"
+    pit_id = None
+    if _EXPORT_ENGINE == "pit":
+        pit_id = open_pit(
+            _get_es(),
+            _COMPLAINT_ES_INDEX,
+            _EXPORT_PIT_KEEP_ALIVE,
+            _EXPORT_PIT_PAGE_TIMEOUT,
+        )
+
+    def scan_slice(slice_id, slices):
+        slice_body = dict(body, slice={"id": slice_id, "max": slices})
+        return _export_scan(slice_body, pit_id, preserve_order=ordered)
+
+    try:
+        yield from sliced_scan(
+            scan_slice,
+            _EXPORT_SLICES,
+            ordered=ordered,
+            reverse=reverse,
+            queue_depth=_EXPORT_QUEUE_DEPTH,
+        )
+    finally:
+        if pit_id:
+            close_pit(_get_es(), pit_id)
+
+
+def _export_response(scan_response, body, params, continued=False):
+    """
+    Stream the hits of an export in the requested format.
+
+    With `continued`, the stream picks up after rows already sent by an
+    earlier response, so it has no CSV header row or opening JSON bracket,
+    and the JSON export size check is not repeated.
+    """
+    exporter = OpenSearchExporter()
+
+    if params.get("format") == "csv":
+        res = exporter.export_csv(
+            scan_response,
+            _export_headers(params),
+            chunk_size=_EXPORT_CHUNK_SIZE,
+            continued=continued,
+        )
+    elif params.get("format") == "json":
+        hit_total = None
+        if _EXPORT_ENFORCE_LIMIT and not continued:
+            if "highlight" in body:
+                del body["highlight"]
+            body.update({"size": 0, "track_total_hits": True})
+            count_res = _get_es().search(
+                index=_COMPLAINT_ES_INDEX, body=body, **_timeout("search")
+            )
+            hit_total = count_res["hits"]["total"]["value"]
+        res = exporter.export_json(
+            scan_response,
+            hit_total,
+            projection=_EXPORT_JSON_PROJECTION,
+            chunk_size=_EXPORT_CHUNK_SIZE,
+            continued=continued,
+        )
+    elif params.get("format") == "ndjson":
+        res = exporter.export_ndjson(
+            scan_response, chunk_size=_EXPORT_CHUNK_SIZE
+        )
+    elif params.get("format") == "parquet":
+        res = exporter.export_parquet(scan_response, _export_headers(params))
+    return res
+
+
+def _track_sort(hits, cursor):
+    with closing_scan(hits):
+        for hit in hits:
+            cursor["sort"] = hit["sort"]
+            yield hit
+
+
+def resumable_export(
+    agg_exclude=None, cursor=None, search_after=None, **kwargs
+):
+    """
+    Stream a CSV, JSON or NDJSON export in its sort order through a point
+    in time, so that it can be continued after any row.
+
+    The sort values of the last hit read are kept in `cursor["sort"]`.
+    Passing them back as `search_after` streams the rest of the export,
+    as it would have continued after that hit.
+    """
+    params = _search_params(**kwargs)
+    body = _build_search_body(params, agg_exclude)
+    hits = pit_scan(
+        client=_get_es(),
+        query=body,
+        index=_COMPLAINT_ES_INDEX,
+        size=_EXPORT_PIT_PAGE_SIZE,
+        keep_alive=_EXPORT_PIT_KEEP_ALIVE,
+        request_timeout=_EXPORT_PIT_PAGE_TIMEOUT,
+        search_after=search_after,
+    )
+    if _EXPORT_PREFETCH_DEPTH:
+        hits = prefetch(
+            hits,
+            depth=_EXPORT_PREFETCH_DEPTH,
+            batch_size=_EXPORT_PIT_PAGE_SIZE,
+        )
+    if cursor is not None:
+        hits = _track_sort(hits, cursor)
+    return _export_response(
+        hits, body, params, continued=search_after is not None
+    )
+
+
 def search(agg_exclude=None, **kwargs):
     """
     Prepare a search, get results from OpenSearch, and return the hits.
 
-    Starting from a copy of default PARAMS, these are the steps:
+    Starting from the default PARAMS, these are the steps:
     - Update params with request details.
     - Add a formatted 'search_after' param if pagination is requested.
     - Build a search body based on params
     - Add param-based post_filter to the search body.
     - Add aggregations to the search body, unless no_aggs is specified.
     - Add a track_total_hits directive to get accurate hit counts (new in 2021)
-    - Assemble pagination break points if needed.
+    - Assemble pagination break points if needed, reusing sort keys
+      harvested by earlier requests for the same query.
+
+    With ES_MSEARCH enabled, the search, the break point harvest and any
+    uncached _meta lookup are sent together as a single _msearch request.
 
     The response is finalized based on whether the results are to be viewed
     in a browser or exported as CSV or JSON.
     Exportable results are produced with "scroll" OpenSearch searches,
     and are never paginated.
     """
-    params = copy.deepcopy(PARAMS)
-    params.update(**kwargs)
-    search_after = parse_search_after(params)
-    if search_after:
-        params["search_after"] = search_after
-    search_builder = SearchBuilder()
-    search_builder.add(**params)
-    body = search_builder.build()
-    post_filter_builder = PostFilterBuilder()
-    post_filter_builder.add(**params)
-    body["post_filter"] = post_filter_builder.build()
-    body["track_total_hits"] = True
+    params = _search_params(**kwargs)
+    body = _build_search_body(params, agg_exclude)
     # format
     res = {}
     _format = params.get("format")
     if _format == "default":
-        if not params.get("no_aggs"):
-            aggregation_builder = AggregationBuilder()
-            aggregation_builder.add(**params)
-            if agg_exclude:
-                aggregation_builder.add_exclude(agg_exclude)
-            body["aggs"] = aggregation_builder.build()
-        log.info(
-            "Requesting %s/%s/_search with %s",
-            _ES_URL,
-            _COMPLAINT_ES_INDEX,
+        body, queued, downgraded = _admit(
+            "search",
             body,
+            lambda: _build_search_body(
+                params.replace(no_aggs=True, no_highlight=True), agg_exclude
+            ),
         )
-        res = _get_es().search(index=_COMPLAINT_ES_INDEX, body=body)
-        hit_total = res["hits"]["total"]["value"]
-        break_points = {}
-        if res["hits"]["hits"]:
-            user_batch_size = body["size"]
-            if hit_total and hit_total > user_batch_size:
-                # We have more than one page of results and need pagination
-                pagination_body = copy.deepcopy(body)
-
-                # When determining break points, we don't need to recompute
-                # aggregations, re-highlight, or return result source.
-                pagination_body.pop("aggs", None)
-                pagination_body.pop("highlight", None)
-                pagination_body["_source"] = False
-                pagination_body["track_total_hits"] = False
-
-                # cleaner to get page from frontend, but 'frm' works for now
-                page = params.get("frm", user_batch_size) / user_batch_size
-                pagination_body["size"] = get_pagination_query_size(
-                    page, user_batch_size
-                )
-                if "search_after" in pagination_body:
-                    del pagination_body["search_after"]
+        with _query_slot(queued):
+            sort_keys = None
+            if _ES_MSEARCH:
+                res, sort_keys = _search_batched(body, params)
+            else:
                 log.info(
-                    "Harvesting break points using %s/%s/_search with %s",
+                    "Requesting %s/%s/_search with %s",
                     _ES_URL,
                     _COMPLAINT_ES_INDEX,
-                    pagination_body,
-                )
-                pagination_res = _get_es().search(
-                    index=_COMPLAINT_ES_INDEX, body=pagination_body
+                    body,
                 )
-                break_points = get_break_points(
-                    pagination_res["hits"]["hits"], user_batch_size
+                res = _get_es().search(
+                    index=_COMPLAINT_ES_INDEX, body=body, **_timeout("search")
                 )
-        res["_meta"] = _get_meta()
-        res["_meta"]["break_points"] = break_points
+            if _has_more_pages(res, body):
+                # We have more than one page of results and need pagination
+                if sort_keys is None:
+                    sort_keys = _harvest_sort_keys(body, params)
+            else:
+                sort_keys = None
+        _unwrap_aggs(res)
+        _add_search_meta(res, body, sort_keys, downgraded)
 
     elif _format in EXPORT_FORMATS:
-        scan_response = helpers.scan(
-            client=_get_es(),
-            query=body,
-            scroll="10m",
-            index=_COMPLAINT_ES_INDEX,
-            size=7000,  # batch size for scroll request
-            request_timeout=3000,
-        )
-
-        exporter = OpenSearchExporter()
-
-        if params.get("format") == "csv":
-            res = exporter.export_csv(scan_response, CSV_ORDERED_HEADERS)
-        elif params.get("format") == "json":
-            if "highlight" in body:
-                del body["highlight"]
-            body.update({"size": 0, "track_total_hits": True})
-            count_res = _get_es().search(index=_COMPLAINT_ES_INDEX, body=body)
-            hit_total = count_res["hits"]["total"]["value"]
-            res = exporter.export_json(scan_response, hit_total)
+        if _EXPORT_SLICES > 1:
+            scan_response = _sliced_export_scan(body)
+        elif _EXPORT_PREFETCH_DEPTH:
+            scan_response = prefetch(
+                _export_scan(body),
+                depth=_EXPORT_PREFETCH_DEPTH,
+                batch_size=_export_page_size(),
+            )
+        else:
+            scan_response = _export_scan(body)
+
+        res = _export_response(scan_response, body, params)
 
     return res
 
@@ -377,21 +1204,20 @@ def suggest(text=None, size=6):
         },
     }
 
-    res = _get_es().search(index=_COMPLAINT_ES_INDEX, body=body)
+    res = _get_es().search(
+        index=_COMPLAINT_ES_INDEX, body=body, **_timeout("suggest")
+    )
     candidates = [e["text"] for e in res["suggest"]["sgg"][0]["options"]]
     return candidates
 
 
 def filter_suggest(filter_field, display_field=None, **kwargs):
-    params = dict(**kwargs)
-    params.update({"size": 0, "no_highlight": True})
+    params = _request_params(kwargs, size=0, no_highlight=True)
 
-    search_builder = SearchBuilder()
-    search_builder.add(**params)
+    search_builder = _search_builder(params)
     body = search_builder.build()
 
-    aggregation_builder = AggregationBuilder()
-    aggregation_builder.add(**params)
+    aggregation_builder = AggregationBuilder(params)
     aggs = {filter_field: aggregation_builder.build_one(filter_field)}
     # add the input value as a must match
     if filter_field != "zip_code":
@@ -412,7 +1238,9 @@ def filter_suggest(filter_field, display_field=None, **kwargs):
     body["track_total_hits"] = True
 
     # format
-    res = _get_es().search(index=_COMPLAINT_ES_INDEX, body=body)
+    res = _get_es().search(
+        index=_COMPLAINT_ES_INDEX, body=body, **_timeout("suggest")
+    )
     # reformat the return
     candidates = [
         x["key"]
@@ -426,23 +1254,27 @@ def filter_suggest(filter_field, display_field=None, **kwargs):
 
 def document(complaint_id):
     doc_query = {"query": {"term": {"_id": complaint_id}}}
-    res = _get_es().search(index=_COMPLAINT_ES_INDEX, body=doc_query)
+    res = _get_es().search(
+        index=_COMPLAINT_ES_INDEX, body=doc_query, **_timeout("document")
+    )
     return res
 
 
-def states_agg(agg_exclude=None, **kwargs):
-    params = copy.deepcopy(PARAMS)
-    params.update(**kwargs)
-    params.update({"size": 0})
-    search_builder = SearchBuilder()
-    search_builder.add(**params)
+def _build_states_body(params, agg_exclude=None):
+    search_builder = _search_builder(params)
     body = search_builder.build()
-    aggregation_builder = StateAggregationBuilder()
-    aggregation_builder.add(**params)
+    aggregation_builder = StateAggregationBuilder(params)
     if agg_exclude:
         aggregation_builder.add_exclude(agg_exclude)
     body["aggs"] = aggregation_builder.build()
     body["track_total_hits"] = True
+    return body
+
+
+def states_agg(agg_exclude=None, **kwargs):
+    params = _request_params(kwargs, size=0)
+    body = _build_states_body(params, agg_exclude)
+    body, queued, _ = _admit("states", body)
     log.info(
         "Calling %s/%s/_search with %s",
         _ES_URL,
@@ -450,47 +1282,81 @@ def states_agg(agg_exclude=None, **kwargs):
         body,
     )
     log.info("API params were %s", params)
-    res = _get_es().search(index=_COMPLAINT_ES_INDEX, body=body)
+    with _query_slot(queued):
+        res = _get_es().search(
+            index=_COMPLAINT_ES_INDEX, body=body, **_timeout("states")
+        )
     return res
 
 
-def trends(agg_exclude=None, **kwargs):
-    params = copy.deepcopy(PARAMS)
-    params.update(**kwargs)
-    params.update(size=0)
-    search_builder = SearchBuilder()
-    search_builder.add(**params)
-    body = search_builder.build()
+def _date_range_buckets_key(date_bucket_body):
+    return canonical_hash(date_bucket_body)
+
+
+def _get_date_range_buckets(date_bucket_body):
+    """
+    Return the dateRangeBuckets aggregation for a trends request.
+
+    The body only depends on the trend interval and date bounds, so results
+    are shared between requests until the index generation changes.
+    """
+    key = _date_range_buckets_key(date_bucket_body)
+    generation = get_index_generation()
+    date_range_buckets = _DATE_BUCKET_CACHE.get(key, generation)
+    if date_range_buckets is None:
+        res_date_buckets = _get_es().search(
+            index=_COMPLAINT_ES_INDEX,
+            body=date_bucket_body,
+            **_timeout("trends"),
+        )
+        date_range_buckets = res_date_buckets["aggregations"][
+            "dateRangeBuckets"
+        ]
+        _DATE_BUCKET_CACHE.set(key, date_range_buckets, generation)
+    # Callers annotate the top level of the result, so hand out a copy
+    return dict(date_range_buckets)
+
 
-    res_trends = None
+def _build_trends_bodies(params, agg_exclude=None):
+    """Return the trends search body and its dateRangeBuckets body."""
+    search_builder = _search_builder(params)
+    body = search_builder.build()
 
-    aggregation_builder = TrendsAggregationBuilder()
-    aggregation_builder.add(**params)
+    filters = FilterCompiler(params)
+    aggregation_builder = TrendsAggregationBuilder(params)
+    aggregation_builder.use_filters(filters)
     if agg_exclude:
         aggregation_builder.add_exclude(agg_exclude)
     body["aggs"] = aggregation_builder.build()
     body["track_total_hits"] = True
 
-    res_trends = _get_es().search(index=_COMPLAINT_ES_INDEX, body=body)
+    date_range_buckets_builder = DateRangeBucketsBuilder(params)
+    date_range_buckets_builder.use_filters(filters)
+    date_bucket_body = dict(
+        body,
+        query={"match_all": {}},
+        aggs=date_range_buckets_builder.build(),
+    )
 
-    res_date_buckets = None
+    return body, date_bucket_body
 
-    date_bucket_body = copy.deepcopy(body)
-    date_bucket_body["query"] = {"match_all": {}}
 
-    date_range_buckets_builder = DateRangeBucketsBuilder()
-    date_range_buckets_builder.add(**params)
-    date_bucket_body["aggs"] = date_range_buckets_builder.build()
+def _finish_trends(res_trends, date_range_buckets, date_bucket_body):
+    res_trends = process_trends_response(res_trends)
+    res_trends["aggregations"]["dateRangeBuckets"] = date_range_buckets
+    res_trends["aggregations"]["dateRangeBuckets"]["body"] = date_bucket_body
+    return res_trends
 
-    res_date_buckets = _get_es().search(
-        index=_COMPLAINT_ES_INDEX, body=date_bucket_body
-    )
 
-    res_trends = process_trends_response(res_trends)
-    res_trends["aggregations"]["dateRangeBuckets"] = res_date_buckets[
-        "aggregations"
-    ]["dateRangeBuckets"]
+def trends(agg_exclude=None, **kwargs):
+    params = _request_params(kwargs, size=0)
+    body, date_bucket_body = _build_trends_bodies(params, agg_exclude)
+    body, queued, _ = _admit("trends", body)
 
-    res_trends["aggregations"]["dateRangeBuckets"]["body"] = date_bucket_body
+    with _query_slot(queued):
+        res_trends = _get_es().search(
+            index=_COMPLAINT_ES_INDEX, body=body, **_timeout("trends")
+        )
+        date_range_buckets = _get_date_range_buckets(date_bucket_body)
 
-    return res_trends
+    return _finish_trends(res_trends, date_range_buckets, date_bucket_body)
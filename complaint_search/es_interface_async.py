@@ -0,0 +1,250 @@
+"""
+Async counterparts of the search, states and trends operations.
+
+Request bodies and caches are shared with es_interface, but queries run on
+an AsyncOpenSearch client so independent sub-queries are awaited together.
+Requires the optional aiohttp dependency (`pip install ccdb5-api[async]`).
+"""
+import asyncio
+import logging
+import weakref
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from opensearchpy import TransportError
+
+from complaint_search import es_interface
+
+
+try:
+    from opensearchpy import AsyncOpenSearch
+
+    from complaint_search.transport_async import JitteredAsyncTransport
+except ImportError:  # pragma: no cover
+    AsyncOpenSearch = None
+
+
+log = logging.getLogger(__name__)
+
+# aiohttp sessions are bound to the event loop that created them, so each
+# running loop gets its own client.
+_ASYNC_ES_INSTANCES = weakref.WeakKeyDictionary()
+
+
+def _get_async_es_options():
+    """Return the shared client options in AIOHttpConnection's terms."""
+    options = es_interface._get_es_options()
+    # AsyncTransport keeps pool_maxsize to itself; aiohttp's pool is sized
+    # with the connection's `maxsize`
+    options["maxsize"] = options.pop("pool_maxsize")
+    return options
+
+
+def _get_async_es():
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_ES_INSTANCES.get(loop)
+    if client is None:
+        client = AsyncOpenSearch(
+            es_interface._get_es_hosts(),
+            transport_class=JitteredAsyncTransport,
+            retry_backoff=es_interface._ES_RETRY_BACKOFF,
+            retry_backoff_max=es_interface._ES_RETRY_BACKOFF_MAX,
+            after_request=es_interface._log_transport_stats,
+            **_get_async_es_options(),
+        )
+        _ASYNC_ES_INSTANCES[loop] = client
+    return client
+
+
+async def _get_alias_target():
+    try:
+        res = await _get_async_es().indices.get_alias(
+            index=es_interface._COMPLAINT_ES_INDEX
+        )
+    except TransportError as te:
+        log.warning(
+            "Unable to resolve %s: %s", es_interface._COMPLAINT_ES_INDEX, te
+        )
+        return None
+    return ",".join(sorted(res))
+
+
+async def get_index_generation():
+    """
+    Return the current index generation, polling the alias target with the
+    async client when a check is due.
+
+    Once this has run, the synchronous get_index_generation() used by the
+    shared cache helpers will not be due for a network check either.
+    """
+    interval = es_interface._ALIAS_CHECK_INTERVAL
+    generation = es_interface._INDEX_GENERATION
+    if interval and generation.is_due("alias", interval):
+        target = await _get_alias_target()
+        if target is not None:
+            es_interface._observe_index("alias", target)
+    return generation.value
+
+
+async def _search(body, endpoint=None):
+    timeout = es_interface._timeout(endpoint) if endpoint else {}
+    return await _get_async_es().search(
+        index=es_interface._COMPLAINT_ES_INDEX, body=body, **timeout
+    )
+
+
+@asynccontextmanager
+async def _query_slot(queued):
+    """Wait for a slot of the query queue, if queued."""
+    if not queued:
+        yield
+        return
+    queue = es_interface._get_query_queue()
+    await queue.acquire_async()
+    try:
+        yield
+    finally:
+        queue.release()
+
+
+async def _get_index_stats():
+    client = _get_async_es()
+    max_date_res, count_res = await asyncio.gather(
+        _search(es_interface._get_index_stats_body()),
+        client.count(index=es_interface._COMPLAINT_ES_INDEX),
+    )
+    return es_interface._parse_index_stats(max_date_res, count_res["count"])
+
+
+async def _get_cached_index_stats():
+    generation = await get_index_generation()
+    stats = es_interface._META_CACHE.get("meta", generation)
+    if stats is None:
+        stats = await _get_index_stats()
+        es_interface._cache_index_stats(stats)
+    return stats
+
+
+async def get_index_version():
+    """Return the index version and last_indexed date for cache validation."""
+    return es_interface._index_version(await _get_cached_index_stats())
+
+
+async def get_meta_flags():
+    """Return the _meta flags that cached responses are keyed on."""
+    stats = await _get_cached_index_stats()
+    # has_data_issue is read from the database, like in search
+    return await sync_to_async(es_interface._meta_flags)(stats)
+
+
+async def search(agg_exclude=None, **kwargs):
+    """
+    Run a default-format search with its supporting lookups concurrently.
+
+    The main search, a speculative break point harvest and any uncached
+    _meta lookup are awaited together. Exports stream from the synchronous
+    client, so they are handed to es_interface.search in a worker thread.
+    """
+    # A filter set is read from disk and may refresh its index with the
+    # synchronous client
+    params = await sync_to_async(es_interface._search_params)(**kwargs)
+    if params.get("format") != "default":
+        return await sync_to_async(
+            es_interface.search, thread_sensitive=False
+        )(agg_exclude=agg_exclude, **kwargs)
+
+    body, queued, downgraded = es_interface._admit(
+        "search",
+        es_interface._build_search_body(params, agg_exclude),
+        lambda: es_interface._build_search_body(
+            params.replace(no_aggs=True, no_highlight=True), agg_exclude
+        ),
+    )
+    generation = await get_index_generation()
+
+    tasks = [_search(body, "search")]
+    sort_keys = None
+    harvest_body = None
+    if body["size"]:
+        pagination_body = es_interface._build_pagination_body(body, params)
+        sort_keys, harvest_body = es_interface._plan_harvest(pagination_body)
+        if harvest_body:
+            tasks.append(_search(harvest_body, "search"))
+    needs_stats = es_interface._META_CACHE.get("meta", generation) is None
+    if needs_stats:
+        tasks.append(_get_index_stats())
+
+    log.info(
+        "Requesting %s/%s/_search concurrently with %s",
+        es_interface._ES_URL,
+        es_interface._COMPLAINT_ES_INDEX,
+        body,
+    )
+    async with _query_slot(queued):
+        results = await asyncio.gather(*tasks)
+
+    if needs_stats:
+        es_interface._cache_index_stats(results.pop())
+    res = results[0]
+    if harvest_body:
+        sort_keys = es_interface._store_harvest(
+            pagination_body, sort_keys, harvest_body, results[1]
+        )
+    if es_interface._has_more_pages(res, body) and sort_keys is not None:
+        sort_keys = sort_keys[: pagination_body["size"]]
+    else:
+        sort_keys = None
+    es_interface._unwrap_aggs(res)
+    # The has_data_issue flag is read from the database, which Django only
+    # allows from synchronous code.
+    return await sync_to_async(es_interface._add_search_meta)(
+        res, body, sort_keys, downgraded
+    )
+
+
+async def states_agg(agg_exclude=None, **kwargs):
+    params = await sync_to_async(es_interface._request_params)(
+        kwargs, size=0
+    )
+    body = es_interface._build_states_body(params, agg_exclude)
+    body, queued, _ = es_interface._admit("states", body)
+    log.info(
+        "Calling %s/%s/_search with %s",
+        es_interface._ES_URL,
+        es_interface._COMPLAINT_ES_INDEX,
+        body,
+    )
+    async with _query_slot(queued):
+        return await _search(body, "states")
+
+
+async def trends(agg_exclude=None, **kwargs):
+    """Run the trends search and the dateRangeBuckets query concurrently."""
+    params = await sync_to_async(es_interface._request_params)(
+        kwargs, size=0
+    )
+    body, date_bucket_body = es_interface._build_trends_bodies(
+        params, agg_exclude
+    )
+    body, queued, _ = es_interface._admit("trends", body)
+
+    generation = await get_index_generation()
+    key = es_interface._date_range_buckets_key(date_bucket_body)
+    date_range_buckets = es_interface._DATE_BUCKET_CACHE.get(key, generation)
+    async with _query_slot(queued):
+        if date_range_buckets is None:
+            res_trends, res_date_buckets = await asyncio.gather(
+                _search(body, "trends"), _search(date_bucket_body, "trends")
+            )
+            date_range_buckets = res_date_buckets["aggregations"][
+                "dateRangeBuckets"
+            ]
+            es_interface._DATE_BUCKET_CACHE.set(
+                key, date_range_buckets, generation
+            )
+        else:
+            res_trends = await _search(body, "trends")
+
+    return es_interface._finish_trends(
+        res_trends, dict(date_range_buckets), date_bucket_body
+    )
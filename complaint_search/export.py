@@ -1,13 +1,106 @@
 import csv
+import io
 import json
-from csv import DictWriter
+from contextlib import contextmanager
+from datetime import date
 from io import StringIO
 
 from django.http import StreamingHttpResponse
 
 from rest_framework.exceptions import ValidationError
 
-from complaint_search.defaults import MAX_DOWNLOAD_SIZE
+from complaint_search.defaults import (
+    EXPORT_CHUNK_SIZE,
+    JSON_EXPORT_PROJECTIONS,
+    MAX_DOWNLOAD_SIZE,
+    PARQUET_BATCH_SIZE,
+    PARQUET_BOOLEAN_FIELDS,
+    PARQUET_DATE_FIELDS,
+    PARQUET_DICTIONARY_FIELDS,
+)
+
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+
+@contextmanager
+def closing_scan(scanResponse):
+    """
+    Close a scan generator when its export stream ends.
+
+    Django closes the streaming response when the client disconnects, so
+    this releases the scan's server-side context straight away rather than
+    when the generator is garbage collected.
+    """
+    try:
+        yield scanResponse
+    finally:
+        close = getattr(scanResponse, "close", None)
+        if close:
+            close()
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_boolean(value):
+    return {"Yes": True, "No": False}.get(value)
+
+
+def _parse_string(value):
+    return None if value is None else str(value)
+
+
+def parquet_schema(header_dict):
+    """
+    Return the Arrow schema of a Parquet export, with a column per key of
+    `header_dict`.
+    """
+    fields = []
+    for key in header_dict:
+        if key in PARQUET_DATE_FIELDS:
+            type_ = pa.date32()
+        elif key in PARQUET_BOOLEAN_FIELDS:
+            type_ = pa.bool_()
+        elif key in PARQUET_DICTIONARY_FIELDS:
+            type_ = pa.dictionary(pa.int32(), pa.string())
+        else:
+            type_ = pa.string()
+        fields.append(pa.field(key, type_))
+    return pa.schema(fields)
+
+
+class _ChunkSink(io.RawIOBase):
+    """A write-only file that collects written bytes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
 
 
 class OpenSearchExporter(object):
@@ -19,39 +112,48 @@ class OpenSearchExporter(object):
     # - header_dict (OrderedDict)
     #   The ordered dictionary where the key is the OpenSearch field name
     #   and the value is the CSV column header for that field
-    def export_csv(self, scanResponse, header_dict):
-        def read_and_flush(writer, buffer_, row):
-            writer.writerow(row)
-            buffer_.seek(0)
-            data = buffer_.read()
-            buffer_.seek(0)
-            buffer_.truncate()
-            return data
+    # - chunk_size (int)
+    #   Rows are buffered until at least this many characters are written,
+    #   then yielded as one chunk
+    # - continued (bool)
+    #   Omit the header row, when the rows continue an earlier response
+    def export_csv(
+        self,
+        scanResponse,
+        header_dict,
+        chunk_size=EXPORT_CHUNK_SIZE,
+        continued=False,
+    ):
+        keys = tuple(header_dict.keys())
 
         def stream():
             buffer_ = StringIO()
-            writer = DictWriter(
-                buffer_,
-                header_dict.keys(),
-                delimiter=",",
-                quoting=csv.QUOTE_MINIMAL,
+            writer = csv.writer(
+                buffer_, delimiter=",", quoting=csv.QUOTE_MINIMAL
             )
+            writerow = writer.writerow
 
             # Write Header Row
-            data = read_and_flush(writer, buffer_, header_dict)
-            yield data
+            if not continued:
+                writerow(header_dict.values())
 
-            count = 0
             # Write CSV
-            for row in scanResponse:
-                count += 1
-                rows_data = {
-                    key: str(value)
-                    for key, value in row["_source"].items()
-                    if key in header_dict.keys()
-                }
+            with closing_scan(scanResponse):
+                for row in scanResponse:
+                    source = row["_source"]
+                    writerow(
+                        [
+                            str(source[key]) if key in source else ""
+                            for key in keys
+                        ]
+                    )
+                    if buffer_.tell() >= chunk_size:
+                        yield buffer_.getvalue()
+                        buffer_.seek(0)
+                        buffer_.truncate()
 
-                data = read_and_flush(writer, buffer_, rows_data)
+            data = buffer_.getvalue()
+            if data:
                 yield data
 
         response = StreamingHttpResponse(stream(), content_type="text/csv")
@@ -64,8 +166,25 @@ class OpenSearchExporter(object):
     # - scanResponse (generator)
     #   The response from an OpenSearch scan query
     # - total_count (int)
-    #   The total number of records to be output
-    def export_json(self, scanResponse, total_count):
+    #   The total number of records to be output, checked against the
+    #   export limit. Pass None to skip the check
+    # - projection (str)
+    #   "hit" to write each scan hit as returned, or "source" to write only
+    #   the hit's _source document
+    # - chunk_size (int)
+    #   Documents are buffered until at least this many characters are
+    #   serialized, then yielded as one chunk
+    # - continued (bool)
+    #   Omit the opening bracket and separate the first document from the
+    #   ones an earlier response ended with
+    def export_json(
+        self,
+        scanResponse,
+        total_count=None,
+        projection="hit",
+        chunk_size=EXPORT_CHUNK_SIZE,
+        continued=False,
+    ):
         if total_count and total_count > MAX_DOWNLOAD_SIZE:
             raise ValidationError(
                 {
@@ -74,20 +193,133 @@ class OpenSearchExporter(object):
                     ]
                 }
             )
+        if projection not in JSON_EXPORT_PROJECTIONS:
+            raise ValueError(f"Unknown JSON export projection {projection}")
+        lean = projection == "source"
 
         def stream():
-            count = 0
+            dumps = json.dumps
             # Write JSON
-            yield "["
-            for row in scanResponse:
-                count += 1
-                if count < total_count:
-                    yield "{},".format(json.dumps(row))
-                else:
-                    yield json.dumps(row)
+            parts = [] if continued else ["["]
+            size = 0
+            separator = "," if continued else ""
+            with closing_scan(scanResponse):
+                for row in scanResponse:
+                    data = separator + dumps(row["_source"] if lean else row)
+                    separator = ","
+                    parts.append(data)
+                    size += len(data)
+                    if size >= chunk_size:
+                        yield "".join(parts)
+                        parts = []
+                        size = 0
 
-            yield "]"
+            parts.append("]")
+            yield "".join(parts)
 
         response = StreamingHttpResponse(stream(), content_type="text/json")
         response["Content-Disposition"] = "attachment; filename=file.json"
         return response
+
+    # export_ndjson - Stream the _source of each hit in an OpenSearch
+    # response as one line of JSON
+    #
+    # Parameters:
+    # - scanResponse (generator)
+    #   The response from an OpenSearch scan query
+    # - chunk_size (int)
+    #   Lines are buffered until at least this many characters are
+    #   serialized, then yielded as one chunk
+    def export_ndjson(self, scanResponse, chunk_size=EXPORT_CHUNK_SIZE):
+        def stream():
+            dumps = json.dumps
+            parts = []
+            size = 0
+            with closing_scan(scanResponse):
+                for row in scanResponse:
+                    data = dumps(row["_source"]) + "\n"
+                    parts.append(data)
+                    size += len(data)
+                    if size >= chunk_size:
+                        yield "".join(parts)
+                        parts = []
+                        size = 0
+
+            if parts:
+                yield "".join(parts)
+
+        response = StreamingHttpResponse(
+            stream(), content_type="application/x-ndjson"
+        )
+        response["Content-Disposition"] = "attachment; filename=file.ndjson"
+        return response
+
+    # export_parquet - Stream an OpenSearch response as a Parquet file
+    #
+    # Parameters:
+    # - scanResponse (generator)
+    #   The response from an OpenSearch scan query
+    # - header_dict (OrderedDict)
+    #   The ordered dictionary whose keys are the OpenSearch fields written
+    #   as columns
+    # - batch_size (int)
+    #   The number of rows in each row group. Rows are collected into one
+    #   record batch at a time, which is written and sent before the next
+    def export_parquet(
+        self, scanResponse, header_dict, batch_size=PARQUET_BATCH_SIZE
+    ):
+        if pa is None:
+            raise ValidationError(
+                {"format": ["Parquet exports are not available"]}
+            )
+        schema = parquet_schema(header_dict)
+        keys = tuple(header_dict.keys())
+        parsers = tuple(
+            (
+                _parse_date
+                if key in PARQUET_DATE_FIELDS
+                else (
+                    _parse_boolean
+                    if key in PARQUET_BOOLEAN_FIELDS
+                    else _parse_string
+                )
+            )
+            for key in keys
+        )
+
+        def write_batch(writer, columns):
+            arrays = [
+                pa.array(column, type=field.type)
+                for column, field in zip(columns, schema)
+            ]
+            writer.write_batch(
+                pa.RecordBatch.from_arrays(arrays, schema=schema)
+            )
+
+        def stream():
+            sink = _ChunkSink()
+            writer = pq.ParquetWriter(sink, schema)
+            columns = [[] for _ in keys]
+            rows = 0
+            with closing_scan(scanResponse):
+                for row in scanResponse:
+                    source = row["_source"]
+                    for column, key, parse in zip(columns, keys, parsers):
+                        column.append(parse(source.get(key)))
+                    rows += 1
+                    if rows >= batch_size:
+                        write_batch(writer, columns)
+                        columns = [[] for _ in keys]
+                        rows = 0
+                        yield sink.drain()
+
+            if rows:
+                write_batch(writer, columns)
+            writer.close()
+            yield sink.drain()
+
+        response = StreamingHttpResponse(
+            stream(), content_type="application/vnd.apache.parquet"
+        )
+        response["Content-Disposition"] = "attachment; filename=file.parquet"
+        return response
@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from complaint_search.cache import GenerationCache, canonical_hash
+
+
+# Filters compiled to parent/child clauses, which cannot be terms lookups
+_PARENT_FILTERS = ("issue", "not_issue", "not_product", "product")
+
+
+def normalize(filters):
+    """Return filters with each list of values sorted and de-duplicated."""
+    return {
+        key: sorted(set(values)) for key, values in filters.items() if values
+    }
+
+
+def filter_set_id(filters):
+    return canonical_hash(["filter_set", normalize(filters)])
+
+
+def merge_filters(params, record, lookup_index=None):
+    """
+    Return the params changed by applying a filter set's record.
+
+    A filter the params also set matches the values of either. The other
+    filters of a set stored in `lookup_index` become terms lookups of its
+    document there, except the parent/child product and issue filters.
+    """
+    changes = {}
+    for key, values in record["filters"].items():
+        if params.get(key):
+            changes[key] = list(params[key]) + [
+                value for value in values if value not in params[key]
+            ]
+        elif (
+            lookup_index
+            and record["lookup_index"] == lookup_index
+            and key not in _PARENT_FILTERS
+        ):
+            changes[key] = {
+                "index": lookup_index,
+                "id": record["id"],
+                "path": key,
+            }
+        else:
+            changes[key] = values
+    return changes
+
+
+class FilterSetsFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many filter sets are registered. Try again later."
+    default_code = "filter_sets_full"
+
+
+class FilterSets(object):
+    """
+    Store registered filter sets as JSON files named by their content hash.
+
+    Registering the same filters again returns the existing set, keeping
+    its first name, so an ID always refers to the same filters and loaded
+    records can be cached for the life of the process. A record also notes
+    the OpenSearch index its filters were stored in for terms lookups.
+
+    A set expires `ttl` seconds after it was last registered. Expired sets
+    are removed once `max_sets` are stored, and registering a new set fails
+    with FilterSetsFull while that many are still live.
+    """
+
+    def __init__(self, directory, ttl=None, max_sets=None, max_cached=256):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_sets = max_sets
+        self._cache = GenerationCache(max_entries=max_cached)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, set_id):
+        return os.path.join(self.directory, set_id + ".json")
+
+    def _is_live(self, record):
+        if not self.ttl:
+            return True
+        registered = record.get("registered", record["created"])
+        return time.time() - registered < self.ttl
+
+    def get(self, set_id):
+        record = self._cache.get(set_id)
+        # Another process may have registered an expired set again
+        if record is None or not self._is_live(record):
+            try:
+                with open(self._path(set_id)) as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                return None
+            if not self._is_live(record):
+                return None
+            self._cache.set(set_id, record)
+        return record
+
+    def _prune(self):
+        """Remove expired sets once `max_sets` are stored."""
+        if not self.max_sets:
+            return
+        with os.scandir(self.directory) as entries:
+            paths = [
+                entry.path
+                for entry in entries
+                if entry.name.endswith(".json")
+            ]
+        if len(paths) < self.max_sets:
+            return
+        if self.ttl:
+            cutoff = time.time() - self.ttl
+            for path in list(paths):
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        paths.remove(path)
+                except OSError:
+                    paths.remove(path)
+        if len(paths) >= self.max_sets:
+            raise FilterSetsFull()
+
+    def register(self, filters, name=None, lookup_index=None):
+        """Store a validated filter set and return its record."""
+        filters = normalize(filters)
+        set_id = filter_set_id(filters)
+        with self._lock:
+            record = self.get(set_id)
+            if record is None:
+                self._prune()
+                record = {
+                    "id": set_id,
+                    "name": name,
+                    "filters": filters,
+                    "created": time.time(),
+                }
+            record = dict(
+                record, lookup_index=lookup_index, registered=time.time()
+            )
+            path = self._path(set_id)
+            tmp = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp, "w") as f:
+                json.dump(record, f)
+            os.replace(tmp, path)
+            self._cache.set(set_id, record)
+        return record
+
+
+_FILTER_SETS = None
+
+
+def get_filter_sets():
+    """
+    Return the filter set store, or None when CCDB_FILTER_SET_DIR is not
+    set and filter sets cannot be registered.
+    """
+    global _FILTER_SETS
+    directory = getattr(settings, "CCDB_FILTER_SET_DIR", None)
+    if _FILTER_SETS is None and directory:
+        _FILTER_SETS = FilterSets(
+            directory,
+            ttl=getattr(settings, "CCDB_FILTER_SET_TTL", None),
+            max_sets=getattr(settings, "CCDB_FILTER_SET_MAX_SETS", None),
+        )
+    return _FILTER_SETS
+
+
+def get_filter_set(set_id):
+    """Return a registered filter set's record, or None."""
+    filter_sets = get_filter_sets()
+    if filter_sets is None:
+        return None
+    return filter_sets.get(set_id)
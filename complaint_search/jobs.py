@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from rest_framework.exceptions import APIException
+
+from complaint_search import es_interface
+from complaint_search.cache import canonical_hash, canonical_params
+from complaint_search.defaults import AGG_EXCLUDE_FIELDS
+
+
+log = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+
+# Seconds between status updates while a job is writing its file
+_HEARTBEAT_INTERVAL = 5
+
+# Seconds after which a job's lock file is taken to be left behind by a
+# process that died while holding it
+_LOCK_TIMEOUT = 10
+
+
+class ExportJobs(object):
+    """
+    Run exports in the background and spool their results to disk.
+
+    Each job's state is kept in a JSON status file next to its output, so
+    any worker process sharing `directory` can report on a job or serve
+    its file. A job is identified by its canonical search params and the
+    index version, so identical requests share one job, whether it is
+    still running or finished within the last `ttl` seconds. A running job
+    whose status has not been updated for `stale_after` seconds, such as
+    one whose process died, is started again. Processes take a job's lock
+    file before deciding whether to start it, so only one of them does.
+    """
+
+    def __init__(self, directory, workers=2, ttl=3600, stale_after=300):
+        self.directory = directory
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="export-job"
+        )
+        os.makedirs(directory, exist_ok=True)
+
+    def job_id(self, params):
+        version, _ = es_interface.get_index_version()
+        return canonical_hash([canonical_params(params), version])
+
+    def _status_path(self, job_id):
+        return os.path.join(self.directory, job_id + ".json")
+
+    def file_path(self, job):
+        return os.path.join(
+            self.directory, "{}.{}".format(job["id"], job["format"])
+        )
+
+    def get(self, job_id):
+        try:
+            with open(self._status_path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, job):
+        job["updated"] = time.time()
+        path = self._status_path(job["id"])
+        with open(path + ".tmp", "w") as f:
+            json.dump(job, f)
+        os.replace(path + ".tmp", path)
+
+    @contextmanager
+    def _claim(self, job_id):
+        """Hold a job's lock file, waiting while another process holds it."""
+        path = os.path.join(self.directory, job_id + ".lock")
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                pass
+            try:
+                if time.time() - os.path.getmtime(path) >= _LOCK_TIMEOUT:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.remove(path)
+
+    def _is_current(self, job):
+        if job is None:
+            return False
+        age = time.time() - job["updated"]
+        if job["status"] in (QUEUED, RUNNING):
+            return age < self.stale_after
+        if job["status"] == FINISHED:
+            return age < self.ttl and os.path.exists(self.file_path(job))
+        return False
+
+    def submit(self, params):
+        """
+        Return the job for a validated export request, starting one unless
+        an identical job is already running or finished.
+        """
+        job_id = self.job_id(params)
+        self.purge()
+        with self._claim(job_id):
+            job = self.get(job_id)
+            if self._is_current(job):
+                return job
+            job = {
+                "id": job_id,
+                "format": params["format"],
+                "status": QUEUED,
+                "bytes_written": 0,
+                "error": None,
+                "created": time.time(),
+                "finished": None,
+            }
+            self._save(job)
+        self._executor.submit(self._run, job, dict(params))
+        return job
+
+    def _run(self, job, params):
+        job["status"] = RUNNING
+        self._save(job)
+        path = self.file_path(job)
+        try:
+            res = es_interface.search(agg_exclude=AGG_EXCLUDE_FIELDS, **params)
+            heartbeat = time.monotonic()
+            with open(path + ".part", "wb") as f:
+                try:
+                    for chunk in res.streaming_content:
+                        f.write(chunk)
+                        job["bytes_written"] += len(chunk)
+                        if time.monotonic() - heartbeat >= _HEARTBEAT_INTERVAL:
+                            heartbeat = time.monotonic()
+                            self._save(job)
+                finally:
+                    res.close()
+            os.replace(path + ".part", path)
+            job["status"] = FINISHED
+        except Exception as e:
+            if isinstance(e, APIException):
+                job["error"] = e.detail
+            else:
+                log.exception("Export job %s failed", job["id"])
+                job["error"] = "There was a problem generating your export"
+            job["status"] = FAILED
+            try:
+                os.remove(path + ".part")
+            except OSError:
+                pass
+        job["finished"] = time.time()
+        self._save(job)
+
+    def purge(self):
+        """Remove the files of jobs that finished more than `ttl` ago."""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) >= self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+_EXPORT_JOBS = None
+
+
+def get_export_jobs():
+    global _EXPORT_JOBS
+    if _EXPORT_JOBS is None:
+        _EXPORT_JOBS = ExportJobs(
+            settings.CCDB_EXPORT_JOB_DIR,
+            workers=settings.CCDB_EXPORT_JOB_WORKERS,
+            ttl=settings.CCDB_EXPORT_JOB_TTL,
+        )
+    return _EXPORT_JOBS
@@ -0,0 +1,112 @@
+import timeit
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from complaint_search import es_interface
+from complaint_search.defaults import DELIMITER
+
+
+# A heavily filtered request, so the filter clauses dominate body building
+FILTERS = {
+    "company": ["Bank of America", "Wells Fargo", "JPMorgan Chase"],
+    "company_public_response": ["Company chooses not to provide"],
+    "company_response": ["Closed with explanation"],
+    "has_narrative": ["true"],
+    "issue": [
+        "Incorrect information on your report",
+        "Problem with a purchase"
+        + DELIMITER
+        + "Card was charged for something you did not purchase",
+    ],
+    "product": [
+        "Mortgage" + DELIMITER + "Conventional home mortgage",
+        "Credit card or prepaid card",
+    ],
+    "state": ["CA", "NY", "TX", "VA"],
+    "submitted_via": ["Web", "Phone"],
+    "tags": ["Older American"],
+    "timely": ["Yes"],
+    "zip_code": ["94XXX", "10001"],
+    "not_company": ["Experian"],
+    "not_state": ["FL"],
+    "date_received_min": "2020-01-01",
+    "date_received_max": "2024-01-01",
+    "company_received_min": "2020-01-01",
+    "company_received_max": "2024-01-01",
+}
+
+
+def _params(**kwargs):
+    # Built from the validated params the same way as for a request
+    return es_interface._search_params(**dict(FILTERS, **kwargs))
+
+
+BODIES = {
+    "search": lambda: es_interface._build_search_body(_params()),
+    "states": lambda: es_interface._build_states_body(_params(size=0)),
+    "trends": lambda: es_interface._build_trends_bodies(
+        _params(
+            size=0,
+            lens="product",
+            sub_lens="sub_product",
+            sub_lens_depth=5,
+            trend_interval="month",
+        )
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time how long building the OpenSearch request bodies of a heavily "
+        "filtered search, states and trends request takes, without "
+        "contacting OpenSearch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--number",
+            type=int,
+            default=2000,
+            help="Bodies built per timing run",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Timing runs; the fastest is reported",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Also list the files allocating each request's bodies",
+        )
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        for name, build in BODIES.items():
+            best = min(
+                timeit.repeat(build, number=number, repeat=options["repeat"])
+            )
+            self.stdout.write(
+                "{:<8}{:>10.1f} us per request".format(
+                    name, best / number * 1e6
+                )
+            )
+            if options["profile"]:
+                self.profile(build)
+
+    def profile(self, build):
+        tracemalloc.start()
+        try:
+            # Keep the bodies alive until the snapshot is taken
+            bodies = build()  # noqa: F841
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        snapshot = snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        for stat in snapshot.statistics("filename")[:5]:
+            self.stdout.write("    {}".format(stat))
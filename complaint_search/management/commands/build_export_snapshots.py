@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from complaint_search.defaults import (
+    COMPRESSIBLE_EXPORT_FORMATS,
+    SNAPSHOT_FORMATS,
+)
+from complaint_search.snapshots import build_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Write full-dataset CSV and JSON exports of the current complaint "
+        "index, which the search endpoint serves from disk for unfiltered "
+        "export requests. Run after each index load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--directory",
+            default=getattr(settings, "CCDB_EXPORT_SNAPSHOT_DIR", None),
+            help="Snapshot directory (default: CCDB_EXPORT_SNAPSHOT_DIR)",
+        )
+        parser.add_argument(
+            "--format",
+            action="append",
+            choices=COMPRESSIBLE_EXPORT_FORMATS,
+            dest="formats",
+            help="Format to write; may be repeated (default: csv and json)",
+        )
+        parser.add_argument(
+            "--level",
+            type=int,
+            default=9,
+            help="Compression level for the compressed copies",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild even if the snapshots match the index version",
+        )
+
+    def handle(self, *args, **options):
+        if not options["directory"]:
+            raise CommandError(
+                "Set CCDB_EXPORT_SNAPSHOT_DIR or pass --directory"
+            )
+        manifest = build_snapshots(
+            options["directory"],
+            formats=tuple(options["formats"] or SNAPSHOT_FORMATS),
+            level=options["level"],
+            force=options["force"],
+        )
+        if manifest is None:
+            raise CommandError(
+                "Snapshots are already being built in {}".format(
+                    options["directory"]
+                )
+            )
+        self.stdout.write(
+            "Export snapshots for index version {}: {}".format(
+                manifest["version"], ", ".join(sorted(manifest["files"]))
+            )
+        )
@@ -0,0 +1,131 @@
+import heapq
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Marks the end of a slice in its output queue
+_DONE = object()
+
+
+def _put(out, item, stop):
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(hits, out, stop, batch_size):
+    try:
+        batch = []
+        for hit in hits:
+            batch.append(hit)
+            if len(batch) >= batch_size:
+                if not _put(out, batch, stop):
+                    return
+                batch = []
+        if batch and not _put(out, batch, stop):
+            return
+        _put(out, _DONE, stop)
+    except Exception as e:
+        _put(out, e, stop)
+    finally:
+        close = getattr(hits, "close", None)
+        if close:
+            close()
+
+
+def _drain(out, producers):
+    remaining = producers
+    while remaining:
+        item = out.get()
+        if item is _DONE:
+            remaining -= 1
+        elif isinstance(item, Exception):
+            raise item
+        else:
+            yield from item
+
+
+def _sort_key(hit):
+    return hit["sort"]
+
+
+def prefetch(hits, depth=2, batch_size=1000):
+    """
+    Yield hits while reading ahead of the consumer on a background thread.
+
+    Up to `depth` batches of `batch_size` hits are fetched ahead, so the
+    next page is requested from OpenSearch while the current one is being
+    serialized and sent. Closing the iterator stops the reader thread and
+    closes `hits`.
+    """
+    stop = threading.Event()
+    out = queue.Queue(depth)
+    reader = threading.Thread(
+        target=_produce,
+        args=(hits, out, stop, batch_size),
+        name="export-prefetch",
+        daemon=True,
+    )
+    reader.start()
+    try:
+        yield from _drain(out, 1)
+    finally:
+        stop.set()
+
+
+def sliced_scan(
+    scan_slice,
+    slices,
+    ordered=False,
+    reverse=False,
+    queue_depth=4,
+    batch_size=500,
+):
+    """
+    Yield the hits of a sliced export, fetching the slices in parallel.
+
+    `scan_slice(slice_id, slices)` returns the hit iterator for one slice.
+    Each slice is read by a worker thread into bounded queues holding at
+    most `queue_depth` batches of `batch_size` hits per slice, so memory
+    use does not grow with the size of the export.
+
+    Hits are yielded in arrival order by default. With `ordered`, every
+    slice must be sorted by its hits' `sort` values (descending if
+    `reverse`), and the slices are merged to keep that order.
+
+    Closing the iterator stops the workers and closes their slice
+    iterators.
+    """
+    stop = threading.Event()
+    if ordered:
+        queues = [queue.Queue(queue_depth) for _ in range(slices)]
+    else:
+        queues = [queue.Queue(queue_depth * slices)] * slices
+    executor = ThreadPoolExecutor(
+        max_workers=slices, thread_name_prefix="export-slice"
+    )
+    try:
+        for slice_id in range(slices):
+            executor.submit(
+                _produce,
+                scan_slice(slice_id, slices),
+                queues[slice_id],
+                stop,
+                batch_size,
+            )
+        if ordered:
+            yield from heapq.merge(
+                *(_drain(out, 1) for out in queues),
+                key=_sort_key,
+                reverse=reverse,
+            )
+        else:
+            yield from _drain(queues[0], slices)
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
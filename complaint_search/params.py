@@ -0,0 +1,50 @@
+from collections.abc import Mapping
+
+from complaint_search.defaults import PARAMS
+
+
+class SearchParams(Mapping):
+    """
+    An immutable mapping of a request's validated params over PARAMS.
+
+    One instance is built per request and shared by every body builder, so
+    the defaults are never deep-copied. The mapping itself cannot be
+    changed; `replace()` returns a new instance with some params changed.
+    The lists of filter values are shared with the validated data, and are
+    never modified by the builders.
+    """
+
+    __slots__ = ("_params",)
+
+    def __init__(self, *args, **kwargs):
+        # PARAMS only holds immutable values, so a shallow copy is enough
+        params = dict(PARAMS)
+        params.update(*args, **kwargs)
+        object.__setattr__(self, "_params", params)
+
+    def __getitem__(self, key):
+        return self._params[key]
+
+    def __iter__(self):
+        return iter(self._params)
+
+    def __len__(self):
+        return len(self._params)
+
+    def __contains__(self, key):
+        return key in self._params
+
+    def get(self, key, default=None):
+        return self._params.get(key, default)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SearchParams are immutable")
+
+    __delattr__ = __setattr__
+
+    def __repr__(self):
+        return "SearchParams({!r})".format(self._params)
+
+    def replace(self, **changes):
+        """Return a copy of these params with `changes` applied."""
+        return SearchParams(self._params, **changes)
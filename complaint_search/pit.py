@@ -0,0 +1,86 @@
+import logging
+
+from opensearchpy import TransportError
+
+
+log = logging.getLogger(__name__)
+
+# Used when the query has no sort of its own. search_after needs a sort
+# that is unique per document.
+DEFAULT_SORT = [{"_id": {"order": "asc"}}]
+
+# Search body keys that do not apply to an export of the matching hits
+_EXCLUDED_KEYS = ("aggs", "highlight", "search_after", "track_total_hits")
+
+
+def open_pit(client, index, keep_alive="1m", request_timeout=None):
+    kwargs = {}
+    if request_timeout:
+        kwargs["request_timeout"] = request_timeout
+    res = client.create_pit(index=index, keep_alive=keep_alive, **kwargs)
+    return res["pit_id"]
+
+
+def close_pit(client, pit_id):
+    try:
+        client.delete_pit(body={"pit_id": [pit_id]})
+    except TransportError as te:
+        log.warning("Unable to delete point in time: %s", te)
+
+
+def pit_scan(
+    client,
+    query,
+    index,
+    size=1000,
+    keep_alive="1m",
+    request_timeout=None,
+    pit_id=None,
+    search_after=None,
+):
+    """
+    Yield every hit matching a search body from a point-in-time snapshot.
+
+    Unlike helpers.scan, which holds a scroll context open between pages,
+    this pages through a point in time (OpenSearch 2.4+) with search_after
+    using the body's sort. The point in time only needs to stay alive for
+    `keep_alive` between pages, and it is deleted as soon as the iterator
+    is exhausted or closed.
+
+    Pass `pit_id` to page through an existing point in time, such as one
+    shared by the slices of a sliced export. It is left open for the caller
+    to close.
+
+    Pass the sort values of a hit as `search_after` to start after it.
+    """
+    # Only top-level keys are set below, so the query's values are shared
+    body = {
+        key: value
+        for key, value in query.items()
+        if key not in _EXCLUDED_KEYS
+    }
+    body["size"] = size
+    body.setdefault("sort", DEFAULT_SORT)
+    if search_after is not None:
+        body["search_after"] = search_after
+    kwargs = {}
+    if request_timeout:
+        kwargs["request_timeout"] = request_timeout
+
+    owns_pit = pit_id is None
+    if owns_pit:
+        pit_id = open_pit(client, index, keep_alive, request_timeout)
+    try:
+        while True:
+            body["pit"] = {"id": pit_id, "keep_alive": keep_alive}
+            res = client.search(body=body, **kwargs)
+            if owns_pit:
+                pit_id = res.get("pit_id", pit_id)
+            hits = res["hits"]["hits"]
+            yield from hits
+            if len(hits) < size:
+                break
+            body["search_after"] = hits[-1]["sort"]
+    finally:
+        if owns_pit:
+            close_pit(client, pit_id)
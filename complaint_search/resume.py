@@ -0,0 +1,250 @@
+"""
+Resume interrupted exports with HTTP Range requests.
+
+An export streamed through a point in time is sorted by its sort values
+and _id, so it can be continued after any row with search_after. While an
+export is sent, checkpoints pairing a byte offset with the sort values of
+the row ending there are stored in a cache under the export's key, which is
+also sent as its ETag. A request for `Range: bytes=N-` restarts the scan
+after the last checkpoint at or before N, and drops the bytes between the
+checkpoint and N. A 206 must give the export's full length in its
+Content-Range, so only an export that has been sent whole at least once can
+be resumed with a Range request; until then one is answered with the whole
+export.
+
+An export that has never been sent whole is resumed with a token instead:
+the request repeated with `resume=<ETag>:<N>`, the ETag without its quotes
+and N the number of bytes received, is answered with a 200 carrying the
+rest of the export from byte N.
+
+Exports are only resumable with EXPORT_ENGINE=pit and no slices, and the
+checkpoints must be stored in a cache all processes share.
+"""
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+
+from complaint_search import es_interface
+from complaint_search.cache import canonical_hash, canonical_params
+from complaint_search.defaults import RESUMABLE_EXPORT_FORMATS
+
+
+# The query parameter of a resume token
+RESUME_PARAM = "resume"
+
+_TOKEN = re.compile(r"^([0-9a-f]{40}):(\d+)$")
+
+
+def _cache():
+    return caches[getattr(settings, "CCDB_EXPORT_CURSOR_CACHE", "default")]
+
+
+def _ttl():
+    return getattr(settings, "CCDB_EXPORT_CURSOR_TTL", 3600)
+
+
+def is_resumable(format):
+    """Return whether exports in `format` are sent in a resumable order."""
+    return (
+        format in RESUMABLE_EXPORT_FORMATS
+        and es_interface._EXPORT_ENGINE == "pit"
+        and es_interface._EXPORT_SLICES == 1
+    )
+
+
+def export_key(params, version):
+    return canonical_hash(["export", canonical_params(params), version])
+
+
+def etag(key):
+    return '"{}"'.format(key)
+
+
+def query_signature(query_params):
+    return canonical_hash(
+        sorted(
+            (key, sorted(query_params.getlist(key)))
+            for key in query_params
+            if key != RESUME_PARAM
+        )
+    )
+
+
+def parse_resume_token(token):
+    """Return the export key and offset of a `<key>:<N>` resume token."""
+    match = _TOKEN.match(token or "")
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def parse_resume_offset(range_header):
+    """
+    Return N for a `bytes=N-` Range header. Other ranges are not
+    resumable, and are answered with the whole export.
+    """
+    units, _, ranges = (range_header or "").partition("=")
+    start, dash, end = ranges.strip().partition("-")
+    if units.strip() != "bytes" or not dash or end or not start.isdigit():
+        return None
+    return int(start)
+
+
+def _if_range_key(request):
+    if_range = request.META.get("HTTP_IF_RANGE", "")
+    if if_range.startswith('"') and if_range.endswith('"'):
+        return if_range[1:-1]
+    return None
+
+
+def _sent(entry):
+    """Return how far an export is known to have been sent."""
+    if entry["length"] is not None:
+        return entry["length"]
+    return max(
+        [entry.get("sent", 0)]
+        + [checkpoint[0] for checkpoint in entry["checkpoints"]]
+    )
+
+
+def _restart_point(offset, entry):
+    start, sort = 0, None
+    for checkpoint_offset, checkpoint_sort in entry["checkpoints"]:
+        if checkpoint_offset > offset:
+            break
+        start, sort = checkpoint_offset, checkpoint_sort
+    return offset, start, sort, entry
+
+
+def resume_point(request, key):
+    """
+    Return where a Range request continues export `key`, as the requested
+    offset, the offset and sort values of the checkpoint to restart from,
+    and the stored checkpoints. Returns None to send the whole export,
+    including while its length is unknown.
+    """
+    offset = parse_resume_offset(request.META.get("HTTP_RANGE"))
+    if offset is None:
+        return None
+    if "HTTP_IF_RANGE" in request.META and _if_range_key(request) != key:
+        return None
+    entry = _cache().get(key)
+    if entry is None or entry["length"] is None:
+        return None
+    return _restart_point(offset, entry)
+
+
+def token_point(token, key):
+    """
+    Like resume_point, for a parsed resume token. Returns None if the token
+    is for another export, or past what has been sent of this one.
+    """
+    token_key, offset = token
+    if token_key != key:
+        return None
+    entry = _cache().get(key)
+    if entry is None or offset > _sent(entry):
+        return None
+    return _restart_point(offset, entry)
+
+
+def content_range(offset, length):
+    """Return the Content-Range of an export resumed at `offset`."""
+    return "bytes {}-{}/{}".format(offset, length - 1, length)
+
+
+def is_resumed_export(request, ident):
+    """
+    Return whether a request resumes an export that was started with the
+    same query, so export throttles can let it through. Only a resume
+    token, or a range of an export that has been sent whole, past the
+    start and within what has been sent is a resume; anything else costs
+    as much as a new export. A client may resume each export
+    CCDB_EXPORT_MAX_RESUMES times.
+    """
+    token = parse_resume_token(request.query_params.get(RESUME_PARAM))
+    if token is not None:
+        key, offset = token
+    else:
+        key = _if_range_key(request)
+        offset = parse_resume_offset(request.META.get("HTTP_RANGE"))
+    if key is None or not offset:
+        return False
+    cache = _cache()
+    entry = cache.get(key)
+    if (
+        entry is None
+        or entry["query"] != query_signature(request.query_params)
+        or (token is None and entry["length"] is None)
+        or offset > _sent(entry)
+    ):
+        return False
+    resumes_key = "{}:resumes:{}".format(key, ident)
+    # Counted atomically, so concurrent resumes cannot share one count
+    cache.add(resumes_key, 0, _ttl())
+    try:
+        resumes = cache.incr(resumes_key)
+    except ValueError:
+        # Evicted since it was added
+        cache.add(resumes_key, 1, _ttl())
+        resumes = 1
+    return resumes <= getattr(settings, "CCDB_EXPORT_MAX_RESUMES", 3)
+
+
+def checkpointed(chunks, key, query, cursor, start=0, entry=None):
+    """
+    Yield an export's chunks as bytes, storing a checkpoint for `key` about
+    every CCDB_EXPORT_CHECKPOINT_INTERVAL bytes with the sort values of the
+    last row sent, read from `cursor`. The export's length is stored once
+    the last chunk has been sent, and how far it got if it is interrupted.
+
+    Checkpoints are only added past the furthest one already stored, so
+    streams of the same export from different requests extend one list.
+    """
+    cache = _cache()
+    ttl = _ttl()
+    interval = getattr(settings, "CCDB_EXPORT_CHECKPOINT_INTERVAL", 1048576)
+    if entry is None:
+        entry = cache.get(key) or {"checkpoints": [], "length": None}
+    entry["query"] = query
+    offset = start
+    last = max(
+        [start] + [checkpoint[0] for checkpoint in entry["checkpoints"]]
+    )
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            offset += len(chunk)
+            yield chunk
+            if offset - last >= interval and "sort" in cursor:
+                entry["checkpoints"].append([offset, cursor["sort"]])
+                cache.set(key, entry, ttl)
+                last = offset
+        entry["length"] = offset
+        cache.set(key, entry, ttl)
+    finally:
+        if entry["length"] is None and offset > entry.get("sent", 0):
+            entry["sent"] = offset
+            cache.set(key, entry, ttl)
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+def skip_bytes(chunks, count):
+    """Drop the first `count` bytes of a stream of byte chunks."""
+    try:
+        for chunk in chunks:
+            if count:
+                if len(chunk) <= count:
+                    count -= len(chunk)
+                    continue
+                chunk = chunk[count:]
+                count = 0
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
@@ -1,7 +1,15 @@
+from django.conf import settings
+
 from localflavor.us.us_states import STATE_CHOICES
 from rest_framework import serializers
 
-from complaint_search.defaults import DATA_SUB_LENS_MAP, PARAMS
+from complaint_search.defaults import (
+    DATA_SUB_LENS_MAP,
+    EXPORT_FORMATS,
+    PARAMS,
+    SOURCE_FIELDS,
+)
+from complaint_search.filter_sets import get_filter_set
 
 
 class SearchInputSerializer(serializers.Serializer):
@@ -10,11 +18,15 @@ class SearchInputSerializer(serializers.Serializer):
     FORMAT_DEFAULT = "default"
     FORMAT_JSON = "json"
     FORMAT_CSV = "csv"
+    FORMAT_NDJSON = "ndjson"
+    FORMAT_PARQUET = "parquet"
 
     FORMAT_CHOICES = (
         (FORMAT_DEFAULT, "DEFAULT"),
         (FORMAT_JSON, "JSON"),
         (FORMAT_CSV, "CSV"),
+        (FORMAT_NDJSON, "NDJSON"),
+        (FORMAT_PARQUET, "PARQUET"),
     )
 
     # Field Choices
@@ -96,8 +108,14 @@ class SearchInputSerializer(serializers.Serializer):
     tags = serializers.ListField(
         child=serializers.CharField(max_length=200), required=False
     )
+    filter_set = serializers.RegexField(r"^[0-9a-f]{40}$", required=False)
     no_aggs = serializers.BooleanField(default=PARAMS["no_aggs"])
     no_highlight = serializers.BooleanField(default=PARAMS["no_highlight"])
+    fields = serializers.ListField(
+        child=serializers.ChoiceField(SOURCE_FIELDS),
+        allow_empty=False,
+        required=False,
+    )
 
     # oh these had to be Python variables
     # couldn't just get away with a '-' prefix >:(
@@ -166,17 +184,65 @@ class SearchInputSerializer(serializers.Serializer):
 
         return value
 
+    def validate_filter_set(self, value):
+        if get_filter_set(value) is None:
+            raise serializers.ValidationError("Unknown filter set")
+        return value
+
     def validate(self, data):
         """
-        Check that from is a multiple of size
+        Check that from is a multiple of size, and that an export asks for
+        at least one exported field
         """
         if data["size"] != 0 and data["frm"] % data["size"] != 0:
             raise serializers.ValidationError(
                 "frm is not zero or a multiple of size"
             )
+        if (
+            data.get("format") in EXPORT_FORMATS
+            and data.get("fields")
+            and set(data["fields"]) == {"has_narrative"}
+        ):
+            raise serializers.ValidationError(
+                {"fields": ["has_narrative is not included in exports"]}
+            )
         return data
 
 
+class FilterSetSerializer(serializers.Serializer):
+    # The list filters of a search, which a filter set holds values for
+    FILTERS = tuple(
+        name
+        for name, field in SearchInputSerializer._declared_fields.items()
+        if isinstance(field, serializers.ListField) and name != "fields"
+    )
+
+    name = serializers.CharField(max_length=200, required=False)
+    filters = serializers.DictField(
+        child=serializers.ListField(allow_empty=False), allow_empty=False
+    )
+
+    def validate_filters(self, value):
+        """
+        Check that the filters are search filters with no more than
+        CCDB_FILTER_SET_MAX_VALUES values, validated like a search's
+        """
+        unknown = sorted(set(value) - set(self.FILTERS))
+        if unknown:
+            raise serializers.ValidationError(
+                "Not a filter: {}".format(", ".join(unknown))
+            )
+        max_values = getattr(settings, "CCDB_FILTER_SET_MAX_VALUES", 10000)
+        if sum(len(values) for values in value.values()) > max_values:
+            raise serializers.ValidationError(
+                "A filter set holds at most {} values".format(max_values)
+            )
+        search = SearchInputSerializer(data=value)
+        if not search.is_valid():
+            raise serializers.ValidationError(search.errors)
+        return {key: search.validated_data[key] for key in value}
+
+
 class SuggestInputSerializer(serializers.Serializer):
     text = serializers.CharField(max_length=200, required=False)
     size = serializers.IntegerField(
@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import date
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from rest_framework.exceptions import ValidationError
+
+from complaint_search import es_interface
+from complaint_search.cache import canonical_hash, canonical_params
+from complaint_search.compression import available_encodings, compress_stream
+from complaint_search.defaults import (
+    AGG_EXCLUDE_FIELDS,
+    MAX_DOWNLOAD_SIZE,
+    SNAPSHOT_FORMATS,
+)
+from complaint_search.serializer import SearchInputSerializer
+
+
+log = logging.getLogger(__name__)
+
+MANIFEST = "current.json"
+
+# Params that do not change the rows of an unfiltered export
+_IGNORED_PARAMS = (
+    "field",
+    "format",
+    "frm",
+    "no_aggs",
+    "no_highlight",
+    "page",
+    "search_after",
+    "size",
+)
+_DATE_PARAMS = ("date_received_min", "date_received_max")
+
+# A build holding the lock for longer than this is assumed to have died
+_LOCK_STALE_AFTER = 6 * 3600
+
+# Bytes read at a time when compressing a snapshot
+_READ_SIZE = 1024 * 1024
+
+_ENCODING_EXTENSIONS = {"gzip": "gz", "zstd": "zst"}
+
+
+def _snapshot_dir():
+    return getattr(settings, "CCDB_EXPORT_SNAPSHOT_DIR", None)
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def covers(params, manifest):
+    """
+    Return whether a snapshot contains exactly the rows an export with the
+    validated `params` would, in the same order.
+
+    That is the case for unfiltered exports in the default sort order, and
+    for ones whose only filter is a date_received range spanning every
+    complaint in the snapshot.
+    """
+    canonical = canonical_params(params)
+    for key in canonical:
+        if key not in _IGNORED_PARAMS and key not in _DATE_PARAMS:
+            return False
+    date_min = canonical.get("date_received_min")
+    if date_min and (
+        manifest["date_received_min"] is None
+        or date_min > date.fromisoformat(manifest["date_received_min"])
+    ):
+        return False
+    # A date_received_max filter excludes complaints received later on
+    # that day, so it must fall after the last day in the snapshot.
+    date_max = canonical.get("date_received_max")
+    if date_max and (
+        manifest["date_received_max"] is None
+        or date_max <= date.fromisoformat(manifest["date_received_max"])
+    ):
+        return False
+    return True
+
+
+def find(params):
+    """
+    Return the files of the current snapshot that can be served for an
+    export with the validated `params`, keyed by content coding ("identity"
+    for the uncompressed file), or None.
+    """
+    directory = _snapshot_dir()
+    if not directory:
+        return None
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    files = manifest["files"].get(params["format"])
+    if not files:
+        return None
+    if (
+        params["format"] == "json"
+        and es_interface._EXPORT_ENFORCE_LIMIT
+        and manifest["record_count"] > MAX_DOWNLOAD_SIZE
+    ):
+        return None
+    if manifest["version"] != es_interface.get_index_version()[0]:
+        return None
+    if not covers(params, manifest):
+        return None
+    return {
+        coding: os.path.join(directory, manifest["path"], name)
+        for coding, name in files.items()
+    }
+
+
+def _date_received_range():
+    body = {
+        "size": 0,
+        "aggs": {
+            "min": {"min": {"field": "date_received", "format": "yyyy-MM-dd"}},
+            "max": {"max": {"field": "date_received", "format": "yyyy-MM-dd"}},
+        },
+    }
+    res = es_interface._get_es().search(
+        index=es_interface._COMPLAINT_ES_INDEX,
+        body=body,
+        **es_interface._timeout("search"),
+    )
+    aggs = res["aggregations"]
+    return (
+        aggs["min"].get("value_as_string"),
+        aggs["max"].get("value_as_string"),
+    )
+
+
+def _write_export(path, format):
+    serializer = SearchInputSerializer(data={"format": format})
+    serializer.is_valid(raise_exception=True)
+    res = es_interface.search(
+        agg_exclude=AGG_EXCLUDE_FIELDS, **serializer.validated_data
+    )
+    with open(path, "wb") as f:
+        try:
+            for chunk in res.streaming_content:
+                f.write(chunk)
+        finally:
+            res.close()
+
+
+def _read_chunks(path):
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(_READ_SIZE)
+            if not data:
+                break
+            yield data
+
+
+def _write_compressed(path, encoding, level):
+    compressed_path = "{}.{}".format(path, _ENCODING_EXTENSIONS[encoding])
+    with open(compressed_path, "wb") as f:
+        for data in compress_stream(_read_chunks(path), encoding, level):
+            f.write(data)
+    return os.path.basename(compressed_path)
+
+
+class _BuildLock(object):
+    def __init__(self, directory):
+        self.path = os.path.join(directory, "build.lock")
+
+    def acquire(self):
+        try:
+            if time.time() - os.path.getmtime(self.path) >= _LOCK_STALE_AFTER:
+                os.remove(self.path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(self.path, os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            return False
+        return True
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def build_snapshots(
+    directory=None, formats=SNAPSHOT_FORMATS, level=9, force=False
+):
+    """
+    Write full-dataset exports of the current index to `directory`.
+
+    Each format is written uncompressed and with every available content
+    coding, then `current.json` is switched to the new files and older
+    snapshots are removed. Returns the manifest, or None if another
+    process is already building snapshots in the directory.
+    """
+    directory = directory or _snapshot_dir()
+    os.makedirs(directory, exist_ok=True)
+    lock = _BuildLock(directory)
+    if not lock.acquire():
+        log.info("Export snapshots are already being built in %s", directory)
+        return None
+    try:
+        version, last_indexed = es_interface.get_index_version()
+        manifest = read_manifest(directory)
+        if (
+            not force
+            and manifest is not None
+            and manifest["version"] == version
+            and all(format in manifest["files"] for format in formats)
+        ):
+            return manifest
+
+        date_min, date_max = _date_received_range()
+        name = canonical_hash(version)
+        build_dir = os.path.join(directory, name + ".tmp")
+        shutil.rmtree(build_dir, ignore_errors=True)
+        os.makedirs(build_dir)
+        files = {}
+        for format in formats:
+            filename = "complaints." + format
+            path = os.path.join(build_dir, filename)
+            try:
+                _write_export(path, format)
+            except ValidationError as e:
+                log.warning(
+                    "Skipping the %s export snapshot: %s", format, e.detail
+                )
+                continue
+            files[format] = {"identity": filename}
+            for encoding in available_encodings():
+                files[format][encoding] = _write_compressed(
+                    path, encoding, level
+                )
+
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        os.replace(build_dir, os.path.join(directory, name))
+        manifest = {
+            "version": version,
+            "last_indexed": last_indexed,
+            "path": name,
+            "record_count": es_interface._get_cached_index_stats()[
+                "total_record_count"
+            ],
+            "date_received_min": date_min,
+            "date_received_max": date_max,
+            "files": files,
+            "built": time.time(),
+        }
+        _write_manifest(directory, manifest)
+        for entry in os.listdir(directory):
+            path = os.path.join(directory, entry)
+            if entry != name and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        log.info("Built export snapshots for index version %s", version)
+        return manifest
+    finally:
+        lock.release()
+
+
+def _build_in_background():
+    try:
+        build_snapshots()
+    except Exception:
+        log.exception("Unable to build export snapshots")
+
+
+@receiver(es_interface.index_refreshed)
+def _build_on_refresh(sender, **kwargs):
+    if not _snapshot_dir() or not getattr(
+        settings, "CCDB_EXPORT_SNAPSHOT_ON_REFRESH", False
+    ):
+        return
+    threading.Thread(
+        target=_build_in_background, name="export-snapshots", daemon=True
+    ).start()
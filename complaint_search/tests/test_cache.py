@@ -0,0 +1,91 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from complaint_search.cache import (
+    GenerationCache,
+    IndexGeneration,
+    canonical_hash,
+    canonical_params,
+)
+
+
+class CanonicalHashTests(SimpleTestCase):
+    def test_key_order_does_not_matter(self):
+        self.assertEqual(
+            canonical_hash({"a": 1, "b": [1, 2]}),
+            canonical_hash({"b": [1, 2], "a": 1}),
+        )
+
+    def test_values_matter(self):
+        self.assertNotEqual(
+            canonical_hash({"a": [1, 2]}), canonical_hash({"a": [2, 1]})
+        )
+
+
+class CanonicalParamsTests(SimpleTestCase):
+    def test_lists_sorted_defaults_dropped(self):
+        self.assertEqual(
+            {"company": ["A", "B"], "field": "all"},
+            canonical_params(
+                {
+                    "company": ["B", "A"],
+                    "field": "_all",
+                    "size": 25,
+                    "no_aggs": False,
+                }
+            ),
+        )
+
+
+class IndexGenerationTests(SimpleTestCase):
+    def test_first_observation_does_not_bump(self):
+        generation = IndexGeneration()
+        self.assertEqual(0, generation.observe("last_indexed", "2020-01-01"))
+
+    def test_changed_signal_bumps(self):
+        generation = IndexGeneration()
+        generation.observe("last_indexed", "2020-01-01")
+        generation.observe("last_indexed", "2020-01-01")
+        self.assertEqual(0, generation.value)
+        generation.observe("last_indexed", "2020-01-02")
+        self.assertEqual(1, generation.value)
+
+    def test_is_due(self):
+        generation = IndexGeneration()
+        self.assertTrue(generation.is_due("alias", 60))
+        generation.observe("alias", "index-v1")
+        self.assertFalse(generation.is_due("alias", 60))
+
+
+class GenerationCacheTests(SimpleTestCase):
+    def test_get_set(self):
+        cache = GenerationCache()
+        cache.set("key", "value", 1)
+        self.assertEqual("value", cache.get("key", 1))
+
+    def test_generation_mismatch_evicts(self):
+        cache = GenerationCache()
+        cache.set("key", "value", 1)
+        self.assertIsNone(cache.get("key", 2))
+        self.assertEqual(0, len(cache))
+
+    def test_ttl_expiry(self):
+        cache = GenerationCache(ttl=10)
+        with mock.patch("complaint_search.cache.time.monotonic") as now:
+            now.return_value = 100
+            cache.set("key", "value")
+            now.return_value = 105
+            self.assertEqual("value", cache.get("key"))
+            now.return_value = 110
+            self.assertIsNone(cache.get("key"))
+
+    def test_lru_eviction(self):
+        cache = GenerationCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(1, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(3, cache.get("c"))
@@ -0,0 +1,83 @@
+import gzip
+import zlib
+from unittest import skipIf
+
+from django.test import SimpleTestCase
+
+from complaint_search.compression import (
+    available_encodings,
+    compress_stream,
+    negotiate_encoding,
+    zstandard,
+)
+
+
+class NegotiateEncodingTests(SimpleTestCase):
+    def test_no_header(self):
+        self.assertIsNone(negotiate_encoding(None, ("zstd", "gzip")))
+        self.assertIsNone(negotiate_encoding("", ("zstd", "gzip")))
+
+    def test_preference_order(self):
+        self.assertEqual(
+            "zstd", negotiate_encoding("gzip, zstd, br", ("zstd", "gzip"))
+        )
+        self.assertEqual(
+            "gzip", negotiate_encoding("gzip, deflate", ("zstd", "gzip"))
+        )
+
+    def test_quality_values(self):
+        self.assertEqual(
+            "gzip",
+            negotiate_encoding("zstd;q=0.5, gzip;q=0.8", ("zstd", "gzip")),
+        )
+        self.assertIsNone(negotiate_encoding("gzip;q=0", ("gzip",)))
+        self.assertIsNone(negotiate_encoding("gzip;q=x", ("gzip",)))
+
+    def test_wildcard(self):
+        self.assertEqual("zstd", negotiate_encoding("*", ("zstd", "gzip")))
+        self.assertEqual(
+            "gzip", negotiate_encoding("*, zstd;q=0", ("zstd", "gzip"))
+        )
+
+    def test_available_encodings(self):
+        self.assertEqual("gzip", available_encodings()[-1])
+
+
+class CompressStreamTests(SimpleTestCase):
+    def test_gzip(self):
+        chunks = ["a,b\r\n" * 1000, "c,d\r\n" * 1000]
+        data = b"".join(compress_stream(iter(chunks), "gzip", level=6))
+        self.assertEqual(
+            "".join(chunks).encode("utf-8"), gzip.decompress(data)
+        )
+        self.assertLess(len(data), 200)
+
+    def test_gzip_chunks_are_flushed(self):
+        stream = compress_stream(iter(["first", b"second"]), "gzip")
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(b"first", decompressor.decompress(next(stream)))
+        self.assertEqual(b"second", decompressor.decompress(next(stream)))
+
+    @skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        chunks = ["a,b\r\n" * 1000, "c,d\r\n" * 1000]
+        data = b"".join(compress_stream(iter(chunks), "zstd", level=3))
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        self.assertEqual(
+            "".join(chunks).encode("utf-8"), decompressor.decompress(data)
+        )
+
+    def test_close_closes_chunks(self):
+        closed = []
+
+        def chunks():
+            try:
+                yield "first"
+                yield "second"
+            finally:
+                closed.append(True)
+
+        stream = compress_stream(chunks(), "gzip")
+        next(stream)
+        stream.close()
+        self.assertEqual([True], closed)
@@ -0,0 +1,403 @@
+import asyncio
+import threading
+from datetime import date
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from opensearchpy import OpenSearch
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from complaint_search import es_interface
+from complaint_search.cost import (
+    ADMIT,
+    DOWNGRADE,
+    QUEUE,
+    REJECT,
+    QueryCost,
+    QueryQueue,
+    QueryQueueFull,
+    QueryTooExpensive,
+    decide,
+    estimate,
+)
+from complaint_search.throttling import SearchAnonRateThrottle
+
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+TODAY = date(2021, 12, 31)
+
+SEARCH_RESPONSE = {"hits": {"total": {"value": 1}, "hits": [{}]}}
+
+
+def _search_body(**kwargs):
+    params = es_interface._search_params(**kwargs)
+    return es_interface._build_search_body(params, ["zip_code"])
+
+
+def _trends_body(**kwargs):
+    params = es_interface._request_params(
+        dict({"lens": "overview", "trend_interval": "month"}, **kwargs),
+        size=0,
+    )
+    return es_interface._build_trends_bodies(params)[0]
+
+
+class EstimateTests(SimpleTestCase):
+    def test_clauses(self):
+        cost = estimate(
+            {
+                "query": {"match_all": {}},
+                "post_filter": {
+                    "bool": {
+                        "must": [
+                            {"terms": {"company.raw": ["A", "B", "C"]}},
+                            {"range": {"date_received": {"from": "2020"}}},
+                        ],
+                        "must_not": [
+                            {
+                                "terms": {
+                                    "state": {
+                                        "index": "filter-sets",
+                                        "id": "a" * 40,
+                                        "path": "state",
+                                    }
+                                }
+                            }
+                        ],
+                    }
+                },
+            }
+        )
+        self.assertEqual(5, cost.clauses)
+
+    def test_clause_options(self):
+        cost = estimate(
+            {
+                "query": {
+                    "bool": {
+                        "should": {
+                            "terms": {"boost": 2, "state": ["CA", "NY"]}
+                        },
+                        "filter": [
+                            {"wildcard": {"company": {"value": "*bank"}}}
+                        ],
+                        "minimum_should_match": 1,
+                        "boost": 1.5,
+                    }
+                }
+            }
+        )
+        self.assertEqual(3, cost.clauses)
+        self.assertEqual(1, cost.wildcards)
+
+    def test_filters_repeat_in_facets(self):
+        cost = estimate(_search_body(state=["CA", "NY"]))
+        # The post filter and the nine facets other than state
+        self.assertEqual(20, cost.clauses)
+
+    def test_leading_wildcards(self):
+        self.assertEqual(
+            1, estimate(_search_body(search_term="*bank")).wildcards
+        )
+        self.assertEqual(
+            2,
+            estimate(
+                _search_body(search_term="bank AND (?redit OR *loan)")
+            ).wildcards,
+        )
+        self.assertEqual(
+            0, estimate(_search_body(search_term="ban*")).wildcards
+        )
+        cost = estimate({"query": {"wildcard": {"company": "*bank*"}}})
+        self.assertEqual(1, cost.wildcards)
+
+    def test_facet_buckets(self):
+        cost = estimate(_search_body())
+        self.assertEqual(7230, cost.term_buckets)
+        # The ZIP code facet is turned back on by a ZIP code filter
+        params = es_interface._search_params(zip_code=["20001"])
+        body = es_interface._build_search_body(params)
+        self.assertEqual(33230, estimate(body).term_buckets)
+
+    def test_hits(self):
+        cost = estimate(_search_body(size=100))
+        self.assertEqual(100, cost.hits)
+        self.assertEqual(100, cost.highlights)
+        cost = estimate(_search_body(size=100, no_highlight=True))
+        self.assertEqual(0, cost.highlights)
+
+    def test_histogram_span_and_interval(self):
+        # Two brush and area histograms, and five for each of five lenses
+        cost = estimate(_trends_body(), today=TODAY)
+        # Months are counted as 30 days
+        self.assertEqual(27 * 123, cost.histogram_buckets)
+        cost = estimate(_trends_body(trend_interval="year"), today=TODAY)
+        self.assertEqual(27 * 11, cost.histogram_buckets)
+        cost = estimate(
+            _trends_body(
+                trend_interval="day",
+                date_received_min="2021-12-01",
+                date_received_max="2021-12-11",
+            ),
+            today=TODAY,
+        )
+        # The brush histogram is not filtered by date
+        self.assertEqual(26 * 11 + 3684, cost.histogram_buckets)
+
+    def test_trend_depth(self):
+        cost = estimate(
+            _trends_body(
+                lens="product",
+                sub_lens="sub_product",
+                sub_lens_depth=10,
+                trend_depth=10000000,
+                trend_interval="year",
+            ),
+            today=TODAY,
+        )
+        self.assertLess(1e7, cost.term_buckets)
+        self.assertLess(1e8, cost.histogram_buckets)
+
+    def test_total(self):
+        cost = QueryCost(clauses=10, wildcards=1, hits=25, highlights=25)
+        self.assertEqual(5051, cost.total)
+        self.assertEqual(5051, cost.as_dict()["total"])
+        self.assertIn("wildcards=1", repr(cost))
+
+
+class DecideTests(SimpleTestCase):
+    def test_decide(self):
+        limits = (None, 1000, 10000)
+        for total, decision in (
+            (99, ADMIT),
+            (1000, QUEUE),
+            (10000, REJECT),
+        ):
+            self.assertEqual(decision, decide(QueryCost(hits=total), *limits))
+
+    def test_downgrade_comes_first(self):
+        limits = (100, 1000, 10000)
+        for total in (100, 1000, 10000):
+            self.assertEqual(
+                DOWNGRADE, decide(QueryCost(hits=total), *limits)
+            )
+
+    def test_unset_limits(self):
+        self.assertEqual(ADMIT, decide(QueryCost(hits=1e9)))
+
+
+class QueryQueueTests(SimpleTestCase):
+    def test_slots(self):
+        queue = QueryQueue(1, timeout=0.01)
+        with queue.slot():
+            with self.assertRaises(QueryQueueFull):
+                queue.acquire()
+        queue.acquire()
+        queue.release()
+
+    async def test_acquire_async(self):
+        queue = QueryQueue(1, timeout=0.05)
+        await queue.acquire_async()
+        with self.assertRaises(QueryQueueFull):
+            await queue.acquire_async()
+        queue.release()
+        await queue.acquire_async()
+        queue.release()
+
+    async def test_cancelled_acquire_async_takes_no_slot(self):
+        queue = QueryQueue(1, timeout=5)
+        queue.acquire()
+        waiter = asyncio.ensure_future(queue.acquire_async(0.01))
+        await asyncio.sleep(0.03)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        queue.release()
+        await asyncio.sleep(0.03)
+        # The slot freed after the cancellation is still available
+        queue.acquire()
+        queue.release()
+
+    def test_waits_for_a_slot(self):
+        queue = QueryQueue(1, timeout=5)
+        queue.acquire()
+        threading.Timer(0.05, queue.release).start()
+        queue.acquire()
+        queue.release()
+
+
+@mock.patch.object(OpenSearch, "search")
+class AdmissionTests(SimpleTestCase):
+    def setUp(self):
+        es_interface._reset_caches()
+        es_interface._QUERY_QUEUE = None
+
+    def tearDown(self):
+        es_interface._QUERY_QUEUE = None
+
+    @mock.patch("complaint_search.es_interface._get_meta", return_value={})
+    def test_cheap_search_is_admitted(self, mock_meta, mock_search):
+        mock_search.return_value = SEARCH_RESPONSE
+        with self.assertLogs("complaint_search.es_interface", "INFO") as cm:
+            res = es_interface.search()
+        self.assertIn("aggs", mock_search.call_args[1]["body"])
+        self.assertNotIn("downgraded", res["_meta"])
+        self.assertTrue(
+            any("Query cost of search" in line for line in cm.output)
+        )
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_REJECT", 1)
+    @mock.patch("complaint_search.es_interface.estimate_cost")
+    @mock.patch("complaint_search.es_interface._get_meta", return_value={})
+    def test_estimate_error_is_admitted(
+        self, mock_meta, mock_estimate, mock_search
+    ):
+        mock_estimate.side_effect = ValueError
+        mock_search.return_value = SEARCH_RESPONSE
+        with self.assertLogs("complaint_search.es_interface", "ERROR"):
+            es_interface.search()
+        mock_search.assert_called_once()
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_DOWNGRADE", 500)
+    @mock.patch("complaint_search.es_interface._get_meta", return_value={})
+    def test_search_is_downgraded(self, mock_meta, mock_search):
+        mock_search.return_value = SEARCH_RESPONSE
+        res = es_interface.search()
+        body = mock_search.call_args[1]["body"]
+        self.assertNotIn("aggs", body)
+        self.assertNotIn("highlight", body)
+        self.assertTrue(res["_meta"]["downgraded"])
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_DOWNGRADE", 500)
+    @mock.patch("complaint_search.es_interface._get_meta", return_value={})
+    def test_search_without_aggs_is_not_downgraded(
+        self, mock_meta, mock_search
+    ):
+        mock_search.return_value = SEARCH_RESPONSE
+        res = es_interface.search(size=1000, no_aggs=True, no_highlight=True)
+        mock_search.assert_called_once()
+        self.assertNotIn("downgraded", res["_meta"])
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_DOWNGRADE", 500)
+    @mock.patch("complaint_search.es_interface._QUERY_COST_REJECT", 1000)
+    def test_downgraded_search_is_still_rejected(self, mock_search):
+        with self.assertRaises(QueryTooExpensive):
+            es_interface.search(size=1000)
+        mock_search.assert_not_called()
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_DOWNGRADE", 500)
+    @mock.patch("complaint_search.es_interface._QUERY_COST_QUEUE", 2000)
+    @mock.patch("complaint_search.es_interface._QUERY_COST_REJECT", 3000)
+    @mock.patch("complaint_search.es_interface._get_meta", return_value={})
+    def test_search_over_reject_is_downgraded(self, mock_meta, mock_search):
+        # Costs about 3400 with the ZIP code facet, and 25 downgraded
+        mock_search.return_value = SEARCH_RESPONSE
+        es_interface.search(zip_code=["20001"])
+        body = mock_search.call_args[1]["body"]
+        self.assertNotIn("aggs", body)
+        self.assertNotIn("highlight", body)
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_DOWNGRADE", 500)
+    @mock.patch("complaint_search.es_interface._QUERY_COST_QUEUE", 2000)
+    @mock.patch("complaint_search.es_interface._get_meta", return_value={})
+    def test_search_over_queue_is_downgraded(self, mock_meta, mock_search):
+        mock_search.return_value = SEARCH_RESPONSE
+        with mock.patch(
+            "complaint_search.es_interface._query_slot"
+        ) as mock_slot:
+            es_interface.search(zip_code=["20001"])
+        mock_slot.assert_called_once_with(False)
+        self.assertNotIn("aggs", mock_search.call_args[1]["body"])
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_DOWNGRADE", 10)
+    @mock.patch("complaint_search.es_interface._QUERY_COST_REJECT", 10)
+    def test_states_are_rejected_at_full_cost(self, mock_search):
+        with self.assertRaises(QueryTooExpensive):
+            es_interface.states_agg()
+        mock_search.assert_not_called()
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_DOWNGRADE", 10)
+    def test_states_are_not_downgraded(self, mock_search):
+        mock_search.return_value = {"aggregations": {}}
+        es_interface.states_agg()
+        self.assertIn("aggs", mock_search.call_args[1]["body"])
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_REJECT", 10000)
+    def test_trends_are_rejected(self, mock_search):
+        with self.assertRaises(QueryTooExpensive):
+            es_interface.trends(lens="overview", trend_interval="day")
+        mock_search.assert_not_called()
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_QUEUE", 10)
+    @mock.patch("complaint_search.es_interface._QUERY_COST_QUEUE_TIMEOUT", 0)
+    @mock.patch("complaint_search.es_interface._QUERY_COST_QUEUE_SLOTS", 1)
+    def test_queued_while_queue_is_full(self, mock_search):
+        mock_search.return_value = {"aggregations": {}}
+        queue = es_interface._get_query_queue()
+        with queue.slot():
+            with self.assertRaises(QueryQueueFull):
+                es_interface.states_agg()
+        mock_search.assert_not_called()
+        es_interface.states_agg()
+        mock_search.assert_called_once()
+        # The slot is released
+        queue.acquire()
+        queue.release()
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_REJECT", 10)
+    @mock.patch(
+        "complaint_search.es_interface._export_scan", return_value=iter([])
+    )
+    def test_exports_are_not_estimated(self, mock_scan, mock_search):
+        es_interface.search(format="csv")
+        mock_scan.assert_called_once()
+
+
+@override_settings(DEBUG=False)
+class AdmissionViewTests(APITestCase):
+    def setUp(self):
+        self.orig_search_anon_rate = SearchAnonRateThrottle.rate
+        SearchAnonRateThrottle.rate = "2000/min"
+        es_interface._QUERY_QUEUE = None
+
+    def tearDown(self):
+        cache.clear()
+        SearchAnonRateThrottle.rate = self.orig_search_anon_rate
+        es_interface._QUERY_QUEUE = None
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_REJECT", 10)
+    @mock.patch.object(OpenSearch, "search")
+    def test_rejected(self, mock_search):
+        for name in ("search", "states"):
+            response = self.client.get(reverse("complaint_search:" + name))
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+            self.assertIn("too expensive", response.data["detail"])
+        mock_search.assert_not_called()
+
+    @mock.patch("complaint_search.es_interface._QUERY_COST_QUEUE", 10)
+    @mock.patch(
+        "complaint_search.es_interface._QUERY_COST_QUEUE_TIMEOUT", 0.01
+    )
+    @mock.patch.object(OpenSearch, "search")
+    def test_queue_full(self, mock_search):
+        queue = es_interface._get_query_queue()
+        for i in range(es_interface._QUERY_COST_QUEUE_SLOTS):
+            queue.acquire()
+        try:
+            response = self.client.get(reverse("complaint_search:states"))
+        finally:
+            for i in range(es_interface._QUERY_COST_QUEUE_SLOTS):
+                queue.release()
+        self.assertEqual(
+            status.HTTP_429_TOO_MANY_REQUESTS, response.status_code
+        )
+        self.assertIn("Retry-After", response)
+        mock_search.assert_not_called()
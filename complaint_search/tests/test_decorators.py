@@ -2,9 +2,9 @@ from django.test import RequestFactory, TestCase
 
 from opensearchpy import ConnectionTimeout, TransportError
 from rest_framework import status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import Throttled, ValidationError
 
-from complaint_search.decorators import catch_es_error
+from complaint_search.decorators import catch_es_error, catch_es_error_async
 
 
 class CatchESErrorTest(TestCase):
@@ -53,3 +53,28 @@ class CatchESErrorTest(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
         self.assertIn("Traceback", logs.output[0])
+
+
+class CatchESErrorAsyncTest(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get("/")
+
+    async def test_throttled_sets_retry_after(self):
+        @catch_es_error_async
+        async def view(request):
+            raise Throttled(wait=10)
+
+        response = await view(self.request)
+        self.assertEqual(
+            status.HTTP_429_TOO_MANY_REQUESTS, response.status_code
+        )
+        self.assertEqual("10", response["Retry-After"])
+
+    async def test_api_exception_without_wait(self):
+        @catch_es_error_async
+        async def view(request):
+            raise ValidationError({"size": ["too big"]})
+
+        response = await view(self.request)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertFalse(response.has_header("Retry-After"))
@@ -0,0 +1,447 @@
+import copy
+import itertools
+import json
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from parameterized import parameterized
+
+from complaint_search import es_interface
+from complaint_search.defaults import DELIMITER, PARAMS
+from complaint_search.es_builders import (
+    AggregationBuilder,
+    AllFieldsQuery,
+    FilterCompiler,
+    PostFilterBuilder,
+    SharedFilterAggregationBuilder,
+)
+
+
+FILTERS = {
+    "company": ["Bank of America"],
+    "product": ["Mortgage" + DELIMITER + "FHA mortgage", "Student loan"],
+    "state": ["CA"],
+    "not_company": ["Experian"],
+    "not_state": ["FL"],
+    "date_received_min": "2020-01-01",
+    "company_received_max": "2024-01-01",
+}
+
+
+class FilterCompilerTests(SimpleTestCase):
+    def test_clauses_are_built_once(self):
+        with mock.patch.object(
+            FilterCompiler,
+            "_build_bool_clauses",
+            autospec=True,
+            side_effect=FilterCompiler._build_bool_clauses,
+        ) as mock_clauses:
+            params = copy.deepcopy(PARAMS)
+            params.update(FILTERS)
+            es_interface._build_search_body(params)
+        # One call for each include and each exclude field
+        self.assertEqual(5, mock_clauses.call_count)
+
+    def test_without(self):
+        filters = FilterCompiler(FILTERS)
+        must = filters.build(without="company")["bool"]["must"]
+        self.assertEqual(
+            [
+                {"range": {"date_received": {"from": "2020-01-01"}}},
+                {"range": {"date_sent_to_company": {"to": "2024-01-01"}}},
+                {
+                    "bool": {
+                        "should": [
+                            {
+                                "bool": {
+                                    "must": [
+                                        {"term": {"product.raw": "Mortgage"}},
+                                        {
+                                            "terms": {
+                                                "sub_product.raw": [
+                                                    "FHA mortgage"
+                                                ]
+                                            }
+                                        },
+                                    ]
+                                }
+                            },
+                            {"term": {"product.raw": "Student loan"}},
+                        ]
+                    }
+                },
+                {"terms": {"state": ["CA"]}},
+            ],
+            must,
+        )
+
+    def test_not_clauses(self):
+        filters = FilterCompiler(FILTERS)
+        not_clauses = [
+            {"terms": {"company.raw": ["Experian"]}},
+            {"terms": {"state": ["FL"]}},
+        ]
+        self.assertEqual(
+            [{"bool": {"must": not_clauses}}],
+            filters.build()["bool"]["must_not"],
+        )
+        self.assertEqual(
+            not_clauses,
+            filters.build(single_not_clause=False)["bool"]["must_not"],
+        )
+
+    def test_build_dates(self):
+        self.assertEqual(
+            {
+                "bool": {
+                    "must": [
+                        {"range": {"date_received": {"from": "2020-01-01"}}},
+                        {
+                            "range": {
+                                "date_sent_to_company": {"to": "2024-01-01"}
+                            }
+                        },
+                    ],
+                    "must_not": [],
+                }
+            },
+            FilterCompiler(FILTERS).build_dates(),
+        )
+
+    def test_builders_share_clauses(self):
+        filters = FilterCompiler(FILTERS)
+        post_filter_builder = PostFilterBuilder()
+        post_filter_builder.add(**FILTERS)
+        post_filter_builder.use_filters(filters)
+        aggregation_builder = AggregationBuilder()
+        aggregation_builder.add(**FILTERS)
+        aggregation_builder.use_filters(filters)
+
+        post_filter = post_filter_builder.build()
+        agg_filter = aggregation_builder.build_one("state")["filter"]
+        self.assertIs(
+            post_filter["bool"]["must"][2], agg_filter["bool"]["must"][2]
+        )
+
+        # Lists are not shared, so appending to one filter is safe
+        agg_filter["bool"]["must"].append({"prefix": {"state": "C"}})
+        self.assertEqual(5, len(post_filter["bool"]["must"]))
+        self.assertEqual(5, len(filters.build()["bool"]["must"]))
+
+    def test_builder_compiles_its_own_filters(self):
+        builder = PostFilterBuilder()
+        builder.add(**FILTERS)
+        self.assertEqual(FilterCompiler(FILTERS).build(), builder.build())
+
+
+def _documents():
+    values = itertools.product(
+        (
+            ("Mortgage", "FHA mortgage"),
+            ("Mortgage", "VA mortgage"),
+            ("Student loan", "Private student loan"),
+        ),
+        (("Incorrect information", "Old debt"), ("Fraud", "Card fraud")),
+        ("Bank of America", "Experian", "Wells Fargo"),
+        ("CA", "FL", "NY"),
+        ("2019-06-01", "2021-06-01"),
+    )
+    for i, (product, issue, company, state, date) in enumerate(values):
+        yield {
+            "product.raw": product[0],
+            "sub_product.raw": product[1],
+            "issue.raw": issue[0],
+            "sub_issue.raw": issue[1],
+            "company.raw": company,
+            "company_public_response.raw": "None",
+            "company_response": ("Closed", "In progress")[i % 2],
+            "has_narrative": ("true", "false")[i % 3 == 0],
+            "state": state,
+            "submitted_via": ("Web", "Phone", "Fax")[i % 3],
+            "tags": ("Servicemember", "Older American")[i % 5 == 0],
+            "timely": "Yes",
+            "zip_code": ("94XXX", "10001")[i % 2],
+            "date_received": date,
+            "date_sent_to_company": date,
+        }
+
+
+DOCUMENTS = list(_documents())
+
+
+def _matches(clause, doc):
+    """Evaluate the query DSL used by the filter builders on a document."""
+    if "bool" in clause:
+        bool_clause = clause["bool"]
+        return (
+            all(_matches(c, doc) for c in bool_clause.get("must", []))
+            and not any(
+                _matches(c, doc) for c in bool_clause.get("must_not", [])
+            )
+            and (
+                "should" not in bool_clause
+                or any(_matches(c, doc) for c in bool_clause["should"])
+            )
+        )
+    if "terms" in clause:
+        ((field, values),) = clause["terms"].items()
+        return doc[field] in values
+    if "term" in clause:
+        ((field, value),) = clause["term"].items()
+        return doc[field] == value
+    if "range" in clause:
+        ((field, bounds),) = clause["range"].items()
+        value = doc[field]
+        return bounds.get("from", value) <= value <= bounds.get("to", value)
+    raise AssertionError("Unexpected clause {}".format(clause))
+
+
+def _aggregate(aggs, docs):
+    """Compute filter and terms aggregations over a list of documents."""
+    result = {}
+    for name, agg in aggs.items():
+        if "filter" in agg:
+            matching = [doc for doc in docs if _matches(agg["filter"], doc)]
+            result[name] = dict(
+                _aggregate(agg.get("aggs", {}), matching),
+                doc_count=len(matching),
+            )
+        else:
+            field = agg["terms"]["field"]
+            keys = sorted({doc[field] for doc in docs})
+            buckets = []
+            for key in keys:
+                matching = [doc for doc in docs if doc[field] == key]
+                buckets.append(
+                    dict(
+                        _aggregate(agg.get("aggs", {}), matching),
+                        key=key,
+                        doc_count=len(matching),
+                    )
+                )
+            buckets.sort(key=lambda bucket: -bucket["doc_count"])
+            result[name] = {"buckets": buckets[: agg["terms"]["size"]]}
+    return result
+
+
+class SharedFilterAggregationTests(SimpleTestCase):
+    def body(self, plan, filters, agg_exclude=None):
+        params = copy.deepcopy(PARAMS)
+        params.update(filters)
+        with mock.patch(
+            "complaint_search.es_interface._AGG_FILTER_PLAN", plan
+        ):
+            return es_interface._build_search_body(params, agg_exclude)
+
+    def aggregations(self, plan, filters, agg_exclude=None):
+        body = self.body(plan, filters, agg_exclude)
+        res = {"aggregations": _aggregate(body["aggs"], DOCUMENTS)}
+        return es_interface._unwrap_aggs(res)["aggregations"]
+
+    @parameterized.expand(
+        [
+            ({},),
+            ({"company": ["Experian"]},),
+            ({"company": ["Experian", "Wells Fargo"], "state": ["CA"]},),
+            (
+                {
+                    "product": ["Mortgage" + DELIMITER + "FHA mortgage"],
+                    "issue": ["Fraud"],
+                    "not_state": ["FL"],
+                    "date_received_min": "2020-01-01",
+                },
+            ),
+            ({"not_company": ["Experian"], "not_zip_code": ["10001"]},),
+            (FILTERS,),
+        ]
+    )
+    def test_counts_match(self, filters):
+        expected = self.aggregations("facet", filters)
+        self.assertEqual(11, len(expected))
+        self.assertEqual(expected, self.aggregations("shared", filters))
+
+    def test_counts_match_with_agg_exclude(self):
+        filters = {"company": ["Experian"], "state": ["CA"]}
+        agg_exclude = ["company", "zip_code"]
+        expected = self.aggregations("facet", filters, agg_exclude)
+        self.assertNotIn("zip_code", expected)
+        self.assertEqual(
+            expected, self.aggregations("shared", filters, agg_exclude)
+        )
+
+    def test_body_is_smaller(self):
+        filters = {
+            "company": ["Company {}".format(i) for i in range(500)],
+            "zip_code": ["{:05}".format(i) for i in range(500)],
+        }
+        facet = json.dumps(self.body("facet", filters))
+        shared = json.dumps(self.body("shared", filters))
+        self.assertLess(len(shared) * 3, len(facet))
+
+    def test_unfiltered_facets_are_grouped(self):
+        aggs = self.body("shared", {"state": ["CA"]})["aggs"]
+        shared = aggs[SharedFilterAggregationBuilder.SHARED]["aggs"]
+        unfiltered = shared[SharedFilterAggregationBuilder.UNFILTERED]
+        self.assertEqual(
+            {"bool": {"must": [{"terms": {"state": ["CA"]}}]}},
+            unfiltered["filter"],
+        )
+        self.assertEqual(10, len(unfiltered["aggs"]))
+        self.assertEqual({"bool": {"must": []}}, shared["state"]["filter"])
+
+    def test_unwrap_leaves_other_aggregations(self):
+        aggregations = {"state": {"doc_count": 1}}
+        self.assertEqual(
+            {"state": {"doc_count": 1}},
+            SharedFilterAggregationBuilder.unwrap(aggregations),
+        )
+
+
+class DeepCopyTests(SimpleTestCase):
+    def test_bodies_are_built_without_deep_copies(self):
+        with mock.patch("copy.deepcopy") as mock_deepcopy:
+            params = es_interface._search_params(**FILTERS)
+            body = es_interface._build_search_body(params)
+            es_interface._build_pagination_body(body, params)
+            params = es_interface._search_params(size=0, **FILTERS)
+            es_interface._build_states_body(params)
+            es_interface._build_trends_bodies(
+                params.replace(
+                    lens="product",
+                    sub_lens="sub_product",
+                    sub_lens_depth=5,
+                    trend_interval="month",
+                )
+            )
+        mock_deepcopy.assert_not_called()
+
+    def test_pagination_body_leaves_body_unchanged(self):
+        params = es_interface._search_params(search_after="1_2", **FILTERS)
+        body = es_interface._build_search_body(params)
+        original = json.dumps(body, sort_keys=True)
+        pagination_body = es_interface._build_pagination_body(body, params)
+        self.assertFalse(pagination_body["_source"])
+        self.assertNotIn("aggs", pagination_body)
+        self.assertNotIn("search_after", pagination_body)
+        self.assertEqual(original, json.dumps(body, sort_keys=True))
+
+
+class AllFieldsQueryTests(SimpleTestCase):
+    FIELDS = ["complaint_what_happened^2", "company"]
+
+    def body(self, strategy, search_term, copy_to_field=None):
+        with mock.patch.multiple(
+            "complaint_search.es_interface",
+            _ALL_FIELDS_STRATEGY=strategy,
+            _ALL_FIELDS=self.FIELDS,
+            _ALL_FIELDS_COPY_TO=copy_to_field,
+        ):
+            params = es_interface._search_params(
+                search_term=search_term, field="all"
+            )
+            return es_interface._build_search_body(params)
+
+    def test_query_string(self):
+        body = self.body("query_string", "test term")
+        self.assertEqual(
+            {
+                "query_string": {
+                    "query": "test term",
+                    "default_field": "*",
+                    "default_operator": "AND",
+                }
+            },
+            body["query"],
+        )
+        self.assertEqual({"*": {}}, body["highlight"]["fields"])
+
+    def test_multi_match(self):
+        body = self.body("multi_match", "test term")
+        self.assertEqual(
+            {
+                "multi_match": {
+                    "query": "test term",
+                    "fields": self.FIELDS,
+                    "type": "cross_fields",
+                    "operator": "and",
+                }
+            },
+            body["query"],
+        )
+        self.assertEqual(
+            {"complaint_what_happened": {}, "company": {}},
+            body["highlight"]["fields"],
+        )
+
+    def test_multi_match_with_syntax(self):
+        body = self.body("multi_match", "test OR term*")
+        self.assertEqual(
+            {
+                "query_string": {
+                    "query": "test OR term*",
+                    "fields": self.FIELDS,
+                }
+            },
+            body["query"],
+        )
+
+    def test_copy_to(self):
+        body = self.body("copy_to", "test term", "all_text")
+        self.assertEqual(
+            {"match": {"all_text": {"query": "test term", "operator": "and"}}},
+            body["query"],
+        )
+        self.assertEqual(
+            {"complaint_what_happened": {}, "company": {}},
+            body["highlight"]["fields"],
+        )
+        body = self.body("copy_to", "test AND term", "all_text")
+        self.assertEqual(
+            {
+                "query_string": {
+                    "query": "test AND term",
+                    "default_field": "all_text",
+                }
+            },
+            body["query"],
+        )
+
+    def test_copy_to_needs_a_field(self):
+        self.assertEqual("query_string", AllFieldsQuery("copy_to").strategy)
+
+    def test_unknown_strategy(self):
+        self.assertEqual(
+            "query_string", AllFieldsQuery("combined_fields").strategy
+        )
+
+    def test_single_field_is_unchanged(self):
+        params = es_interface._search_params(search_term="test term")
+        with mock.patch(
+            "complaint_search.es_interface._ALL_FIELDS_STRATEGY",
+            "multi_match",
+        ):
+            body = es_interface._build_search_body(params)
+        self.assertEqual(
+            {
+                "match": {
+                    "complaint_what_happened": {
+                        "query": "test term",
+                        "operator": "and",
+                    }
+                }
+            },
+            body["query"],
+        )
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            "benchmark_query_builders", number=1, repeat=1, stdout=out
+        )
+        for name in ("search", "states", "trends"):
+            self.assertIn(name, out.getvalue())
@@ -0,0 +1,152 @@
+import asyncio
+import copy
+from datetime import datetime
+from unittest import mock
+
+from django.test import TestCase
+
+from complaint_search import es_interface, es_interface_async
+from complaint_search.es_interface import _reset_caches
+from complaint_search.tests.es_interface_test_helpers import load
+from complaint_search.transport_async import JitteredAsyncTransport
+
+
+STATS_RESPONSE = {
+    "aggregations": {
+        "max_date": {"value_as_string": "2017-01-01"},
+        "max_indexed_date": {"value_as_string": "2017-01-02"},
+    }
+}
+
+
+def fake_client(search_results):
+    client = mock.Mock()
+    client.search = mock.AsyncMock(side_effect=search_results)
+    client.count = mock.AsyncMock(return_value={"count": 4})
+    return client
+
+
+class AsyncClientTest(TestCase):
+    @mock.patch("complaint_search.es_interface._ES_POOL", 25)
+    async def test_client_options(self):
+        transport = es_interface_async._get_async_es().transport
+        self.assertIsInstance(transport, JitteredAsyncTransport)
+        self.assertEqual(es_interface._ES_MAX_RETRIES, transport.retries)
+        self.assertIs(
+            es_interface._log_transport_stats, transport.after_request
+        )
+        await transport._async_call()
+        connection = transport.connection_pool.connection
+        self.assertEqual(25, connection._limit)
+        await transport.close()
+
+
+@mock.patch("complaint_search.es_interface._get_now")
+class EsInterfaceAsyncTest(TestCase):
+    def setUp(self):
+        _reset_caches()
+
+    async def test_search_runs_lookups_concurrently(self, mock_now):
+        mock_now.return_value = datetime(2017, 1, 3)
+        hits = [{"sort": [i, str(i)]} for i in range(6)]
+        client = fake_client(
+            [
+                {"hits": {"total": {"value": 10000}, "hits": hits[:2]}},
+                {"hits": {"total": {"value": 10000}, "hits": hits}},
+                copy.deepcopy(STATS_RESPONSE),
+            ]
+        )
+        with mock.patch.object(
+            es_interface_async, "_get_async_es", return_value=client
+        ):
+            res = await es_interface_async.search(size=2, no_aggs=True)
+
+        self.assertEqual(3, client.search.await_count)
+        self.assertEqual(1, client.count.await_count)
+        self.assertEqual(2, len(res["_meta"]["break_points"]))
+        self.assertEqual(4, res["_meta"]["total_record_count"])
+        self.assertEqual("2017-01-02", res["_meta"]["last_indexed"])
+
+    async def test_search_single_page_uses_cached_meta(self, mock_now):
+        mock_now.return_value = datetime(2017, 1, 3)
+        page = {"hits": {"total": {"value": 1}, "hits": [{}]}}
+        client = fake_client(
+            [
+                copy.deepcopy(page),
+                {"hits": {"hits": []}},
+                copy.deepcopy(STATS_RESPONSE),
+                copy.deepcopy(page),
+            ]
+        )
+        with mock.patch.object(
+            es_interface_async, "_get_async_es", return_value=client
+        ):
+            await es_interface_async.search()
+            res = await es_interface_async.search()
+
+        self.assertEqual(4, client.search.await_count)
+        self.assertEqual(1, client.count.await_count)
+        self.assertEqual({}, res["_meta"]["break_points"])
+
+    async def test_get_meta_flags(self, mock_now):
+        mock_now.return_value = datetime(2017, 11, 1)
+        client = fake_client([copy.deepcopy(STATS_RESPONSE)])
+        with mock.patch.object(
+            es_interface_async, "_get_async_es", return_value=client
+        ):
+            flags = await es_interface_async.get_meta_flags()
+        self.assertEqual(
+            {"is_data_stale": True, "has_data_issue": False}, flags
+        )
+
+    @mock.patch("complaint_search.es_interface.search")
+    async def test_search_export_uses_sync_path(self, mock_search, mock_now):
+        mock_search.return_value = "EXPORT"
+        res = await es_interface_async.search(format="csv")
+        self.assertEqual("EXPORT", res)
+        mock_search.assert_called_once_with(agg_exclude=None, format="csv")
+
+    async def test_states_agg(self, mock_now):
+        client = fake_client([{"aggregations": "OK"}])
+        with mock.patch.object(
+            es_interface_async, "_get_async_es", return_value=client
+        ):
+            res = await es_interface_async.states_agg()
+        self.assertEqual({"aggregations": "OK"}, res)
+        body = client.search.await_args[1]["body"]
+        self.assertEqual(0, body["size"])
+        self.assertIn("state", body["aggs"])
+
+    async def test_params_are_prepared_off_the_event_loop(self, mock_now):
+        # Preparing params may read a filter set and refresh its index
+        request_params = es_interface._request_params
+
+        def prepare(*args, **kwargs):
+            with self.assertRaises(RuntimeError):
+                asyncio.get_running_loop()
+            return request_params(*args, **kwargs)
+
+        client = fake_client([{"aggregations": "OK"}])
+        with mock.patch.object(
+            es_interface_async, "_get_async_es", return_value=client
+        ), mock.patch.object(
+            es_interface, "_request_params", side_effect=prepare
+        ) as mock_params:
+            await es_interface_async.states_agg()
+        mock_params.assert_called_once()
+
+    async def test_trends_date_range_buckets_cached(self, mock_now):
+        client = fake_client(
+            lambda **kwargs: load("trends_default_params__valid")
+        )
+        with mock.patch.object(
+            es_interface_async, "_get_async_es", return_value=client
+        ):
+            await es_interface_async.trends(
+                lens="overview", trend_interval="year"
+            )
+            res = await es_interface_async.trends(
+                lens="overview", trend_interval="year"
+            )
+        self.assertEqual(3, client.search.await_count)
+        self.assertIn("body", res["aggregations"]["dateRangeBuckets"])
@@ -5,11 +5,14 @@ from django.test import TestCase
 from opensearchpy import OpenSearch
 
 from complaint_search.defaults import AGG_EXCLUDE_FIELDS
-from complaint_search.es_interface import trends
+from complaint_search.es_interface import _reset_caches, trends
 from complaint_search.tests.es_interface_test_helpers import load
 
 
 class EsInterfaceTestTrends(TestCase):
+    def setUp(self):
+        _reset_caches()
+
     @mock.patch("complaint_search.es_interface._COMPLAINT_ES_INDEX", "INDEX")
     @mock.patch.object(OpenSearch, "count")
     @mock.patch.object(OpenSearch, "search")
@@ -177,3 +180,24 @@ class EsInterfaceTestTrends(TestCase):
         self.assertEqual(
             len(res["aggregations"]["issue"]["issue"]["buckets"]), 1
         )
+
+    @mock.patch("complaint_search.es_interface._COMPLAINT_ES_INDEX", "INDEX")
+    @mock.patch.object(OpenSearch, "search")
+    def test_trends_date_range_buckets_cached(self, mock_search):
+        mock_search.side_effect = lambda **kwargs: load(
+            "trends_default_params__valid"
+        )
+        trends(lens="overview", trend_interval="year")
+        res = trends(
+            lens="overview", trend_interval="year", company=["EQUIFAX, INC."]
+        )
+        self.assertEqual(3, mock_search.call_count)
+        self.assertIn("body", res["aggregations"]["dateRangeBuckets"])
+
+        trends(lens="overview", trend_interval="month")
+        trends(
+            lens="overview",
+            trend_interval="year",
+            date_received_min="2019-01-01",
+        )
+        self.assertEqual(7, mock_search.call_count)
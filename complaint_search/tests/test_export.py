@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import io
+import json
 from collections import OrderedDict
+from datetime import date
+from unittest import skipIf
 
 from django.http import StreamingHttpResponse
 from django.test import TestCase
@@ -9,8 +12,8 @@ from django.test import TestCase
 from parameterized import parameterized
 from rest_framework.exceptions import ValidationError
 
-from complaint_search.defaults import MAX_DOWNLOAD_SIZE
-from complaint_search.export import OpenSearchExporter
+from complaint_search.defaults import CSV_ORDERED_HEADERS, MAX_DOWNLOAD_SIZE
+from complaint_search.export import OpenSearchExporter, pa, pq
 
 
 TEST_HEADERS = OrderedDict(
@@ -94,6 +97,249 @@ class ExportTest(TestCase):
         self.assertEqual(content, b"[]")
 
 
+class TestCSVExportChunks(TestCase):
+    def export(self, rows, chunk_size):
+        exporter = OpenSearchExporter()
+        response = exporter.export_csv(
+            iter(rows), TEST_HEADERS, chunk_size=chunk_size
+        )
+        return list(response.streaming_content)
+
+    def test_rows_are_buffered_into_chunks(self):
+        chunks = self.export(list(es_generator(1000)), 4096)
+        self.assertLess(len(chunks), 20)
+        self.assertTrue(all(len(chunk) >= 4096 for chunk in chunks[:-1]))
+        lines = b"".join(chunks).decode("utf-8").split("\r\n")
+        self.assertEqual(
+            "First Entry,Second Entry,Third Entry,Fourth Entry", lines[0]
+        )
+        self.assertEqual(1002, len(lines))
+
+    def test_small_chunk_size_yields_each_row(self):
+        chunks = self.export(list(es_generator(3)), 1)
+        self.assertEqual(3, len(chunks))
+
+    def test_header_only(self):
+        chunks = self.export([], 4096)
+        self.assertEqual(
+            [b"First Entry,Second Entry,Third Entry,Fourth Entry\r\n"], chunks
+        )
+
+    def test_rows_are_projected_onto_headers(self):
+        rows = [
+            {
+                "_source": {
+                    "fourth_entry": 4,
+                    "first_entry": "a,b",
+                    "unknown": "x",
+                    "third_entry": None,
+                }
+            }
+        ]
+        content = b"".join(self.export(rows, 4096)).decode("utf-8")
+        self.assertEqual('"a,b",,None,4\r\n', content.split("\r\n", 1)[1])
+
+    def test_continued_export_resumes_rows(self):
+        rows = list(es_generator(4))
+        exporter = OpenSearchExporter()
+        full = exporter.export_csv(iter(rows), TEST_HEADERS)
+        head = exporter.export_csv(iter(rows[:1]), TEST_HEADERS)
+        rest = exporter.export_csv(
+            iter(rows[1:]), TEST_HEADERS, continued=True
+        )
+        self.assertEqual(
+            b"".join(full.streaming_content),
+            b"".join(head.streaming_content)
+            + b"".join(rest.streaming_content),
+        )
+
+
+class TestJSONExportChunks(TestCase):
+    def export(self, rows, **kwargs):
+        exporter = OpenSearchExporter()
+        response = exporter.export_json(iter(rows), **kwargs)
+        return list(response.streaming_content)
+
+    def hits(self, n):
+        for i, hit in enumerate(es_generator(n)):
+            hit.update({"_index": "complaint-index", "_id": str(i)})
+            yield hit
+
+    def test_export_without_total_count(self):
+        chunks = self.export(list(self.hits(1000)), chunk_size=4096)
+        self.assertLess(len(chunks), 50)
+        content = json.loads(b"".join(chunks))
+        self.assertEqual(1000, len(content))
+        self.assertEqual("999", content[-1]["_id"])
+
+    def test_export_source_projection(self):
+        chunks = self.export(list(self.hits(2)), projection="source")
+        self.assertEqual(1, len(chunks))
+        content = json.loads(chunks[0])
+        self.assertEqual(
+            [
+                {
+                    "first_entry": "Random 1",
+                    "second_entry": "Random 2",
+                    "third_entry": "Random 3",
+                    "fourth_entry": "Random 4",
+                }
+            ]
+            * 2,
+            content,
+        )
+
+    def test_export_total_count_mismatch_is_valid_json(self):
+        chunks = self.export(list(self.hits(3)), total_count=1)
+        self.assertEqual(3, len(json.loads(b"".join(chunks))))
+
+    def test_export_unknown_projection(self):
+        with self.assertRaises(ValueError):
+            self.export([], projection="fields")
+
+    def test_continued_export_resumes_documents(self):
+        hits = list(self.hits(3))
+        full = b"".join(self.export(hits))
+        rest = b"".join(self.export(hits[2:], continued=True))
+        head = b"".join(self.export(hits[:2]))
+        self.assertEqual(full, head[:-1] + rest)
+        self.assertEqual(b"]", b"".join(self.export([], continued=True)))
+
+
+class TestNDJSONExport(TestCase):
+    def test_export_one_source_per_line(self):
+        exporter = OpenSearchExporter()
+        hits = ({"_id": str(i), "_source": {"id": i}} for i in range(1000))
+        response = exporter.export_ndjson(hits, chunk_size=4096)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        chunks = list(response.streaming_content)
+        self.assertLess(len(chunks), 10)
+        lines = b"".join(chunks).decode("utf-8").splitlines()
+        self.assertEqual(1000, len(lines))
+        self.assertEqual({"id": 999}, json.loads(lines[-1]))
+
+    def test_export_empty(self):
+        exporter = OpenSearchExporter()
+        response = exporter.export_ndjson(es_generator(0))
+        self.assertEqual(b"", b"".join(response.streaming_content))
+
+
+@skipIf(pa is None, "pyarrow is not installed")
+class TestParquetExport(TestCase):
+    def hits(self, n):
+        for i in range(n):
+            yield {
+                "_source": {
+                    "date_received": "2018-06-22T12:00:00-05:00",
+                    "product": "Mortgage" if i % 2 else "Debt collection",
+                    "timely": "Yes" if i % 3 else "No",
+                    "complaint_id": i,
+                    "tags": None,
+                }
+            }
+
+    def read(self, response):
+        content = b"".join(response.streaming_content)
+        return pq.read_table(io.BytesIO(content)), pq.ParquetFile(
+            io.BytesIO(content)
+        )
+
+    def test_export_typed_columns(self):
+        exporter = OpenSearchExporter()
+        response = exporter.export_parquet(
+            self.hits(25), CSV_ORDERED_HEADERS, batch_size=10
+        )
+        self.assertEqual(
+            response["Content-Type"], "application/vnd.apache.parquet"
+        )
+        table, parquet_file = self.read(response)
+
+        self.assertEqual(list(CSV_ORDERED_HEADERS), table.column_names)
+        self.assertEqual(25, table.num_rows)
+        self.assertEqual(3, parquet_file.num_row_groups)
+        self.assertEqual(pa.date32(), table.schema.field("date_received").type)
+        self.assertEqual(pa.bool_(), table.schema.field("timely").type)
+        self.assertTrue(
+            pa.types.is_dictionary(table.schema.field("product").type)
+        )
+        row = table.slice(1, 1).to_pylist()[0]
+        self.assertEqual(date(2018, 6, 22), row["date_received"])
+        self.assertEqual("Mortgage", row["product"])
+        self.assertTrue(row["timely"])
+        self.assertEqual("1", row["complaint_id"])
+        self.assertIsNone(row["tags"])
+        self.assertIsNone(row["sub_product"])
+
+    def test_row_groups_are_streamed(self):
+        exporter = OpenSearchExporter()
+        response = exporter.export_parquet(
+            self.hits(25), CSV_ORDERED_HEADERS, batch_size=10
+        )
+        chunks = list(response.streaming_content)
+        self.assertEqual(3, len(chunks))
+        self.assertTrue(chunks[0].startswith(b"PAR1"))
+        self.assertTrue(chunks[-1].endswith(b"PAR1"))
+
+    def test_export_empty(self):
+        exporter = OpenSearchExporter()
+        table, _ = self.read(
+            exporter.export_parquet(self.hits(0), CSV_ORDERED_HEADERS)
+        )
+        self.assertEqual(0, table.num_rows)
+
+    def test_scan_is_closed_with_the_response(self):
+        closed = []
+
+        def scan():
+            try:
+                yield from self.hits(100)
+            finally:
+                closed.append(True)
+
+        exporter = OpenSearchExporter()
+        response = exporter.export_parquet(
+            scan(), CSV_ORDERED_HEADERS, batch_size=10
+        )
+        next(iter(response.streaming_content))
+        response.close()
+        self.assertEqual([True], closed)
+
+    def test_invalid_values_are_null(self):
+        hits = [{"_source": {"date_received": "06/22/18", "timely": "?"}}]
+        exporter = OpenSearchExporter()
+        table, _ = self.read(
+            exporter.export_parquet(iter(hits), CSV_ORDERED_HEADERS)
+        )
+        row = table.to_pylist()[0]
+        self.assertIsNone(row["date_received"])
+        self.assertIsNone(row["timely"])
+
+
+class TestExportClosesScan(TestCase):
+    @parameterized.expand(
+        [
+            ["export_csv", (TEST_HEADERS,)],
+            ["export_json", ()],
+            ["export_ndjson", ()],
+        ]
+    )
+    def test_scan_is_closed_with_the_response(self, method, args):
+        closed = []
+
+        def scan():
+            try:
+                yield from es_generator(10)
+            finally:
+                closed.append(True)
+
+        exporter = OpenSearchExporter()
+        response = getattr(exporter, method)(scan(), *args, chunk_size=1)
+        next(iter(response.streaming_content))
+        self.assertEqual([], closed)
+        response.close()
+        self.assertEqual([True], closed)
+
+
 class TestCSVExportWithUnicodeCharacters(TestCase):
     def test_export_contains_unicode_chacter(self):
         headers = OrderedDict(
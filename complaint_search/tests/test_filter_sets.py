@@ -0,0 +1,256 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from opensearchpy import TransportError
+from rest_framework.exceptions import ValidationError
+
+from complaint_search import es_interface, filter_sets
+from complaint_search.defaults import DELIMITER
+from complaint_search.filter_sets import (
+    FilterSets,
+    FilterSetsFull,
+    filter_set_id,
+    merge_filters,
+    normalize,
+)
+
+
+COMPANIES = ["Company {}".format(i) for i in range(300)]
+
+
+class FilterSetStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = FilterSets(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_id_is_content_hash(self):
+        self.assertEqual(
+            filter_set_id({"company": ["B", "A", "B"], "state": []}),
+            filter_set_id({"company": ["A", "B"]}),
+        )
+        self.assertNotEqual(
+            filter_set_id({"company": ["A"]}),
+            filter_set_id({"not_company": ["A"]}),
+        )
+
+    def test_normalize(self):
+        self.assertEqual(
+            {"company": ["A", "B"]},
+            normalize({"company": ["B", "A", "B"], "state": []}),
+        )
+
+    def test_register(self):
+        record = self.store.register({"company": ["B", "A"]}, name="Banks")
+        self.assertEqual(filter_set_id({"company": ["A", "B"]}), record["id"])
+        self.assertEqual("Banks", record["name"])
+        self.assertEqual({"company": ["A", "B"]}, record["filters"])
+        self.assertIsNone(record["lookup_index"])
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.directory, record["id"] + ".json")
+            )
+        )
+        self.assertEqual(record, FilterSets(self.directory).get(record["id"]))
+
+    def test_register_again_keeps_first_name(self):
+        first = self.store.register({"company": ["A"]}, name="First")
+        second = self.store.register({"company": ["A"]}, name="Second")
+        self.assertEqual(first["id"], second["id"])
+        self.assertEqual("First", second["name"])
+
+    def test_get_unknown(self):
+        self.assertIsNone(self.store.get("0" * 40))
+
+    def test_get_is_cached(self):
+        record = self.store.register({"company": ["A"]})
+        os.remove(os.path.join(self.directory, record["id"] + ".json"))
+        self.assertEqual(record, self.store.get(record["id"]))
+
+    def test_expires(self):
+        store = FilterSets(self.directory, ttl=60)
+        record = store.register({"company": ["A"]}, name="First")
+        with mock.patch("time.time", return_value=time.time() + 61):
+            self.assertIsNone(store.get(record["id"]))
+            self.assertIsNone(
+                FilterSets(self.directory, ttl=60).get(record["id"])
+            )
+            # Registered again, it is a new set
+            record = store.register({"company": ["A"]}, name="Second")
+            self.assertEqual("Second", record["name"])
+        self.assertEqual(record, store.get(record["id"]))
+
+    def test_register_again_extends_life(self):
+        store = FilterSets(self.directory, ttl=60)
+        now = time.time()
+        record = store.register({"company": ["A"]})
+        with mock.patch("time.time", return_value=now + 50):
+            store.register({"company": ["A"]})
+        with mock.patch("time.time", return_value=now + 100):
+            self.assertEqual(record["id"], store.get(record["id"])["id"])
+
+    def test_full(self):
+        store = FilterSets(self.directory, ttl=60, max_sets=2)
+        store.register({"company": ["A"]})
+        store.register({"company": ["B"]})
+        # Registering a known set again is always allowed
+        store.register({"company": ["A"]})
+        with self.assertRaises(FilterSetsFull):
+            store.register({"company": ["C"]})
+
+    def test_full_removes_expired_sets(self):
+        store = FilterSets(self.directory, ttl=60, max_sets=2)
+        expired = store.register({"company": ["A"]})
+        path = os.path.join(self.directory, expired["id"] + ".json")
+        os.utime(path, (time.time() - 61, time.time() - 61))
+        store.register({"company": ["B"]})
+        store.register({"company": ["C"]})
+        self.assertFalse(os.path.exists(path))
+
+
+class MergeFiltersTests(SimpleTestCase):
+    RECORD = {
+        "id": "a" * 40,
+        "filters": {
+            "company": COMPANIES,
+            "product": ["Mortgage" + DELIMITER + "FHA mortgage"],
+            "not_state": ["FL"],
+        },
+        "lookup_index": "filter-sets",
+    }
+
+    def test_values(self):
+        self.assertEqual(
+            self.RECORD["filters"], merge_filters({}, self.RECORD)
+        )
+
+    def test_lookups(self):
+        changes = merge_filters({}, self.RECORD, "filter-sets")
+        self.assertEqual(
+            {"index": "filter-sets", "id": "a" * 40, "path": "company"},
+            changes["company"],
+        )
+        self.assertEqual(
+            {"index": "filter-sets", "id": "a" * 40, "path": "not_state"},
+            changes["not_state"],
+        )
+        # Parent/child filters are always compiled from their values
+        self.assertEqual(self.RECORD["filters"]["product"], changes["product"])
+
+    def test_no_lookups_in_another_index(self):
+        changes = merge_filters({}, self.RECORD, "other")
+        self.assertEqual(COMPANIES, changes["company"])
+
+    def test_request_values_are_combined(self):
+        changes = merge_filters(
+            {"company": ["Other", "Company 0"]}, self.RECORD, "filter-sets"
+        )
+        self.assertEqual(
+            ["Other", "Company 0"] + COMPANIES[1:], changes["company"]
+        )
+
+
+class FilterSetInterfaceTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.override = override_settings(CCDB_FILTER_SET_DIR=self.directory)
+        self.override.enable()
+        filter_sets._FILTER_SETS = None
+        es_interface._REFRESHED_FILTER_SETS.clear()
+
+    def tearDown(self):
+        filter_sets._FILTER_SETS = None
+        es_interface._REFRESHED_FILTER_SETS.clear()
+        self.override.disable()
+        shutil.rmtree(self.directory)
+
+    @mock.patch("complaint_search.es_interface._get_es")
+    def test_register_without_index(self, mock_es):
+        record = es_interface.register_filter_set({"company": COMPANIES})
+        self.assertIsNone(record["lookup_index"])
+        mock_es.assert_not_called()
+
+    @mock.patch(
+        "complaint_search.es_interface._FILTER_SET_INDEX", "filter-sets"
+    )
+    @mock.patch("complaint_search.es_interface._get_es")
+    def test_register_indexes_filters(self, mock_es):
+        record = es_interface.register_filter_set(
+            {"company": ["B", "A"]}, name="Banks"
+        )
+        self.assertEqual("filter-sets", record["lookup_index"])
+        mock_es().index.assert_called_once_with(
+            index="filter-sets",
+            id=record["id"],
+            body={"company": ["A", "B"]},
+        )
+        # Registered again, the indexed set is returned as it is
+        es_interface.register_filter_set({"company": ["A", "B"]})
+        self.assertEqual(1, mock_es().index.call_count)
+
+    @mock.patch(
+        "complaint_search.es_interface._FILTER_SET_INDEX", "filter-sets"
+    )
+    @mock.patch("complaint_search.es_interface._get_es")
+    def test_register_falls_back_to_values(self, mock_es):
+        mock_es().index.side_effect = TransportError(500, "error")
+        record = es_interface.register_filter_set({"company": ["A"]})
+        self.assertIsNone(record["lookup_index"])
+        params = es_interface._search_params(filter_set=record["id"])
+        self.assertEqual(["A"], params["company"])
+
+    @mock.patch(
+        "complaint_search.es_interface._FILTER_SET_INDEX", "filter-sets"
+    )
+    @mock.patch("complaint_search.es_interface._get_es")
+    def test_search_body_uses_terms_lookup(self, mock_es):
+        record = es_interface.register_filter_set({"company": COMPANIES})
+        params = es_interface._search_params(filter_set=record["id"])
+        body = es_interface._build_search_body(params)
+        lookup = {
+            "terms": {
+                "company.raw": {
+                    "index": "filter-sets",
+                    "id": record["id"],
+                    "path": "company",
+                }
+            }
+        }
+        self.assertEqual([lookup], body["post_filter"]["bool"]["must"])
+        self.assertIn(lookup, body["aggs"]["state"]["filter"]["bool"]["must"])
+        self.assertNotIn("Company 1", str(body))
+
+    @mock.patch(
+        "complaint_search.es_interface._FILTER_SET_INDEX", "filter-sets"
+    )
+    @mock.patch("complaint_search.es_interface._get_es")
+    def test_index_refreshed_on_first_use(self, mock_es):
+        record = es_interface.register_filter_set({"company": ["A"]})
+        mock_es().indices.refresh.assert_not_called()
+        for _ in range(2):
+            params = es_interface._search_params(filter_set=record["id"])
+            self.assertEqual("filter-sets", params["company"]["index"])
+        mock_es().indices.refresh.assert_called_once_with(
+            index="filter-sets"
+        )
+
+    @mock.patch(
+        "complaint_search.es_interface._FILTER_SET_INDEX", "filter-sets"
+    )
+    @mock.patch("complaint_search.es_interface._get_es")
+    def test_refresh_falls_back_to_values(self, mock_es):
+        record = es_interface.register_filter_set({"company": ["A"]})
+        mock_es().indices.refresh.side_effect = TransportError(500, "error")
+        params = es_interface._search_params(filter_set=record["id"])
+        self.assertEqual(["A"], params["company"])
+
+    def test_unknown_filter_set(self):
+        with self.assertRaises(ValidationError):
+            es_interface._search_params(filter_set="0" * 40)
@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase
+
+from rest_framework.exceptions import ValidationError
+
+from complaint_search import jobs
+
+
+PARAMS = {"format": "csv", "search_term": "mortgage"}
+
+
+def _response(*chunks):
+    return StreamingHttpResponse(iter(chunks), content_type="text/csv")
+
+
+@mock.patch(
+    "complaint_search.es_interface.get_index_version",
+    return_value=("v1", "2024-01-01"),
+)
+class ExportJobsTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.jobs = jobs.ExportJobs(self.directory, workers=1)
+        # Run jobs synchronously
+        self.jobs._executor = mock.Mock()
+        self.jobs._executor.submit.side_effect = lambda fn, *args: fn(*args)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, job):
+        with open(self.jobs.file_path(job), "rb") as f:
+            return f.read()
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_submit_writes_file(self, mock_search, mock_version):
+        mock_search.return_value = _response("a,b\r\n", "1,2\r\n")
+        job = self.jobs.submit(PARAMS)
+        self.assertEqual(40, len(job["id"]))
+        self.assertEqual(jobs.FINISHED, job["status"])
+        self.assertEqual(10, job["bytes_written"])
+        self.assertEqual(b"a,b\r\n1,2\r\n", self.read(job))
+        self.assertEqual(job, self.jobs.get(job["id"]))
+        self.assertFalse(os.path.exists(self.jobs.file_path(job) + ".part"))
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_identical_requests_share_a_job(self, mock_search, mock_version):
+        mock_search.return_value = _response("a\r\n")
+        first = self.jobs.submit(PARAMS)
+        second = self.jobs.submit(dict(PARAMS))
+        self.assertEqual(first["id"], second["id"])
+        mock_search.assert_called_once()
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_index_version_changes_job(self, mock_search, mock_version):
+        mock_search.side_effect = lambda **kwargs: _response("a\r\n")
+        first = self.jobs.submit(PARAMS)
+        mock_version.return_value = ("v2", "2024-01-02")
+        second = self.jobs.submit(PARAMS)
+        self.assertNotEqual(first["id"], second["id"])
+        self.assertEqual(2, mock_search.call_count)
+
+    def test_attaches_to_running_job(self, mock_version):
+        self.jobs._executor = mock.Mock()
+        first = self.jobs.submit(PARAMS)
+        second = self.jobs.submit(PARAMS)
+        self.assertEqual(jobs.QUEUED, second["status"])
+        self.assertEqual(first["id"], second["id"])
+        self.jobs._executor.submit.assert_called_once()
+
+    def test_waits_for_another_process(self, mock_version):
+        self.jobs._executor = mock.Mock()
+        job_id = self.jobs.job_id(PARAMS)
+        lock = os.path.join(self.directory, job_id + ".lock")
+        open(lock, "w").close()
+        other = jobs.ExportJobs(self.directory)
+        other._executor = mock.Mock()
+
+        # Another process holds the lock while it starts the job
+        def sleep(seconds):
+            os.remove(lock)
+            other.submit(PARAMS)
+
+        with mock.patch("time.sleep", side_effect=sleep):
+            job = self.jobs.submit(PARAMS)
+        self.assertEqual(job_id, job["id"])
+        other._executor.submit.assert_called_once()
+        self.jobs._executor.submit.assert_not_called()
+        self.assertFalse(os.path.exists(lock))
+
+    def test_breaks_abandoned_lock(self, mock_version):
+        self.jobs._executor = mock.Mock()
+        lock = os.path.join(
+            self.directory, self.jobs.job_id(PARAMS) + ".lock"
+        )
+        open(lock, "w").close()
+        abandoned = time.time() - jobs._LOCK_TIMEOUT
+        os.utime(lock, (abandoned, abandoned))
+        self.jobs.submit(PARAMS)
+        self.jobs._executor.submit.assert_called_once()
+        self.assertFalse(os.path.exists(lock))
+
+    def test_restarts_stale_job(self, mock_version):
+        self.jobs._executor = mock.Mock()
+        job = self.jobs.submit(PARAMS)
+        job["updated"] = time.time() - self.jobs.stale_after - 1
+        with open(self.jobs._status_path(job["id"]), "w") as f:
+            json.dump(job, f)
+        self.jobs.submit(PARAMS)
+        self.assertEqual(2, self.jobs._executor.submit.call_count)
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_validation_failure(self, mock_search, mock_version):
+        mock_search.side_effect = ValidationError(["Too many results"])
+        job = self.jobs.submit(PARAMS)
+        self.assertEqual(jobs.FAILED, job["status"])
+        self.assertEqual(["Too many results"], job["error"])
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_failure_removes_partial_file(self, mock_search, mock_version):
+        def chunks():
+            yield "a\r\n"
+            raise RuntimeError("boom")
+
+        mock_search.return_value = StreamingHttpResponse(chunks())
+        with self.assertLogs("complaint_search.jobs", "ERROR"):
+            job = self.jobs.submit(PARAMS)
+        self.assertEqual(jobs.FAILED, job["status"])
+        self.assertEqual(
+            "There was a problem generating your export", job["error"]
+        )
+        self.assertEqual([job["id"] + ".json"], os.listdir(self.directory))
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_failed_job_is_retried(self, mock_search, mock_version):
+        mock_search.side_effect = [
+            ValidationError(["Too many results"]),
+            _response("a\r\n"),
+        ]
+        self.jobs.submit(PARAMS)
+        job = self.jobs.submit(PARAMS)
+        self.assertEqual(jobs.FINISHED, job["status"])
+
+    def test_get_missing(self, mock_version):
+        self.assertIsNone(self.jobs.get("0" * 40))
+
+    def test_purge(self, mock_version):
+        old = os.path.join(self.directory, "old.csv")
+        new = os.path.join(self.directory, "new.csv")
+        for path in (old, new):
+            open(path, "w").close()
+        expired = time.time() - self.jobs.ttl - 1
+        os.utime(old, (expired, expired))
+        self.jobs.purge()
+        self.assertEqual(["new.csv"], os.listdir(self.directory))
@@ -0,0 +1,107 @@
+import time
+
+from django.test import SimpleTestCase
+
+from complaint_search.parallel import prefetch, sliced_scan
+
+
+def make_slice(slice_id, slices, total=100, closed=None):
+    # Hits sorted descending by their sort key, partitioned between slices
+    try:
+        for i in reversed(range(total)):
+            if i % slices == slice_id:
+                yield {"_id": str(i), "sort": [i]}
+    finally:
+        if closed is not None:
+            closed.append(slice_id)
+
+
+class SlicedScanTests(SimpleTestCase):
+    def test_unordered_yields_every_hit(self):
+        hits = list(sliced_scan(make_slice, 4, queue_depth=2, batch_size=7))
+        self.assertEqual(set(range(100)), {hit["sort"][0] for hit in hits})
+        self.assertEqual(100, len(hits))
+
+    def test_ordered_merges_slices(self):
+        hits = list(
+            sliced_scan(
+                make_slice,
+                3,
+                ordered=True,
+                reverse=True,
+                queue_depth=1,
+                batch_size=5,
+            )
+        )
+        self.assertEqual(
+            list(reversed(range(100))), [hit["sort"][0] for hit in hits]
+        )
+
+    def test_slice_error_is_raised(self):
+        def scan_slice(slice_id, slices):
+            if slice_id == 1:
+                raise ValueError("slice failed")
+                yield
+            yield from make_slice(slice_id, slices)
+
+        with self.assertRaises(ValueError):
+            list(sliced_scan(scan_slice, 2))
+
+    def test_close_stops_workers(self):
+        closed = []
+
+        def scan_slice(slice_id, slices):
+            return make_slice(slice_id, slices, 100000, closed)
+
+        hits = sliced_scan(scan_slice, 2, queue_depth=1, batch_size=10)
+        next(hits)
+        hits.close()
+
+        deadline = time.monotonic() + 5
+        while len(closed) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([0, 1], sorted(closed))
+
+
+class PrefetchTests(SimpleTestCase):
+    def test_yields_every_hit_in_order(self):
+        hits = list(prefetch(make_slice(0, 1), depth=2, batch_size=7))
+        self.assertEqual(
+            list(reversed(range(100))), [hit["sort"][0] for hit in hits]
+        )
+
+    def test_reads_ahead_of_the_consumer(self):
+        read = []
+
+        def scan():
+            for hit in make_slice(0, 1):
+                read.append(hit)
+                yield hit
+
+        hits = prefetch(scan(), depth=2, batch_size=10)
+        next(hits)
+        deadline = time.monotonic() + 5
+        while len(read) < 40 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        # One batch consumed, two queued and one waiting for space
+        self.assertEqual(40, len(read))
+
+    def test_error_is_raised(self):
+        def scan():
+            yield {"sort": [1]}
+            raise ValueError("scroll failed")
+
+        with self.assertRaises(ValueError):
+            list(prefetch(scan(), batch_size=1))
+
+    def test_close_stops_reader(self):
+        closed = []
+        hits = prefetch(make_slice(0, 1, 100000, closed), batch_size=10)
+        next(hits)
+        hits.close()
+
+        deadline = time.monotonic() + 5
+        while not closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([0], closed)
@@ -0,0 +1,46 @@
+from django.test import SimpleTestCase
+
+from complaint_search.cache import canonical_params
+from complaint_search.defaults import PARAMS
+from complaint_search.params import SearchParams
+
+
+class SearchParamsTests(SimpleTestCase):
+    def test_defaults(self):
+        params = SearchParams({"size": 10}, company=["A"])
+        self.assertEqual(10, params["size"])
+        self.assertEqual(["A"], params["company"])
+        self.assertEqual(PARAMS["sort"], params.get("sort"))
+        self.assertIsNone(params.get("state"))
+        self.assertIn("format", params)
+        self.assertEqual(dict(PARAMS, size=10, company=["A"]), dict(params))
+
+    def test_immutable(self):
+        params = SearchParams()
+        with self.assertRaises(TypeError):
+            params["size"] = 10
+        with self.assertRaises(AttributeError):
+            params.update(size=10)
+        with self.assertRaises(AttributeError):
+            params.size = 10
+        with self.assertRaises(AttributeError):
+            params.__dict__
+
+    def test_replace(self):
+        params = SearchParams(size=10)
+        replaced = params.replace(size=0, state=["CA"])
+        self.assertEqual(10, params["size"])
+        self.assertNotIn("state", params)
+        self.assertEqual(0, replaced["size"])
+        self.assertEqual(["CA"], replaced["state"])
+
+    def test_defaults_are_not_changed(self):
+        SearchParams(size=0, sort="created_date_desc")
+        self.assertEqual(PARAMS["size"], SearchParams()["size"])
+        self.assertEqual("relevance_desc", PARAMS["sort"])
+
+    def test_canonical_params(self):
+        self.assertEqual(
+            {"company": ["A", "B"]},
+            canonical_params(SearchParams(company=["B", "A"])),
+        )
@@ -0,0 +1,102 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from opensearchpy import TransportError
+
+from complaint_search.pit import DEFAULT_SORT, pit_scan
+
+
+def make_hits(start, stop):
+    return [{"_id": str(i), "sort": [i, str(i)]} for i in range(start, stop)]
+
+
+class PitScanTests(SimpleTestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.create_pit.return_value = {"pit_id": "PIT1"}
+        self.client.search.side_effect = [
+            {"pit_id": "PIT2", "hits": {"hits": make_hits(0, 2)}},
+            {"pit_id": "PIT3", "hits": {"hits": make_hits(2, 3)}},
+        ]
+        self.query = {
+            "size": 25,
+            "query": {"match_all": {}},
+            "sort": [{"date_received": {"order": "desc"}}, {"_id": "desc"}],
+            "highlight": {"fields": {}},
+            "search_after": [1, "1"],
+            "track_total_hits": True,
+        }
+
+    def test_pages_with_search_after(self):
+        hits = list(
+            pit_scan(
+                self.client,
+                self.query,
+                "INDEX",
+                size=2,
+                keep_alive="30s",
+                request_timeout=5,
+            )
+        )
+
+        self.assertEqual(["0", "1", "2"], [hit["_id"] for hit in hits])
+        self.client.create_pit.assert_called_once_with(
+            index="INDEX", keep_alive="30s", request_timeout=5
+        )
+        first, second = self.client.search.call_args_list
+        self.assertEqual(5, first[1]["request_timeout"])
+        body = second[1]["body"]
+        self.assertEqual({"id": "PIT2", "keep_alive": "30s"}, body["pit"])
+        self.assertEqual([1, "1"], body["search_after"])
+        self.assertEqual(2, body["size"])
+        self.assertEqual(self.query["sort"], body["sort"])
+        self.assertNotIn("highlight", body)
+        self.assertNotIn("track_total_hits", body)
+        self.client.delete_pit.assert_called_once_with(
+            body={"pit_id": ["PIT3"]}
+        )
+
+    def test_query_is_not_modified(self):
+        list(pit_scan(self.client, self.query, "INDEX", size=2))
+        self.assertEqual([1, "1"], self.query["search_after"])
+        self.assertNotIn("pit", self.query)
+
+    def test_start_after_sort_values(self):
+        self.client.search.side_effect = [
+            {"pit_id": "PIT2", "hits": {"hits": make_hits(8, 9)}}
+        ]
+        list(
+            pit_scan(
+                self.client, self.query, "INDEX", size=2, search_after=[7, "7"]
+            )
+        )
+        body = self.client.search.call_args[1]["body"]
+        self.assertEqual([7, "7"], body["search_after"])
+
+    def test_default_sort(self):
+        del self.query["sort"]
+        list(pit_scan(self.client, self.query, "INDEX", size=2))
+        body = self.client.search.call_args[1]["body"]
+        self.assertEqual(DEFAULT_SORT, body["sort"])
+
+    def test_pit_is_deleted_when_closed(self):
+        scan = pit_scan(self.client, self.query, "INDEX", size=2)
+        next(scan)
+        self.client.delete_pit.assert_not_called()
+        scan.close()
+        self.client.delete_pit.assert_called_once_with(
+            body={"pit_id": ["PIT2"]}
+        )
+        self.assertEqual(1, self.client.search.call_count)
+
+    def test_delete_failure_is_logged(self):
+        self.client.delete_pit.side_effect = TransportError(404, "missing")
+        with self.assertLogs("complaint_search.pit", "WARNING"):
+            hits = list(pit_scan(self.client, self.query, "INDEX", size=2))
+        self.assertEqual(3, len(hits))
+
+    def test_unused_scan_creates_no_pit(self):
+        pit_scan(self.client, self.query, "INDEX").close()
+        self.client.create_pit.assert_not_called()
+        self.client.delete_pit.assert_not_called()
@@ -0,0 +1,244 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from complaint_search import resume
+
+
+TOKEN_KEY = "a" * 40
+
+
+def chunks_with_sort(cursor, count, size=10):
+    for i in range(count):
+        cursor["sort"] = [i]
+        yield "{:<{}}".format(i, size)
+
+
+@override_settings(CCDB_EXPORT_CHECKPOINT_INTERVAL=25)
+class CheckpointTests(SimpleTestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_checkpoints_are_stored(self):
+        cursor = {}
+        data = b"".join(
+            resume.checkpointed(
+                chunks_with_sort(cursor, 6), "KEY", "QUERY", cursor
+            )
+        )
+        self.assertEqual(60, len(data))
+        entry = cache.get("KEY")
+        self.assertEqual("QUERY", entry["query"])
+        self.assertEqual([[30, [2]], [60, [5]]], entry["checkpoints"])
+        self.assertEqual(60, entry["length"])
+
+    def test_interrupted_stream_has_no_length(self):
+        cursor = {}
+        stream = resume.checkpointed(
+            chunks_with_sort(cursor, 6), "KEY", "QUERY", cursor
+        )
+        for _ in range(4):
+            next(stream)
+        stream.close()
+        entry = cache.get("KEY")
+        self.assertEqual([[30, [2]]], entry["checkpoints"])
+        self.assertIsNone(entry["length"])
+        self.assertEqual(40, entry["sent"])
+
+    def test_resumed_stream_extends_checkpoints(self):
+        cache.set(
+            "KEY",
+            {"query": "QUERY", "checkpoints": [[30, [2]]], "length": None},
+        )
+        cursor = {}
+        entry = cache.get("KEY")
+        list(
+            resume.checkpointed(
+                chunks_with_sort(cursor, 3), "KEY", "QUERY", cursor, 30, entry
+            )
+        )
+        entry = cache.get("KEY")
+        self.assertEqual([[30, [2]], [60, [2]]], entry["checkpoints"])
+        self.assertEqual(60, entry["length"])
+
+    def test_closes_chunks(self):
+        chunks = mock.MagicMock()
+        chunks.__iter__.return_value = iter([b"a"])
+        list(resume.checkpointed(chunks, "KEY", "QUERY", {}))
+        chunks.close.assert_called_once_with()
+
+    def test_skip_bytes(self):
+        chunks = [b"abc", b"def", b"ghi"]
+        self.assertEqual(
+            b"efghi", b"".join(resume.skip_bytes(iter(chunks), 4))
+        )
+        self.assertEqual(b"ghi", b"".join(resume.skip_bytes(iter(chunks), 6)))
+
+
+class ResumePointTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        cache.set(
+            "KEY",
+            {
+                "query": "QUERY",
+                "checkpoints": [[30, [2]], [60, [5]]],
+                "length": 80,
+            },
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def request(self, **headers):
+        return self.factory.get("/", **headers)
+
+    def test_parse_resume_offset(self):
+        self.assertEqual(10, resume.parse_resume_offset("bytes=10-"))
+        for header in (None, "bytes=10-20", "bytes=-10", "items=1-", "x"):
+            self.assertIsNone(resume.parse_resume_offset(header), header)
+
+    def test_resume_from_checkpoint(self):
+        point = resume.resume_point(
+            self.request(HTTP_RANGE="bytes=45-"), "KEY"
+        )
+        offset, start, sort, entry = point
+        self.assertEqual((45, 30, [2]), (offset, start, sort))
+
+    def test_resume_before_first_checkpoint(self):
+        point = resume.resume_point(self.request(HTTP_RANGE="bytes=5-"), "KEY")
+        self.assertEqual((5, 0, None), point[:3])
+
+    def test_if_range(self):
+        request = self.request(HTTP_RANGE="bytes=45-", HTTP_IF_RANGE='"KEY"')
+        self.assertIsNotNone(resume.resume_point(request, "KEY"))
+        request = self.request(HTTP_RANGE="bytes=45-", HTTP_IF_RANGE='"OLD"')
+        self.assertIsNone(resume.resume_point(request, "KEY"))
+
+    def test_unknown_export(self):
+        request = self.request(HTTP_RANGE="bytes=45-")
+        self.assertIsNone(resume.resume_point(request, "OTHER"))
+
+    def test_unknown_length(self):
+        cache.set("KEY", dict(cache.get("KEY"), length=None))
+        request = self.request(HTTP_RANGE="bytes=45-")
+        self.assertIsNone(resume.resume_point(request, "KEY"))
+
+    def test_parse_resume_token(self):
+        self.assertEqual(
+            (TOKEN_KEY, 35),
+            resume.parse_resume_token("{}:35".format(TOKEN_KEY)),
+        )
+        for token in (None, "", TOKEN_KEY, "KEY:35", TOKEN_KEY + ":-1"):
+            self.assertIsNone(resume.parse_resume_token(token), token)
+
+    def test_token_point(self):
+        cache.set(
+            TOKEN_KEY,
+            {
+                "query": "QUERY",
+                "checkpoints": [[30, [2]]],
+                "length": None,
+                "sent": 40,
+            },
+        )
+        point = resume.token_point((TOKEN_KEY, 35), TOKEN_KEY)
+        self.assertEqual((35, 30, [2]), point[:3])
+        point = resume.token_point((TOKEN_KEY, 40), TOKEN_KEY)
+        self.assertEqual((40, 30, [2]), point[:3])
+        # Past what was sent, or for another export
+        self.assertIsNone(resume.token_point((TOKEN_KEY, 41), TOKEN_KEY))
+        self.assertIsNone(resume.token_point((TOKEN_KEY, 35), "b" * 40))
+
+    def test_content_range(self):
+        self.assertEqual("bytes 45-99/100", resume.content_range(45, 100))
+
+    def test_query_signature_ignores_order(self):
+        self.assertEqual(
+            resume.query_signature(QueryDict("a=1&b=2&a=3")),
+            resume.query_signature(QueryDict("b=2&a=3&a=1")),
+        )
+
+    @override_settings(CCDB_EXPORT_MAX_RESUMES=2)
+    def test_is_resumed_export(self):
+        request = self.factory.get(
+            "/?format=csv", HTTP_RANGE="bytes=45-", HTTP_IF_RANGE='"KEY"'
+        )
+        cache.set(
+            "KEY",
+            dict(
+                cache.get("KEY"),
+                query=resume.query_signature(request.GET),
+            ),
+        )
+        request.query_params = request.GET
+        self.assertTrue(resume.is_resumed_export(request, "1.2.3.4"))
+        self.assertTrue(resume.is_resumed_export(request, "1.2.3.4"))
+        self.assertFalse(resume.is_resumed_export(request, "1.2.3.4"))
+        self.assertTrue(resume.is_resumed_export(request, "5.6.7.8"))
+
+    def test_is_resumed_export_requires_known_length(self):
+        request = self.factory.get("/?format=csv", HTTP_IF_RANGE='"KEY"')
+        request.query_params = request.GET
+        cache.set(
+            "KEY",
+            dict(
+                cache.get("KEY"),
+                query=resume.query_signature(request.GET),
+            ),
+        )
+        # A whole export, or one past the end, is not a resume
+        for offset, resumed in (
+            (0, False),
+            (45, True),
+            (80, True),
+            (81, False),
+        ):
+            request.META["HTTP_RANGE"] = "bytes={}-".format(offset)
+            self.assertEqual(
+                resumed, resume.is_resumed_export(request, "1.2.3.4"), offset
+            )
+        # Nor is any range of an export whose length is unknown
+        cache.set("KEY", dict(cache.get("KEY"), length=None))
+        request.META["HTTP_RANGE"] = "bytes=45-"
+        self.assertFalse(resume.is_resumed_export(request, "1.2.3.4"))
+
+    def test_is_resumed_export_with_token(self):
+        request = self.factory.get(
+            "/", {"format": "csv", "resume": "{}:35".format(TOKEN_KEY)}
+        )
+        request.query_params = request.GET
+        cache.set(
+            TOKEN_KEY,
+            {
+                "query": resume.query_signature(QueryDict("format=csv")),
+                "checkpoints": [[30, [2]]],
+                "length": None,
+                "sent": 40,
+            },
+        )
+        self.assertTrue(resume.is_resumed_export(request, "1.2.3.4"))
+        request = self.factory.get(
+            "/", {"format": "csv", "resume": "{}:41".format(TOKEN_KEY)}
+        )
+        request.query_params = request.GET
+        self.assertFalse(resume.is_resumed_export(request, "1.2.3.4"))
+
+    def test_is_resumed_export_requires_matching_query(self):
+        request = self.factory.get(
+            "/?format=csv", HTTP_RANGE="bytes=45-", HTTP_IF_RANGE='"KEY"'
+        )
+        request.query_params = request.GET
+        self.assertFalse(resume.is_resumed_export(request, "1.2.3.4"))
+        del request.META["HTTP_IF_RANGE"]
+        self.assertFalse(resume.is_resumed_export(request, "1.2.3.4"))
+
+    def test_is_resumable(self):
+        self.assertFalse(resume.is_resumable("csv"))
+        with mock.patch("complaint_search.es_interface._EXPORT_ENGINE", "pit"):
+            self.assertTrue(resume.is_resumable("csv"))
+            self.assertFalse(resume.is_resumable("parquet"))
+            with mock.patch("complaint_search.es_interface._EXPORT_SLICES", 4):
+                self.assertFalse(resume.is_resumable("csv"))
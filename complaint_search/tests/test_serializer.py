@@ -68,6 +68,31 @@ class SearchInputSerializerTests(TestCase):
             ],
         )
 
+    def test_is_valid__valid_fields(self):
+        self.data["fields"] = ["complaint_id", "company"]
+        serializer = SearchInputSerializer(data=self.data)
+        self.assertTrue(serializer.is_valid())
+
+    def test_is_valid__invalid_fields(self):
+        for fields in (["complaint_id", "password"], []):
+            self.data["fields"] = fields
+            serializer = SearchInputSerializer(data=self.data)
+            self.assertFalse(serializer.is_valid())
+            self.assertIn("fields", serializer.errors)
+
+    def test_is_valid__export_fields_without_exported_field(self):
+        self.data["fields"] = ["has_narrative"]
+        serializer = SearchInputSerializer(data=self.data)
+        self.assertTrue(serializer.is_valid())
+
+        self.data["format"] = "csv"
+        serializer = SearchInputSerializer(data=self.data)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(
+            ["has_narrative is not included in exports"],
+            serializer.errors["fields"],
+        )
+
 
 class TrendsInputSerializerTests(TestCase):
     def setUp(self):
@@ -0,0 +1,273 @@
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import date
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase, override_settings
+
+from rest_framework.exceptions import ValidationError
+
+from complaint_search import es_interface, snapshots
+from complaint_search.compression import available_encodings
+
+
+CSV = b"Product,Issue\r\nMortgage,Trouble\r\n"
+
+MANIFEST = {
+    "version": "v1",
+    "path": "abc",
+    "record_count": 10,
+    "date_received_min": "2011-12-01",
+    "date_received_max": "2024-05-31",
+    "files": {"csv": {"identity": "complaints.csv"}},
+}
+
+
+def _export(**kwargs):
+    return StreamingHttpResponse(iter([CSV]))
+
+
+class CoversTests(SimpleTestCase):
+    def test_unfiltered(self):
+        params = {"format": "csv", "field": "all", "size": 100}
+        self.assertTrue(snapshots.covers(params, MANIFEST))
+
+    def test_default_params(self):
+        params = {"format": "csv", "sort": "relevance_desc", "frm": 0}
+        self.assertTrue(snapshots.covers(params, MANIFEST))
+
+    def test_filtered(self):
+        for params in (
+            {"format": "csv", "product": ["Mortgage"]},
+            {"format": "csv", "search_term": "bank"},
+            {"format": "csv", "sort": "created_date_desc"},
+            {"format": "csv", "fields": ["complaint_id"]},
+        ):
+            self.assertFalse(snapshots.covers(params, MANIFEST), params)
+
+    def test_date_range_spanning_snapshot(self):
+        params = {
+            "format": "csv",
+            "date_received_min": date(2011, 12, 1),
+            "date_received_max": date(2024, 6, 1),
+        }
+        self.assertTrue(snapshots.covers(params, MANIFEST))
+
+    def test_date_range_within_snapshot(self):
+        for params in (
+            {"format": "csv", "date_received_min": date(2011, 12, 2)},
+            {"format": "csv", "date_received_max": date(2024, 5, 31)},
+        ):
+            self.assertFalse(snapshots.covers(params, MANIFEST), params)
+
+
+@mock.patch.object(snapshots, "_date_received_range")
+@mock.patch(
+    "complaint_search.es_interface._get_cached_index_stats",
+    return_value={"total_record_count": 10},
+)
+@mock.patch(
+    "complaint_search.es_interface.get_index_version",
+    return_value=("v1", "2024-06-01"),
+)
+@mock.patch("complaint_search.es_interface.search", side_effect=_export)
+class BuildSnapshotsTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_build(self, mock_search, mock_version, mock_stats, mock_range):
+        mock_range.return_value = ("2011-12-01", "2024-05-31")
+        manifest = snapshots.build_snapshots(self.directory)
+        self.assertEqual("v1", manifest["version"])
+        self.assertEqual(10, manifest["record_count"])
+        self.assertEqual("2024-05-31", manifest["date_received_max"])
+        self.assertEqual(manifest, snapshots.read_manifest(self.directory))
+        self.assertEqual(["csv", "json"], sorted(manifest["files"]))
+        self.assertEqual(
+            {"identity"} | set(available_encodings()),
+            set(manifest["files"]["csv"]),
+        )
+        mock_search.assert_any_call(
+            agg_exclude=mock.ANY,
+            format="csv",
+            field="complaint_what_happened",
+            size=25,
+            frm=0,
+            sort="relevance_desc",
+            page=1,
+            no_aggs=False,
+            no_highlight=False,
+        )
+
+        path = os.path.join(self.directory, manifest["path"])
+        files = manifest["files"]["csv"]
+        with open(os.path.join(path, files["identity"]), "rb") as f:
+            self.assertEqual(CSV, f.read())
+        with open(os.path.join(path, files["gzip"]), "rb") as f:
+            self.assertEqual(CSV, gzip.decompress(f.read()))
+        self.assertEqual(files["gzip"], "complaints.csv.gz")
+
+    def test_current_snapshot_is_kept(
+        self, mock_search, mock_version, mock_stats, mock_range
+    ):
+        mock_range.return_value = ("2011-12-01", "2024-05-31")
+        snapshots.build_snapshots(self.directory)
+        mock_search.reset_mock()
+        snapshots.build_snapshots(self.directory)
+        mock_search.assert_not_called()
+        snapshots.build_snapshots(self.directory, force=True)
+        self.assertEqual(2, mock_search.call_count)
+
+    def test_old_snapshot_is_replaced(
+        self, mock_search, mock_version, mock_stats, mock_range
+    ):
+        mock_range.return_value = ("2011-12-01", "2024-05-31")
+        old = snapshots.build_snapshots(self.directory)
+        mock_version.return_value = ("v2", "2024-06-02")
+        new = snapshots.build_snapshots(self.directory)
+        self.assertEqual("v2", new["version"])
+        self.assertEqual(
+            sorted([new["path"], snapshots.MANIFEST]),
+            sorted(os.listdir(self.directory)),
+        )
+        self.assertNotEqual(old["path"], new["path"])
+
+    def test_rejected_format_is_skipped(
+        self, mock_search, mock_version, mock_stats, mock_range
+    ):
+        mock_range.return_value = ("2011-12-01", "2024-05-31")
+
+        def search(**kwargs):
+            if kwargs["format"] == "json":
+                raise ValidationError({"size": ["Too many results"]})
+            return _export()
+
+        mock_search.side_effect = search
+        with self.assertLogs("complaint_search.snapshots", "WARNING"):
+            manifest = snapshots.build_snapshots(self.directory)
+        self.assertEqual(["csv"], list(manifest["files"]))
+
+    def test_build_in_progress(
+        self, mock_search, mock_version, mock_stats, mock_range
+    ):
+        open(os.path.join(self.directory, "build.lock"), "w").close()
+        self.assertIsNone(snapshots.build_snapshots(self.directory))
+        mock_search.assert_not_called()
+
+    def test_command(self, mock_search, mock_version, mock_stats, mock_range):
+        mock_range.return_value = ("2011-12-01", "2024-05-31")
+        out = StringIO()
+        call_command(
+            "build_export_snapshots",
+            directory=self.directory,
+            formats=["csv"],
+            stdout=out,
+        )
+        self.assertIn("index version v1: csv", out.getvalue())
+        manifest = snapshots.read_manifest(self.directory)
+        self.assertEqual(["csv"], list(manifest["files"]))
+
+    @override_settings(CCDB_EXPORT_SNAPSHOT_DIR=None)
+    def test_command_requires_directory(
+        self, mock_search, mock_version, mock_stats, mock_range
+    ):
+        with self.assertRaises(CommandError):
+            call_command("build_export_snapshots")
+
+
+class FindSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        snapshots._write_manifest(self.directory, MANIFEST)
+        patcher = mock.patch(
+            "complaint_search.es_interface.get_index_version",
+            return_value=("v1", "2024-06-01"),
+        )
+        self.mock_version = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def find(self, **params):
+        with override_settings(CCDB_EXPORT_SNAPSHOT_DIR=self.directory):
+            return snapshots.find(params)
+
+    def test_find(self):
+        self.assertEqual(
+            {"identity": os.path.join(self.directory, "abc/complaints.csv")},
+            self.find(format="csv"),
+        )
+
+    def test_disabled(self):
+        self.assertIsNone(snapshots.find({"format": "csv"}))
+
+    def test_missing_format(self):
+        self.assertIsNone(self.find(format="ndjson"))
+
+    def test_filtered(self):
+        self.assertIsNone(self.find(format="csv", product=["Mortgage"]))
+
+    def test_stale_snapshot(self):
+        self.mock_version.return_value = ("v2", "2024-06-02")
+        self.assertIsNone(self.find(format="csv"))
+
+    def test_json_export_limit(self):
+        manifest = dict(
+            MANIFEST,
+            record_count=10**6,
+            files={"json": {"identity": "complaints.json"}},
+        )
+        snapshots._write_manifest(self.directory, manifest)
+        self.assertIsNone(self.find(format="json"))
+        with mock.patch.object(es_interface, "_EXPORT_ENFORCE_LIMIT", False):
+            self.assertIsNotNone(self.find(format="json"))
+
+
+class RefreshHookTests(SimpleTestCase):
+    def setUp(self):
+        es_interface._reset_caches()
+        self.addCleanup(es_interface._reset_caches)
+
+    def test_signal_sent_on_reload(self):
+        handler = mock.Mock()
+        es_interface.index_refreshed.connect(handler)
+        self.addCleanup(es_interface.index_refreshed.disconnect, handler)
+        es_interface._observe_index("last_indexed", "2024-06-01")
+        handler.assert_not_called()
+        es_interface._observe_index("last_indexed", "2024-06-01")
+        handler.assert_not_called()
+        es_interface._observe_index("last_indexed", "2024-06-02")
+        handler.assert_called_once_with(
+            signal=es_interface.index_refreshed, sender=None, generation=1
+        )
+
+    @mock.patch("complaint_search.snapshots.threading.Thread")
+    def test_rebuild_on_refresh(self, mock_thread):
+        with override_settings(
+            CCDB_EXPORT_SNAPSHOT_DIR="/tmp/snapshots",
+            CCDB_EXPORT_SNAPSHOT_ON_REFRESH=True,
+        ):
+            es_interface._observe_index("alias", "complaint-1")
+            es_interface._observe_index("alias", "complaint-2")
+        mock_thread.assert_called_once_with(
+            target=snapshots._build_in_background,
+            name="export-snapshots",
+            daemon=True,
+        )
+        mock_thread.return_value.start.assert_called_once_with()
+
+    @mock.patch("complaint_search.snapshots.threading.Thread")
+    def test_rebuild_on_refresh_disabled(self, mock_thread):
+        with override_settings(CCDB_EXPORT_SNAPSHOT_DIR="/tmp/snapshots"):
+            es_interface._observe_index("alias", "complaint-1")
+            es_interface._observe_index("alias", "complaint-2")
+        mock_thread.assert_not_called()
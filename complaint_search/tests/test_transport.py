@@ -0,0 +1,124 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from opensearchpy import ConnectionError as OpenSearchConnectionError
+
+from complaint_search.transport import (
+    POOL_STATS,
+    InstrumentedConnection,
+    JitteredTransport,
+    PoolStats,
+    backoff_delay,
+)
+
+
+class PoolStatsTests(SimpleTestCase):
+    def test_checkout_and_checkin(self):
+        stats = PoolStats()
+        stats.record_checkout(0.5)
+        stats.record_checkout(0.25)
+        stats.record_checkin()
+        snapshot = stats.snapshot()
+        self.assertEqual(2, snapshot["checkouts"])
+        self.assertEqual(1, snapshot["in_use"])
+        self.assertEqual(2, snapshot["max_in_use"])
+        self.assertEqual(0.75, snapshot["wait_time"])
+        self.assertEqual(0.5, snapshot["max_wait_time"])
+
+    def test_reset(self):
+        stats = PoolStats()
+        stats.record_checkout(1)
+        stats.record_retry()
+        stats.reset()
+        self.assertEqual(0, stats.snapshot()["checkouts"])
+        self.assertEqual(0, stats.snapshot()["retries"])
+
+
+class BackoffDelayTests(SimpleTestCase):
+    @mock.patch("complaint_search.transport.random.uniform")
+    def test_exponential_and_capped(self, mock_uniform):
+        mock_uniform.side_effect = lambda low, high: high
+        self.assertEqual(0.1, backoff_delay(0, 0.1, 2))
+        self.assertEqual(0.4, backoff_delay(2, 0.1, 2))
+        self.assertEqual(2, backoff_delay(10, 0.1, 2))
+
+
+class InstrumentedConnectionTests(SimpleTestCase):
+    def setUp(self):
+        POOL_STATS.reset()
+
+    def test_pool_checkouts_are_counted(self):
+        connection = InstrumentedConnection(
+            host="localhost", pool_maxsize=2, pool_block=True
+        )
+        self.assertTrue(connection.pool.block)
+        conn = connection.pool._get_conn()
+        self.assertEqual(1, POOL_STATS.snapshot()["in_use"])
+        connection.pool._put_conn(conn)
+        snapshot = POOL_STATS.snapshot()
+        self.assertEqual(1, snapshot["checkouts"])
+        self.assertEqual(0, snapshot["in_use"])
+
+    def test_pool_timeout_is_the_default_wait(self):
+        connection = InstrumentedConnection(
+            host="localhost", pool_maxsize=1, pool_block=True, pool_timeout=0
+        )
+        connection.pool._get_conn()
+        with self.assertRaises(Exception):
+            connection.pool._get_conn()
+
+
+@mock.patch("complaint_search.transport.time.sleep")
+class JitteredTransportTests(SimpleTestCase):
+    def setUp(self):
+        POOL_STATS.reset()
+
+    def make_transport(self):
+        transport = JitteredTransport(
+            [{"host": "localhost"}],
+            connection_class=InstrumentedConnection,
+            max_retries=2,
+            retry_backoff=0.1,
+            retry_backoff_max=1,
+        )
+        connection = transport.connection_pool.connection
+        connection.perform_request = mock.Mock()
+        return transport, connection
+
+    def test_retries_sleep_between_attempts(self, mock_sleep):
+        transport, connection = self.make_transport()
+        connection.perform_request.side_effect = OpenSearchConnectionError(
+            "N/A", "refused", None
+        )
+        with self.assertRaises(OpenSearchConnectionError):
+            transport.perform_request("GET", "/")
+        self.assertEqual(3, connection.perform_request.call_count)
+        self.assertEqual(2, mock_sleep.call_count)
+        self.assertEqual(2, POOL_STATS.snapshot()["retries"])
+
+    def test_success_after_retry(self, mock_sleep):
+        transport, connection = self.make_transport()
+        connection.perform_request.side_effect = [
+            OpenSearchConnectionError("N/A", "refused", None),
+            (200, {}, '{"ok": true}'),
+        ]
+        self.assertEqual({"ok": True}, transport.perform_request("GET", "/"))
+        self.assertEqual(1, mock_sleep.call_count)
+
+        connection.perform_request.side_effect = None
+        connection.perform_request.return_value = (200, {}, "{}")
+        transport.perform_request("GET", "/")
+        self.assertEqual(1, mock_sleep.call_count)
+
+    def test_after_request(self, mock_sleep):
+        transport, connection = self.make_transport()
+        transport.after_request = mock.Mock()
+        connection.perform_request.return_value = (200, {}, "{}")
+        transport.perform_request("GET", "/")
+        connection.perform_request.side_effect = OpenSearchConnectionError(
+            "N/A", "refused", None
+        )
+        with self.assertRaises(OpenSearchConnectionError):
+            transport.perform_request("GET", "/")
+        self.assertEqual(2, transport.after_request.call_count)
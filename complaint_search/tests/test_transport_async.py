@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from opensearchpy import ConnectionError as OpenSearchConnectionError
+from opensearchpy import NotFoundError
+
+from complaint_search.transport import POOL_STATS
+from complaint_search.transport_async import JitteredAsyncTransport
+
+
+@mock.patch("complaint_search.transport_async.asyncio.sleep")
+class JitteredAsyncTransportTests(SimpleTestCase):
+    def setUp(self):
+        POOL_STATS.reset()
+
+    async def make_transport(self, **kwargs):
+        transport = JitteredAsyncTransport(
+            [{"host": "localhost"}],
+            max_retries=2,
+            retry_backoff=0.1,
+            retry_backoff_max=1,
+            **kwargs,
+        )
+        await transport._async_call()
+        connection = transport.connection_pool.connection
+        connection.perform_request = mock.AsyncMock()
+        return transport, connection
+
+    async def test_retries_sleep_between_attempts(self, mock_sleep):
+        transport, connection = await self.make_transport()
+        connection.perform_request.side_effect = OpenSearchConnectionError(
+            "N/A", "refused", None
+        )
+        with self.assertRaises(OpenSearchConnectionError):
+            await transport.perform_request("GET", "/")
+        self.assertEqual(3, connection.perform_request.call_count)
+        self.assertEqual(2, mock_sleep.call_count)
+        self.assertEqual(2, POOL_STATS.snapshot()["retries"])
+        for (delay,), _ in mock_sleep.call_args_list:
+            self.assertLessEqual(delay, 1)
+
+    async def test_success_after_retry(self, mock_sleep):
+        transport, connection = await self.make_transport()
+        connection.perform_request.side_effect = [
+            OpenSearchConnectionError("N/A", "refused", None),
+            (200, {}, '{"ok": true}'),
+        ]
+        self.assertEqual(
+            {"ok": True}, await transport.perform_request("GET", "/")
+        )
+        self.assertEqual(1, mock_sleep.call_count)
+
+    async def test_errors_that_are_not_retried(self, mock_sleep):
+        transport, connection = await self.make_transport()
+        connection.perform_request.side_effect = NotFoundError(
+            404, "not found", {}
+        )
+        with self.assertRaises(NotFoundError):
+            await transport.perform_request("GET", "/")
+        self.assertEqual(1, connection.perform_request.call_count)
+        mock_sleep.assert_not_called()
+
+    async def test_after_request(self, mock_sleep):
+        after_request = mock.Mock()
+        transport, connection = await self.make_transport(
+            after_request=after_request
+        )
+        connection.perform_request.return_value = (200, {}, "{}")
+        await transport.perform_request("GET", "/")
+        connection.perform_request.side_effect = OpenSearchConnectionError(
+            "N/A", "refused", None
+        )
+        with self.assertRaises(OpenSearchConnectionError):
+            await transport.perform_request("GET", "/")
+        self.assertEqual(2, after_request.call_count)
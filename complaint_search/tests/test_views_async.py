@@ -0,0 +1,140 @@
+import json
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.test import RequestFactory, TestCase, override_settings
+
+from opensearchpy import TransportError
+from rest_framework import status
+
+from complaint_search import views_async
+from complaint_search.defaults import AGG_EXCLUDE_FIELDS, PARAMS
+from complaint_search.throttling import SearchAnonRateThrottle
+
+
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.orig_search_anon_rate = SearchAnonRateThrottle.rate
+        SearchAnonRateThrottle.rate = "2000/min"
+
+    def tearDown(self):
+        cache.clear()
+        SearchAnonRateThrottle.rate = self.orig_search_anon_rate
+
+    @mock.patch("complaint_search.es_interface_async.search")
+    async def test_search(self, mock_search):
+        mock_search.return_value = {"hits": "OK"}
+        request = self.factory.get("/", {"company": ["Bank 1"]})
+        response = await views_async.search(request)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({"hits": "OK"}, json.loads(response.content))
+        self.assertTrue(response.has_header("Edge-Cache-Tag"))
+        params = {
+            key: value
+            for key, value in PARAMS.items()
+            if key != "search_after"
+        }
+        mock_search.assert_called_once_with(
+            agg_exclude=AGG_EXCLUDE_FIELDS, company=["Bank 1"], **params
+        )
+
+    @mock.patch("complaint_search.es_interface_async.search")
+    async def test_search_invalid(self, mock_search):
+        request = self.factory.get("/", {"size": "-1"})
+        response = await views_async.search(request)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn("size", json.loads(response.content))
+        mock_search.assert_not_called()
+
+    @mock.patch("complaint_search.es_interface_async.search")
+    async def test_search_opensearch_error(self, mock_search):
+        mock_search.side_effect = TransportError(503, "unavailable", {})
+        request = self.factory.get("/")
+        with self.assertLogs("complaint_search.decorators", "ERROR"):
+            response = await views_async.search(request)
+        self.assertEqual(424, response.status_code)
+
+    @mock.patch("complaint_search.views.search")
+    async def test_search_export_uses_sync_view(self, mock_view):
+        mock_view.return_value = "EXPORT"
+        request = self.factory.get("/", {"format": "csv"})
+        self.assertEqual("EXPORT", await views_async.search(request))
+
+    @mock.patch("complaint_search.views.search")
+    async def test_search_export_negotiated_from_accept(self, mock_view):
+        mock_view.return_value = "EXPORT"
+        request = self.factory.get("/", HTTP_ACCEPT="text/csv")
+        self.assertEqual("EXPORT", await views_async.search(request))
+
+    @mock.patch("complaint_search.views.search")
+    async def test_search_unknown_format_uses_sync_view(self, mock_view):
+        mock_view.return_value = "NOT FOUND"
+        request = self.factory.get("/", {"format": "xml"})
+        self.assertEqual("NOT FOUND", await views_async.search(request))
+
+    @mock.patch("complaint_search.views.search")
+    @mock.patch("complaint_search.es_interface_async.search")
+    async def test_search_json_accept(self, mock_search, mock_view):
+        mock_search.return_value = {"hits": "OK"}
+        request = self.factory.get("/", HTTP_ACCEPT="application/json")
+        response = await views_async.search(request)
+        self.assertEqual({"hits": "OK"}, json.loads(response.content))
+        mock_view.assert_not_called()
+
+    @mock.patch("complaint_search.es_interface_async.search")
+    async def test_search_throttled(self, mock_search):
+        SearchAnonRateThrottle.rate = "1/min"
+        mock_search.return_value = {"hits": "OK"}
+        with self.settings(DEBUG=False):
+            await views_async.search(self.factory.get("/"))
+            response = await views_async.search(self.factory.get("/"))
+        self.assertEqual(
+            status.HTTP_429_TOO_MANY_REQUESTS, response.status_code
+        )
+        self.assertEqual("60", response["Retry-After"])
+
+    @override_settings(CCDB_RESPONSE_CACHE="responses")
+    @mock.patch(
+        "complaint_search.es_interface_async._get_cached_index_stats",
+        return_value={
+            "last_updated": "2017-01-01",
+            "last_indexed": "2017-01-02T12:00:00-05:00",
+            "total_record_count": 4,
+        },
+    )
+    @mock.patch("complaint_search.es_interface_async.search")
+    async def test_search_cached(self, mock_search, mock_stats):
+        mock_search.return_value = {"hits": "OK"}
+        try:
+            first = await views_async.search(self.factory.get("/"))
+            second = await views_async.search(self.factory.get("/"))
+            response = await views_async.search(
+                self.factory.get("/", HTTP_IF_NONE_MATCH=first["ETag"])
+            )
+        finally:
+            caches["responses"].clear()
+        self.assertEqual({"hits": "OK"}, json.loads(second.content))
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        mock_search.assert_called_once()
+
+    @mock.patch("complaint_search.es_interface_async.states_agg")
+    async def test_states(self, mock_states):
+        mock_states.return_value = {"aggregations": "OK"}
+        response = await views_async.states(self.factory.get("/geo/states"))
+        self.assertEqual({"aggregations": "OK"}, json.loads(response.content))
+
+    @mock.patch("complaint_search.es_interface_async.trends")
+    async def test_trends(self, mock_trends):
+        mock_trends.return_value = {"aggregations": "OK"}
+        request = self.factory.get(
+            "/trends", {"lens": "overview", "trend_interval": "month"}
+        )
+        response = await views_async.trends(request)
+        self.assertEqual({"aggregations": "OK"}, json.loads(response.content))
+
+    @mock.patch("complaint_search.es_interface_async.trends")
+    async def test_trends_invalid(self, mock_trends):
+        response = await views_async.trends(self.factory.get("/trends"))
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        mock_trends.assert_not_called()
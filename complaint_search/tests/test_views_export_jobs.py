@@ -0,0 +1,150 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from complaint_search import jobs
+from complaint_search.throttling import ExportAnonRateThrottle
+
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+CSV = b"Product,Issue\r\nMortgage,Trouble\r\n"
+
+
+@mock.patch(
+    "complaint_search.es_interface.get_index_version",
+    return_value=("v1", "2024-01-01"),
+)
+@mock.patch(
+    "complaint_search.es_interface.search",
+    side_effect=lambda **kwargs: StreamingHttpResponse(iter([CSV])),
+)
+class ExportJobViewTests(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.override = override_settings(CCDB_EXPORT_JOB_DIR=self.directory)
+        self.override.enable()
+        jobs._EXPORT_JOBS = None
+        self.orig_export_anon_rate = ExportAnonRateThrottle.rate
+        ExportAnonRateThrottle.rate = "2000/min"
+
+    def tearDown(self):
+        jobs._EXPORT_JOBS._executor.shutdown(wait=True)
+        jobs._EXPORT_JOBS = None
+        self.override.disable()
+        shutil.rmtree(self.directory)
+        cache.clear()
+        ExportAnonRateThrottle.rate = self.orig_export_anon_rate
+
+    def submit(self):
+        response = self.client.get(
+            reverse("complaint_search:search"),
+            {"format": "csv", "background": "true"},
+        )
+        jobs._EXPORT_JOBS._executor.shutdown(wait=True)
+        return response
+
+    def download(self, job_id, **extra):
+        url = reverse(
+            "complaint_search:export_download", kwargs={"job_id": job_id}
+        )
+        return self.client.get(url, **extra)
+
+    def test_background_export(self, mock_search, mock_version):
+        response = self.submit()
+        self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
+        job_id = response.data["id"]
+        status_url = reverse(
+            "complaint_search:export_status", kwargs={"job_id": job_id}
+        )
+        self.assertTrue(response["Location"].endswith(status_url))
+
+        response = self.client.get(status_url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(jobs.FINISHED, response.data["status"])
+        self.assertEqual(len(CSV), response.data["bytes_written"])
+        self.assertTrue(
+            response.data["download_url"].endswith(status_url + "/download")
+        )
+
+        response = self.download(job_id)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(CSV, b"".join(response.streaming_content))
+        self.assertEqual("text/csv", response["Content-Type"])
+        self.assertEqual("bytes", response["Accept-Ranges"])
+        self.assertIn("attachment", response["Content-Disposition"])
+
+    def test_download_range(self, mock_search, mock_version):
+        job_id = self.submit().data["id"]
+        response = self.download(job_id, HTTP_RANGE="bytes=8-12")
+        self.assertEqual(status.HTTP_206_PARTIAL_CONTENT, response.status_code)
+        self.assertEqual(CSV[8:13], b"".join(response.streaming_content))
+        self.assertEqual(
+            "bytes 8-12/{}".format(len(CSV)), response["Content-Range"]
+        )
+        self.assertEqual("5", response["Content-Length"])
+
+    def test_download_suffix_range(self, mock_search, mock_version):
+        job_id = self.submit().data["id"]
+        response = self.download(job_id, HTTP_RANGE="bytes=-4")
+        self.assertEqual(status.HTTP_206_PARTIAL_CONTENT, response.status_code)
+        self.assertEqual(CSV[-4:], b"".join(response.streaming_content))
+
+    def test_download_unsatisfiable_range(self, mock_search, mock_version):
+        job_id = self.submit().data["id"]
+        response = self.download(job_id, HTTP_RANGE="bytes=1000-")
+        self.assertEqual(
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            response.status_code,
+        )
+        self.assertEqual(
+            "bytes */{}".format(len(CSV)), response["Content-Range"]
+        )
+
+    def test_download_invalid_range_is_ignored(
+        self, mock_search, mock_version
+    ):
+        job_id = self.submit().data["id"]
+        for header in ("bytes=12-8", "bytes=-", "bytes=-4-", "bytes=a-5"):
+            response = self.download(job_id, HTTP_RANGE=header)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(CSV, b"".join(response.streaming_content))
+
+    def test_download_empty_suffix_range(self, mock_search, mock_version):
+        job_id = self.submit().data["id"]
+        response = self.download(job_id, HTTP_RANGE="bytes=-0")
+        self.assertEqual(
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            response.status_code,
+        )
+
+    def test_missing_job(self, mock_search, mock_version):
+        jobs.get_export_jobs()
+        url = reverse(
+            "complaint_search:export_status", kwargs={"job_id": "0" * 40}
+        )
+        self.assertEqual(
+            status.HTTP_404_NOT_FOUND, self.client.get(url).status_code
+        )
+        self.assertEqual(
+            status.HTTP_404_NOT_FOUND, self.download("0" * 40).status_code
+        )
+
+    def test_unfinished_job_not_downloadable(self, mock_search, mock_version):
+        export_jobs = jobs.get_export_jobs()
+        with mock.patch.object(export_jobs, "_executor"):
+            job = export_jobs.submit({"format": "csv"})
+        self.assertEqual(
+            status.HTTP_404_NOT_FOUND, self.download(job["id"]).status_code
+        )
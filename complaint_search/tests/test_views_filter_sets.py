@@ -0,0 +1,158 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from complaint_search import filter_sets
+from complaint_search.defaults import AGG_EXCLUDE_FIELDS
+from complaint_search.throttling import (
+    FilterSetAnonRateThrottle,
+    SearchAnonRateThrottle,
+)
+
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+ZIP_CODES = ["{:05}".format(i) for i in range(200)]
+
+
+class FilterSetViewTests(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.override = override_settings(CCDB_FILTER_SET_DIR=self.directory)
+        self.override.enable()
+        filter_sets._FILTER_SETS = None
+        self.url = reverse("complaint_search:filter_sets")
+        self.orig_filter_set_anon_rate = FilterSetAnonRateThrottle.rate
+        self.orig_search_anon_rate = SearchAnonRateThrottle.rate
+        FilterSetAnonRateThrottle.rate = "2000/min"
+        SearchAnonRateThrottle.rate = "2000/min"
+
+    def tearDown(self):
+        filter_sets._FILTER_SETS = None
+        self.override.disable()
+        shutil.rmtree(self.directory)
+        cache.clear()
+        FilterSetAnonRateThrottle.rate = self.orig_filter_set_anon_rate
+        SearchAnonRateThrottle.rate = self.orig_search_anon_rate
+
+    def register(self, data):
+        return self.client.post(self.url, data, format="json")
+
+    def test_register(self):
+        response = self.register(
+            {
+                "name": "Portfolio",
+                "filters": {"zip_code": ZIP_CODES, "not_state": ["FL"]},
+            }
+        )
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual("Portfolio", response.data["name"])
+        self.assertEqual(ZIP_CODES, response.data["filters"]["zip_code"])
+        self.assertEqual(response.data["url"], response["Location"])
+
+        response = self.client.get(response["Location"])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual("Portfolio", response.data["name"])
+
+    def test_register_is_idempotent(self):
+        first = self.register({"filters": {"company": ["B", "A"]}})
+        second = self.register({"filters": {"company": ["A", "B", "A"]}})
+        self.assertEqual(first.data["id"], second.data["id"])
+
+    def test_register_invalid(self):
+        for filters in (
+            {},
+            {"size": ["10"]},
+            {"fields": ["company"]},
+            {"state": ["XX"]},
+            {"zip_code": ["123"]},
+            {"company": []},
+            {"company": "A"},
+            {"product": ["A•B•C"]},
+        ):
+            response = self.register({"filters": filters})
+            self.assertEqual(
+                status.HTTP_400_BAD_REQUEST, response.status_code, filters
+            )
+            self.assertIn("filters", response.data)
+
+    @override_settings(CCDB_FILTER_SET_MAX_VALUES=100)
+    def test_register_too_many_values(self):
+        response = self.register({"filters": {"zip_code": ZIP_CODES}})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    @override_settings(CCDB_FILTER_SET_MAX_SETS=1)
+    def test_register_when_full(self):
+        self.register({"filters": {"company": ["A"]}})
+        response = self.register({"filters": {"company": ["B"]}})
+        self.assertEqual(
+            status.HTTP_503_SERVICE_UNAVAILABLE, response.status_code
+        )
+
+    @override_settings(CCDB_FILTER_SET_DIR=None)
+    def test_disabled(self):
+        response = self.register({"filters": {"company": ["A"]}})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        response = self.client.get(
+            reverse("complaint_search:search"), {"filter_set": "0" * 40}
+        )
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_get_unknown(self):
+        response = self.client.get(
+            reverse("complaint_search:filter_set", kwargs={"set_id": "0" * 40})
+        )
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_throttle(self):
+        FilterSetAnonRateThrottle.rate = "1/min"
+        with override_settings(DEBUG=False):
+            self.register({"filters": {"company": ["A"]}})
+            response = self.register({"filters": {"company": ["B"]}})
+        self.assertEqual(
+            status.HTTP_429_TOO_MANY_REQUESTS, response.status_code
+        )
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_search_with_filter_set(self, mock_search):
+        mock_search.return_value = {}
+        set_id = self.register({"filters": {"zip_code": ZIP_CODES}}).data["id"]
+        response = self.client.get(
+            reverse("complaint_search:search"), {"filter_set": set_id}
+        )
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        mock_search.assert_called_once()
+        kwargs = mock_search.call_args[1]
+        self.assertEqual(set_id, kwargs["filter_set"])
+        self.assertEqual(AGG_EXCLUDE_FIELDS, kwargs["agg_exclude"])
+        self.assertNotIn("zip_code", kwargs)
+
+    @mock.patch("complaint_search.es_interface.states_agg")
+    @mock.patch("complaint_search.es_interface.search")
+    def test_unknown_filter_set(self, mock_search, mock_states):
+        for name in ("search", "states"):
+            response = self.client.get(
+                reverse("complaint_search:" + name), {"filter_set": "0" * 40}
+            )
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+            self.assertIn("filter_set", response.data)
+        mock_search.assert_not_called()
+        mock_states.assert_not_called()
+
+    def test_malformed_filter_set(self):
+        response = self.client.get(
+            reverse("complaint_search:trends"),
+            {"filter_set": "not-an-id", "lens": "overview"},
+        )
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn("filter_set", response.data)
@@ -0,0 +1,136 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from complaint_search.throttling import SearchAnonRateThrottle
+
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+FLAGS = {"is_data_stale": False, "has_data_issue": False}
+
+
+@override_settings(CCDB_RESPONSE_CACHE="responses")
+@mock.patch(
+    "complaint_search.es_interface.get_meta_flags",
+    new=mock.Mock(return_value=FLAGS),
+)
+@mock.patch(
+    "complaint_search.es_interface.get_index_version",
+    return_value=("2017-01-02T12:00:00-05:00:4", "2017-01-02T12:00:00-05:00"),
+)
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        self.orig_search_anon_rate = SearchAnonRateThrottle.rate
+        SearchAnonRateThrottle.rate = "2000/min"
+
+    def tearDown(self):
+        caches["default"].clear()
+        caches["responses"].clear()
+        SearchAnonRateThrottle.rate = self.orig_search_anon_rate
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_search_cached(self, mock_essearch, mock_version):
+        mock_essearch.return_value = {"hits": "OK"}
+        url = reverse("complaint_search:search")
+        first = self.client.get(url, {"company": ["B", "A"], "field": "all"})
+        second = self.client.get(
+            url, {"company": ["A", "B"], "size": 25, "field": "_all"}
+        )
+        self.assertEqual(status.HTTP_200_OK, first.status_code)
+        self.assertEqual(status.HTTP_200_OK, second.status_code)
+        self.assertEqual({"hits": "OK"}, second.data)
+        self.assertEqual(1, mock_essearch.call_count)
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertEqual(
+            "Mon, 02 Jan 2017 17:00:00 GMT", first["Last-Modified"]
+        )
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_search_if_none_match(self, mock_essearch, mock_version):
+        mock_essearch.return_value = {"hits": "OK"}
+        url = reverse("complaint_search:search")
+        first = self.client.get(url)
+        mock_essearch.reset_mock()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(first["ETag"], response["ETag"])
+        self.assertTrue(response.has_header("Edge-Cache-Tag"))
+        mock_essearch.assert_not_called()
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_search_new_index_version(self, mock_essearch, mock_version):
+        mock_essearch.return_value = {"hits": "OK"}
+        url = reverse("complaint_search:search")
+        first = self.client.get(url)
+        mock_version.return_value = (
+            "2017-01-03T12:00:00-05:00:5",
+            "2017-01-03T12:00:00-05:00",
+        )
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(status.HTTP_200_OK, second.status_code)
+        self.assertEqual(2, mock_essearch.call_count)
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_search_new_meta_flags(self, mock_essearch, mock_version):
+        mock_essearch.return_value = {"hits": "OK"}
+        url = reverse("complaint_search:search")
+        first = self.client.get(url)
+        with mock.patch(
+            "complaint_search.es_interface.get_meta_flags",
+            return_value=dict(FLAGS, has_data_issue=True),
+        ):
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(status.HTTP_200_OK, second.status_code)
+        self.assertNotEqual(first["ETag"], second["ETag"])
+        self.assertEqual(2, mock_essearch.call_count)
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_downgraded_search_not_cached(self, mock_essearch, mock_version):
+        mock_essearch.return_value = {"_meta": {"downgraded": True}}
+        url = reverse("complaint_search:search")
+        first = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, first.status_code)
+        self.assertFalse(first.has_header("ETag"))
+        self.assertFalse(first.has_header("Last-Modified"))
+        mock_essearch.return_value = {"hits": "OK"}
+        second = self.client.get(url)
+        self.assertEqual({"hits": "OK"}, second.data)
+        self.assertEqual(2, mock_essearch.call_count)
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_search_export_not_cached(self, mock_essearch, mock_version):
+        mock_essearch.return_value = iter(["a,b\r\n"])
+        url = reverse("complaint_search:search")
+        response = self.client.get(url, {"format": "csv"})
+        self.assertFalse(response.has_header("ETag"))
+        mock_version.assert_not_called()
+
+    @mock.patch("complaint_search.es_interface.states_agg")
+    def test_states_cached(self, mock_states, mock_version):
+        mock_states.return_value = {"aggregations": "OK"}
+        url = reverse("complaint_search:states")
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual({"aggregations": "OK"}, response.data)
+        self.assertEqual(1, mock_states.call_count)
+
+    @mock.patch("complaint_search.es_interface.trends")
+    def test_trends_cached(self, mock_trends, mock_version):
+        mock_trends.return_value = {"aggregations": "OK"}
+        url = reverse("complaint_search:trends")
+        params = {"lens": "overview", "trend_interval": "month"}
+        self.client.get(url, params)
+        response = self.client.get(url, params)
+        self.assertEqual({"aggregations": "OK"}, response.data)
+        self.assertEqual(1, mock_trends.call_count)
+        self.client.get(url, {"lens": "overview", "trend_interval": "year"})
+        self.assertEqual(2, mock_trends.call_count)
@@ -658,6 +658,27 @@ class SearchTests(APITestCase):
         )
         self.assertEqual("OK", response.data)
 
+    @mock.patch("complaint_search.es_interface.search")
+    def test_search_with_fields__valid(self, mock_essearch):
+        url = reverse("complaint_search:search")
+        url += "?fields=complaint_id&fields=company"
+        mock_essearch.return_value = "OK"
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        mock_essearch.assert_called_once_with(
+            agg_exclude=AGG_EXCLUDE_FIELDS,
+            **self.buildDefaultParams({"fields": ["complaint_id", "company"]}),
+        )
+
+    @mock.patch("complaint_search.es_interface.search")
+    def test_search_with_fields__invalid(self, mock_essearch):
+        url = reverse("complaint_search:search")
+        url += "?fields=complaint_id&fields=not_a_field"
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn("fields", response.data)
+        mock_essearch.assert_not_called()
+
     @mock.patch("complaint_search.es_interface.search")
     def test_search_with_submitted_via__valid(self, mock_essearch):
         url = reverse("complaint_search:search")
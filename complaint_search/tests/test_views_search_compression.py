@@ -0,0 +1,84 @@
+import gzip
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from complaint_search.throttling import ExportAnonRateThrottle
+
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+CSV = ["Product,Issue\r\n", "Mortgage,Trouble\r\n" * 100]
+
+
+@override_settings(CCDB_EXPORT_COMPRESSION=True)
+@mock.patch("complaint_search.es_interface.search", return_value=CSV)
+class SearchCompressionTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("complaint_search:search")
+        self.orig_export_anon_rate = ExportAnonRateThrottle.rate
+        ExportAnonRateThrottle.rate = "2000/min"
+
+    def tearDown(self):
+        cache.clear()
+        ExportAnonRateThrottle.rate = self.orig_export_anon_rate
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    @mock.patch("complaint_search.views.negotiate_encoding")
+    def test_negotiated_encoding(self, mock_negotiate, mock_essearch):
+        mock_negotiate.return_value = "gzip"
+        response = self.client.get(
+            self.url, {"format": "csv"}, HTTP_ACCEPT_ENCODING="gzip, zstd"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_negotiate.assert_called_once_with("gzip, zstd")
+        self.assertEqual("gzip", response["Content-Encoding"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual("text/csv", response["Content-Type"])
+        self.assertEqual(
+            "".join(CSV).encode("utf-8"),
+            gzip.decompress(self.content(response)),
+        )
+
+    def test_no_accept_encoding(self, mock_essearch):
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual("".join(CSV).encode("utf-8"), self.content(response))
+
+    @override_settings(CCDB_EXPORT_COMPRESSION=False)
+    def test_compression_disabled(self, mock_essearch):
+        response = self.client.get(
+            self.url, {"format": "json"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_gzip_attachment(self, mock_essearch):
+        response = self.client.get(
+            self.url,
+            {"format": "csv", "compression": "gzip"},
+            HTTP_ACCEPT_ENCODING="gzip",
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual("application/gzip", response["Content-Type"])
+        self.assertTrue(response["Content-Disposition"].endswith('.csv.gz"'))
+        self.assertEqual(
+            "".join(CSV).encode("utf-8"),
+            gzip.decompress(self.content(response)),
+        )
+
+    def test_parquet_is_not_compressed(self, mock_essearch):
+        response = self.client.get(
+            self.url, {"format": "parquet"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertNotIn("Accept-Encoding", response.get("Vary", ""))
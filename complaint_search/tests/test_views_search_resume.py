@@ -0,0 +1,248 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from complaint_search.throttling import ExportAnonRateThrottle
+
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+ROWS = ["row {:02}\n".format(i) for i in range(10)]
+CONTENT = "".join(ROWS).encode("utf-8")
+
+
+def fake_export(agg_exclude=None, cursor=None, search_after=None, **kwargs):
+    start = 0 if search_after is None else search_after[0] + 1
+
+    def stream():
+        for i in range(start, len(ROWS)):
+            cursor["sort"] = [i]
+            yield ROWS[i]
+
+    return StreamingHttpResponse(stream())
+
+
+@override_settings(
+    CCDB_EXPORT_CHECKPOINT_INTERVAL=20, CCDB_EXPORT_COMPRESSION=True
+)
+@mock.patch("complaint_search.es_interface._EXPORT_ENGINE", "pit")
+@mock.patch(
+    "complaint_search.es_interface.get_index_version",
+    return_value=("v1", "2024-06-01"),
+)
+@mock.patch(
+    "complaint_search.es_interface.resumable_export", side_effect=fake_export
+)
+class SearchResumeTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("complaint_search:search")
+        self.orig_export_anon_rate = ExportAnonRateThrottle.rate
+        ExportAnonRateThrottle.rate = "1/min"
+
+    def tearDown(self):
+        cache.clear()
+        ExportAnonRateThrottle.rate = self.orig_export_anon_rate
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def start(self):
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response
+
+    def test_export_is_resumable(self, mock_export, mock_version):
+        response = self.start()
+        self.assertEqual("bytes", response["Accept-Ranges"])
+        self.assertTrue(response["ETag"].startswith('"'))
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(CONTENT, self.content(response))
+        self.assertIsNone(mock_export.call_args[1]["search_after"])
+
+        response = self.client.get(
+            self.url,
+            {"format": "csv"},
+            HTTP_RANGE="bytes=45-",
+            HTTP_IF_RANGE=response["ETag"],
+        )
+        self.assertEqual(status.HTTP_206_PARTIAL_CONTENT, response.status_code)
+        self.assertEqual(
+            "bytes 45-{}/{}".format(len(CONTENT) - 1, len(CONTENT)),
+            response["Content-Range"],
+        )
+        self.assertEqual(CONTENT[45:], self.content(response))
+        # Restarted after the checkpoint at byte 42, the end of row 5
+        self.assertEqual([5], mock_export.call_args[1]["search_after"])
+
+    def test_interrupted_export_is_sent_whole(
+        self, mock_export, mock_version
+    ):
+        response = self.start()
+        stream = iter(response.streaming_content)
+        received = b"".join(next(stream) for _ in range(5))
+        response.close()
+
+        # Its length is unknown, so it cannot be resumed and the retry is
+        # only answered once the throttle allows it
+        ExportAnonRateThrottle.rate = "2000/min"
+        response = self.client.get(
+            self.url,
+            {"format": "csv"},
+            HTTP_RANGE="bytes={}-".format(len(received)),
+            HTTP_IF_RANGE=response["ETag"],
+        )
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotIn("Content-Range", response)
+        self.assertEqual(CONTENT, self.content(response))
+
+        # Once it has been sent whole, it can be resumed
+        response = self.client.get(
+            self.url,
+            {"format": "csv"},
+            HTTP_RANGE="bytes={}-".format(len(received)),
+            HTTP_IF_RANGE=response["ETag"],
+        )
+        self.assertEqual(status.HTTP_206_PARTIAL_CONTENT, response.status_code)
+        self.assertEqual("bytes 35-69/70", response["Content-Range"])
+        self.assertEqual(CONTENT, received + self.content(response))
+
+    def test_interrupted_export_resumes_with_token(
+        self, mock_export, mock_version
+    ):
+        response = self.start()
+        stream = iter(response.streaming_content)
+        received = b"".join(next(stream) for _ in range(5))
+        response.close()
+
+        token = "{}:{}".format(response["ETag"].strip('"'), len(received))
+        response = self.client.get(
+            self.url, {"format": "csv", "resume": token}
+        )
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertFalse(response.has_header("Content-Range"))
+        self.assertFalse(response.has_header("ETag"))
+        self.assertEqual(CONTENT, received + self.content(response))
+        # Restarted after the checkpoint at byte 21, the end of row 2
+        self.assertEqual([2], mock_export.call_args[1]["search_after"])
+
+    def test_invalid_resume_token(self, mock_export, mock_version):
+        etag = self.start()["ETag"].strip('"')
+        ExportAnonRateThrottle.rate = "2000/min"
+        for token in ("35", etag + ":1000", "b" * 40 + ":0"):
+            response = self.client.get(
+                self.url, {"format": "csv", "resume": token}
+            )
+            self.assertEqual(
+                status.HTTP_400_BAD_REQUEST, response.status_code, token
+            )
+            self.assertIn("resume", response.data)
+        with mock.patch("complaint_search.es_interface._EXPORT_ENGINE", ""):
+            response = self.client.get(
+                self.url, {"format": "csv", "resume": etag + ":0"}
+            )
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_stale_if_range_sends_everything(self, mock_export, mock_version):
+        etag = self.start()["ETag"]
+        mock_version.return_value = ("v2", "2024-06-02")
+        ExportAnonRateThrottle.rate = "2000/min"
+        response = self.client.get(
+            self.url,
+            {"format": "csv"},
+            HTTP_RANGE="bytes=45-",
+            HTTP_IF_RANGE=etag,
+        )
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+        self.assertEqual(CONTENT, self.content(response))
+
+    def test_range_past_end(self, mock_export, mock_version):
+        response = self.start()
+        self.content(response)
+        # Not a resume, so only answered once the throttle allows it
+        ExportAnonRateThrottle.rate = "2000/min"
+        response = self.client.get(
+            self.url,
+            {"format": "csv"},
+            HTTP_RANGE="bytes=1000-",
+            HTTP_IF_RANGE=response["ETag"],
+        )
+        self.assertEqual(
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            response.status_code,
+        )
+
+    @override_settings(DEBUG=False)
+    def test_resume_is_not_throttled(self, mock_export, mock_version):
+        response = self.start()
+        self.content(response)
+        etag = response["ETag"]
+
+        response = self.client.get(
+            self.url,
+            {"format": "csv"},
+            HTTP_RANGE="bytes=45-",
+            HTTP_IF_RANGE=etag,
+        )
+        self.assertEqual(status.HTTP_206_PARTIAL_CONTENT, response.status_code)
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(
+            status.HTTP_429_TOO_MANY_REQUESTS, response.status_code
+        )
+        response = self.client.get(
+            self.url,
+            {"format": "json"},
+            HTTP_RANGE="bytes=45-",
+            HTTP_IF_RANGE=etag,
+        )
+        self.assertEqual(
+            status.HTTP_429_TOO_MANY_REQUESTS, response.status_code
+        )
+
+    @override_settings(DEBUG=False)
+    def test_whole_export_is_throttled(self, mock_export, mock_version):
+        response = self.start()
+        self.content(response)
+        etag = response["ETag"]
+        for range_header in ("bytes=0-", "bytes=1000-"):
+            response = self.client.get(
+                self.url,
+                {"format": "csv"},
+                HTTP_RANGE=range_header,
+                HTTP_IF_RANGE=etag,
+            )
+            self.assertEqual(
+                status.HTTP_429_TOO_MANY_REQUESTS, response.status_code
+            )
+
+    def test_resumable_export_is_not_encoded(
+        self, mock_export, mock_version
+    ):
+        response = self.client.get(
+            self.url,
+            {"format": "csv"},
+            HTTP_ACCEPT_ENCODING="gzip, deflate, br, zstd",
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual("bytes", response["Accept-Ranges"])
+        self.assertEqual(CONTENT, self.content(response))
+
+        response = self.client.get(
+            self.url,
+            {"format": "csv"},
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_RANGE="bytes=35-",
+            HTTP_IF_RANGE=response["ETag"],
+        )
+        self.assertEqual(status.HTTP_206_PARTIAL_CONTENT, response.status_code)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(CONTENT[35:], self.content(response))
@@ -0,0 +1,113 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from complaint_search import snapshots
+from complaint_search.throttling import ExportAnonRateThrottle
+
+
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+CSV = b"Product,Issue\r\nMortgage,Trouble\r\n"
+
+
+@mock.patch(
+    "complaint_search.es_interface.get_index_version",
+    return_value=("v1", "2024-06-01"),
+)
+@mock.patch("complaint_search.es_interface.search", return_value=["live"])
+class SearchSnapshotTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("complaint_search:search")
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, "abc"))
+        files = {"identity": "complaints.csv", "gzip": "complaints.csv.gz"}
+        with open(
+            os.path.join(self.directory, "abc", files["identity"]), "wb"
+        ) as f:
+            f.write(CSV)
+        with open(
+            os.path.join(self.directory, "abc", files["gzip"]), "wb"
+        ) as f:
+            f.write(gzip.compress(CSV))
+        snapshots._write_manifest(
+            self.directory,
+            {
+                "version": "v1",
+                "path": "abc",
+                "record_count": 1,
+                "date_received_min": "2011-12-01",
+                "date_received_max": "2024-05-31",
+                "files": {"csv": files},
+            },
+        )
+        self.override = override_settings(
+            CCDB_EXPORT_SNAPSHOT_DIR=self.directory,
+            CCDB_EXPORT_COMPRESSION=True,
+        )
+        self.override.enable()
+        self.orig_export_anon_rate = ExportAnonRateThrottle.rate
+        ExportAnonRateThrottle.rate = "2000/min"
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.directory)
+        cache.clear()
+        ExportAnonRateThrottle.rate = self.orig_export_anon_rate
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_serves_snapshot(self, mock_search, mock_version):
+        response = self.client.get(
+            self.url, {"format": "csv", "date_received_min": "2011-12-01"}
+        )
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(CSV, self.content(response))
+        self.assertEqual("text/csv", response["Content-Type"])
+        self.assertEqual(str(len(CSV)), response["Content-Length"])
+        self.assertIn(".csv", response["Content-Disposition"])
+        self.assertFalse(response.has_header("Content-Encoding"))
+        mock_search.assert_not_called()
+
+    def test_serves_precompressed_snapshot(self, mock_search, mock_version):
+        response = self.client.get(
+            self.url, {"format": "csv"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual("gzip", response["Content-Encoding"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(CSV, gzip.decompress(self.content(response)))
+        mock_search.assert_not_called()
+
+    def test_gzip_download(self, mock_search, mock_version):
+        response = self.client.get(
+            self.url, {"format": "csv", "compression": "gzip"}
+        )
+        self.assertEqual("application/gzip", response["Content-Type"])
+        self.assertIn(".csv.gz", response["Content-Disposition"])
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(CSV, gzip.decompress(self.content(response)))
+
+    def test_filtered_export_is_live(self, mock_search, mock_version):
+        response = self.client.get(
+            self.url, {"format": "csv", "product": "Mortgage"}
+        )
+        self.assertEqual(b"live", self.content(response))
+        mock_search.assert_called_once()
+
+    def test_missing_file_is_live(self, mock_search, mock_version):
+        shutil.rmtree(os.path.join(self.directory, "abc"))
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(b"live", self.content(response))
@@ -5,6 +5,7 @@ from django.conf import settings
 from rest_framework.throttling import AnonRateThrottle
 
 from complaint_search.defaults import EXPORT_FORMATS
+from complaint_search.resume import is_resumed_export
 
 
 _CCDB_UI_URL = os.environ.get(
@@ -28,6 +29,15 @@ class CCDBRateThrottle(AnonRateThrottle):
             and request.query_params.get("format") in EXPORT_FORMATS
         )
 
+    def is_resumed_export(self, request):
+        # Both export throttles check every request, so the answer is kept
+        # on the request to count each resume once.
+        if not hasattr(request, "_ccdb_resumed_export"):
+            request._ccdb_resumed_export = is_resumed_export(
+                request, self.get_ident(request)
+            )
+        return request._ccdb_resumed_export
+
 
 class CCDBAnonRateThrottle(CCDBRateThrottle):
     scope = "ccdb_anon"
@@ -83,7 +93,7 @@ class ExportUIRateThrottle(CCDBUIRateThrottle):
     rate = "6/min"
 
     def allow_request(self, request, view):
-        if self.is_export(request):
+        if self.is_export(request) and not self.is_resumed_export(request):
             return super(ExportUIRateThrottle, self).allow_request(
                 request, view
             )
@@ -96,7 +106,7 @@ class ExportAnonRateThrottle(CCDBAnonRateThrottle):
     rate = "2/min"
 
     def allow_request(self, request, view):
-        if self.is_export(request):
+        if self.is_export(request) and not self.is_resumed_export(request):
             return super(ExportAnonRateThrottle, self).allow_request(
                 request, view
             )
@@ -104,6 +114,11 @@ class ExportAnonRateThrottle(CCDBAnonRateThrottle):
             return True
 
 
+class FilterSetAnonRateThrottle(CCDBAnonRateThrottle):
+    scope = "ccdb_anon_filter_set"
+    rate = "10/min"
+
+
 # class DocumentUIRateThrottle(CCDBUIRateThrottle):
 #     scope = 'ccdb_ui_document'
 #     # rate needs to be set if use
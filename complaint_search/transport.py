@@ -0,0 +1,144 @@
+import random
+import threading
+import time
+
+from opensearchpy import Transport, Urllib3HttpConnection
+
+
+class PoolStats(object):
+    """
+    Thread-safe counters for connection pool checkouts.
+
+    `wait_time` accumulates the seconds spent waiting for a pooled
+    connection, so a growing `wait_time / checkouts` means the pool is too
+    small for the number of threads sharing it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.in_use = 0
+            self.max_in_use = 0
+            self.wait_time = 0.0
+            self.max_wait_time = 0.0
+            self.retries = 0
+
+    def record_checkout(self, waited):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+    def record_checkin(self):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "wait_time": self.wait_time,
+                "max_wait_time": self.max_wait_time,
+                "retries": self.retries,
+            }
+
+
+POOL_STATS = PoolStats()
+
+
+class InstrumentedConnection(Urllib3HttpConnection):
+    """
+    A urllib3 connection that records pool checkouts in POOL_STATS.
+
+    With `pool_block` set, threads wait up to `pool_timeout` seconds for a
+    free connection instead of opening one that is discarded afterwards.
+    """
+
+    def __init__(self, *args, pool_block=False, pool_timeout=None, **kwargs):
+        self.pool_block = pool_block
+        self.pool_timeout = pool_timeout
+        super().__init__(*args, **kwargs)
+
+    def _create_urllib3_pool(self):
+        super()._create_urllib3_pool()
+        pool = self.pool
+        pool.block = self.pool_block
+        get_conn = pool._get_conn
+        put_conn = pool._put_conn
+
+        def _get_conn(timeout=None):
+            if timeout is None:
+                timeout = self.pool_timeout
+            start = time.monotonic()
+            conn = get_conn(timeout=timeout)
+            POOL_STATS.record_checkout(time.monotonic() - start)
+            return conn
+
+        def _put_conn(conn):
+            POOL_STATS.record_checkin()
+            return put_conn(conn)
+
+        pool._get_conn = _get_conn
+        pool._put_conn = _put_conn
+
+
+def backoff_delay(attempt, base, cap):
+    """Return a "full jitter" delay for a zero-based retry attempt."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class JitteredTransport(Transport):
+    """
+    A Transport that sleeps with exponential backoff and jitter between
+    retries, so that a struggling cluster is not hit by synchronized bursts.
+
+    `after_request`, if given, is called after every request.
+    """
+
+    def __init__(
+        self,
+        *args,
+        retry_backoff=0.1,
+        retry_backoff_max=2.0,
+        after_request=None,
+        **kw,
+    ):
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.after_request = after_request
+        self._attempts = threading.local()
+        super().__init__(*args, **kw)
+
+    def perform_request(self, *args, **kwargs):
+        self._attempts.value = 0
+        try:
+            return super().perform_request(*args, **kwargs)
+        finally:
+            if self.after_request:
+                self.after_request()
+
+    def mark_dead(self, connection):
+        # Transport only marks a connection dead when it is going to retry,
+        # or is about to raise on the last attempt.
+        super().mark_dead(connection)
+        attempt = getattr(self._attempts, "value", 0)
+        self._attempts.value = attempt + 1
+        if attempt < self.max_retries:
+            POOL_STATS.record_retry()
+            time.sleep(
+                backoff_delay(
+                    attempt, self.retry_backoff, self.retry_backoff_max
+                )
+            )
@@ -0,0 +1,65 @@
+"""
+Async counterpart of JitteredTransport.
+
+Requires the optional aiohttp dependency (`pip install ccdb5-api[async]`).
+"""
+import asyncio
+
+from opensearchpy import (
+    AsyncTransport,
+    ConnectionError,
+    ConnectionTimeout,
+    TransportError,
+)
+
+from complaint_search.transport import POOL_STATS, backoff_delay
+
+
+class JitteredAsyncTransport(AsyncTransport):
+    """
+    An AsyncTransport that awaits exponential backoff with jitter between
+    retries, like JitteredTransport, and counts them in POOL_STATS.
+
+    AsyncTransport retries without a chance to wait, so it is left with no
+    retries of its own and the `max_retries` loop runs here instead.
+    """
+
+    def __init__(
+        self,
+        *args,
+        max_retries=3,
+        retry_backoff=0.1,
+        retry_backoff_max=2.0,
+        after_request=None,
+        **kw,
+    ):
+        self.retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.after_request = after_request
+        super().__init__(*args, max_retries=0, **kw)
+
+    def _is_retryable(self, error):
+        if isinstance(error, ConnectionTimeout):
+            return self.retry_on_timeout
+        if isinstance(error, ConnectionError):
+            return True
+        return error.status_code in self.retry_on_status
+
+    async def perform_request(self, *args, **kwargs):
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    return await super().perform_request(*args, **kwargs)
+                except TransportError as e:
+                    if attempt == self.retries or not self._is_retryable(e):
+                        raise
+                POOL_STATS.record_retry()
+                await asyncio.sleep(
+                    backoff_delay(
+                        attempt, self.retry_backoff, self.retry_backoff_max
+                    )
+                )
+        finally:
+            if self.after_request:
+                self.after_request()
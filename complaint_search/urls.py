@@ -1,9 +1,16 @@
+from django.conf import settings
 from django.urls import re_path
 from django.views.generic.base import RedirectView
 
 import complaint_search.views
 
 
+if getattr(settings, "CCDB_ASYNC_VIEWS", False):
+    import complaint_search.views_async as search_views
+else:
+    search_views = complaint_search.views
+
+
 app_name = "complaint_search"
 
 urlpatterns = [
@@ -21,8 +28,28 @@ urlpatterns = [
     re_path(
         r"^(?P<id>[0-9]+)$", complaint_search.views.document, name="complaint"
     ),
-    re_path(r"^$", complaint_search.views.search, name="search"),
-    re_path(r"^geo/states", complaint_search.views.states, name="states"),
+    re_path(r"^$", search_views.search, name="search"),
+    re_path(
+        r"^exports/(?P<job_id>[0-9a-f]{40})$",
+        complaint_search.views.export_status,
+        name="export_status",
+    ),
+    re_path(
+        r"^exports/(?P<job_id>[0-9a-f]{40})/download$",
+        complaint_search.views.export_download,
+        name="export_download",
+    ),
+    re_path(
+        r"^filter-sets$",
+        complaint_search.views.register_filter_set,
+        name="filter_sets",
+    ),
+    re_path(
+        r"^filter-sets/(?P<set_id>[0-9a-f]{40})$",
+        complaint_search.views.filter_set,
+        name="filter_set",
+    ),
+    re_path(r"^geo/states", search_views.states, name="states"),
     re_path(r"^geo", RedirectView.as_view(url="/geo/states"), name="geo"),
-    re_path(r"^trends", complaint_search.views.trends, name="trends"),
+    re_path(r"^trends", search_views.trends, name="trends"),
 ]
@@ -1,7 +1,21 @@
+import os
 from datetime import datetime
 
 from django.conf import settings
-from django.http import StreamingHttpResponse
+from django.core.cache import caches
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.urls import reverse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_vary_headers,
+    quote_etag,
+)
+from django.utils.http import http_date
 
 from rest_framework import status
 from rest_framework.decorators import (
@@ -12,16 +26,30 @@ from rest_framework.decorators import (
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from complaint_search import es_interface
+from complaint_search import es_interface, filter_sets, jobs, resume, snapshots
+from complaint_search.cache import canonical_hash, canonical_params
+from complaint_search.compression import (
+    available_encodings,
+    compress_stream,
+    negotiate_encoding,
+)
 from complaint_search.decorators import catch_es_error
 from complaint_search.defaults import (
     AGG_EXCLUDE_FIELDS,
+    COMPRESSIBLE_EXPORT_FORMATS,
     EXCLUDE_PREFIX,
+    EXPORT_CHUNK_SIZE,
     EXPORT_FORMATS,
     FORMAT_CONTENT_TYPE_MAP,
 )
-from complaint_search.renderers import CSVRenderer, DefaultRenderer
+from complaint_search.renderers import (
+    CSVRenderer,
+    DefaultRenderer,
+    NDJSONRenderer,
+    ParquetRenderer,
+)
 from complaint_search.serializer import (
+    FilterSetSerializer,
     SearchInputSerializer,
     SuggestFilterInputSerializer,
     SuggestInputSerializer,
@@ -31,6 +59,7 @@ from complaint_search.throttling import (
     DocumentAnonRateThrottle,
     ExportAnonRateThrottle,
     ExportUIRateThrottle,
+    FilterSetAnonRateThrottle,
     SearchAnonRateThrottle,
 )
 
@@ -47,6 +76,7 @@ QPARAMS_VARS = (
     "date_received_max",
     "date_received_min",
     "field",
+    "filter_set",
     "focus",
     "frm",
     "lens",
@@ -80,6 +110,9 @@ QPARAMS_LISTS = (
 
 QPARAMS_NOT_LISTS = [EXCLUDE_PREFIX + x for x in QPARAMS_LISTS]
 
+# List parameters that are not filters, so have no "not_" form
+QPARAMS_OPTION_LISTS = ("fields",)
+
 
 def _parse_query_params(query_params, valid_vars=None):
     if not valid_vars:
@@ -93,6 +126,8 @@ def _parse_query_params(query_params, valid_vars=None):
             data[param] = query_params.getlist(param)
         elif param in QPARAMS_NOT_LISTS:
             data[param] = query_params.getlist(param)
+        elif param in QPARAMS_OPTION_LISTS:
+            data[param] = query_params.getlist(param)
         # TODO: else: Error if extra parameters? Or ignore?
     return data
 
@@ -119,6 +154,134 @@ def _build_headers():
     return headers
 
 
+def _parse_last_indexed(last_indexed):
+    try:
+        return int(datetime.fromisoformat(last_indexed).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+# -----------------------------------------------------------------------------
+# Response caching
+#
+# When settings.CCDB_RESPONSE_CACHE names a configured cache, responses are
+# stored in it under a key built from the canonical request params and the
+# index version, and clients can revalidate them with If-None-Match or
+# If-Modified-Since without touching OpenSearch.
+
+
+def _response_cache_enabled():
+    return bool(getattr(settings, "CCDB_RESPONSE_CACHE", None))
+
+
+def _response_cache_lookup(
+    request, endpoint, params, headers, index_version, meta_flags
+):
+    """
+    Add validators for a cacheable request to `headers` and return its
+    cache key, along with a 304 response or the cached results if either
+    is available. The key and ETag cover the _meta flags, which can change
+    while the index version does not.
+    """
+    version, last_indexed = index_version
+    key = "ccdb:{}:{}".format(
+        endpoint,
+        canonical_hash([canonical_params(params), version, meta_flags]),
+    )
+    headers["ETag"] = quote_etag(key.rsplit(":", 1)[1])
+    last_modified = _parse_last_indexed(last_indexed)
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    not_modified = get_conditional_response(
+        request, etag=headers["ETag"], last_modified=last_modified
+    )
+    if not_modified is not None:
+        for header in headers:
+            not_modified[header] = headers[header]
+        return key, not_modified, None
+
+    cache = caches[settings.CCDB_RESPONSE_CACHE]
+    return key, None, cache.get(key)
+
+
+def _response_cache_store(key, results, headers):
+    """
+    Cache results under `key`, unless admission control downgraded them.
+    A downgraded response only suits the load it was served under, so it
+    is neither cached nor given validators that would let clients keep it.
+    """
+    if results.get("_meta", {}).get("downgraded"):
+        headers.pop("ETag", None)
+        headers.pop("Last-Modified", None)
+        return
+    caches[settings.CCDB_RESPONSE_CACHE].set(
+        key, results, getattr(settings, "CCDB_RESPONSE_CACHE_TIMEOUT", 300)
+    )
+
+
+def _cached_response(request, endpoint, params, fetch):
+    headers = _build_headers()
+    if not _response_cache_enabled():
+        return Response(fetch(), headers=headers)
+
+    key, not_modified, results = _response_cache_lookup(
+        request,
+        endpoint,
+        params,
+        headers,
+        es_interface.get_index_version(),
+        es_interface.get_meta_flags(),
+    )
+    if not_modified is not None:
+        return not_modified
+    if results is None:
+        results = fetch()
+        _response_cache_store(key, results, headers)
+    return Response(results, headers=headers)
+
+
+def _snapshot_response(request, format, files):
+    """
+    Serve an export from the matching full-dataset snapshot, picking the
+    pre-compressed copy a client asks for. Returns None if the file is
+    gone, such as when a newer snapshot replaced it.
+    """
+    headers = _build_headers()
+    content_type = FORMAT_CONTENT_TYPE_MAP[format]
+    extension = format
+    coding = "identity"
+    if request.query_params.get("compression") == "gzip":
+        coding = "gzip"
+        content_type = "application/gzip"
+        extension += ".gz"
+    elif getattr(settings, "CCDB_EXPORT_COMPRESSION", False):
+        encoding = negotiate_encoding(
+            request.META.get("HTTP_ACCEPT_ENCODING"),
+            [coding for coding in available_encodings() if coding in files],
+        )
+        if encoding:
+            coding = encoding
+            headers["Content-Encoding"] = encoding
+    try:
+        f = open(files[coding], "rb")
+    except (KeyError, OSError):
+        return None
+
+    response = FileResponse(
+        f,
+        as_attachment=True,
+        filename="complaints-{}.{}".format(
+            datetime.now().strftime("%Y-%m-%d_%H_%M"), extension
+        ),
+        content_type=content_type,
+    )
+    for header in headers:
+        response[header] = headers[header]
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
 # -----------------------------------------------------------------------------
 # Request Handlers: Complaints
 
@@ -129,6 +292,8 @@ def _build_headers():
         DefaultRenderer,
         JSONRenderer,
         CSVRenderer,
+        NDJSONRenderer,
+        ParquetRenderer,
     )
 )
 @throttle_classes(
@@ -155,26 +320,133 @@ def search(request):
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    results = es_interface.search(
-        agg_exclude=AGG_EXCLUDE_FIELDS, **serializer.validated_data
-    )
-    headers = _build_headers()
-
     if format not in EXPORT_FORMATS:
-        return Response(results, headers=headers)
+        return _cached_response(
+            request,
+            "search",
+            serializer.validated_data,
+            lambda: es_interface.search(
+                agg_exclude=AGG_EXCLUDE_FIELDS, **serializer.validated_data
+            ),
+        )
+
+    if request.query_params.get("background", "").lower() in ("true", "1"):
+        return _submit_export_job(request, serializer.validated_data)
+
+    # A resume token continues a streamed export, never a snapshot
+    snapshot = None
+    if resume.RESUME_PARAM not in request.query_params:
+        snapshot = snapshots.find(serializer.validated_data)
+    if snapshot is not None:
+        response = _snapshot_response(request, format, snapshot)
+        if response is not None:
+            return response
+
+    headers = _build_headers()
+    content_type = FORMAT_CONTENT_TYPE_MAP[format]
+    extension = format
+    status_code = status.HTTP_200_OK
+    resumable = resume.is_resumable(format)
+
+    compressible = format in COMPRESSIBLE_EXPORT_FORMATS
+    level = getattr(settings, "CCDB_EXPORT_COMPRESSION_LEVEL", 6)
+    gzip_download = False
+    encoding = None
+    if compressible:
+        if request.query_params.get("compression") == "gzip":
+            # Download a gzipped file instead of decoding it in the client
+            gzip_download = True
+            content_type = "application/gzip"
+            extension += ".gz"
+        elif getattr(settings, "CCDB_EXPORT_COMPRESSION", False):
+            # Ranges of a resumable export refer to its uncompressed bytes,
+            # so it is never encoded, or a client could not resume it
+            if not resumable:
+                encoding = negotiate_encoding(
+                    request.META.get("HTTP_ACCEPT_ENCODING")
+                )
+
+    resumable = resumable and not gzip_download and not encoding
+    token = None
+    if resume.RESUME_PARAM in request.query_params:
+        token = resume.parse_resume_token(
+            request.query_params[resume.RESUME_PARAM]
+        )
+        if token is None or not resumable:
+            return Response(
+                {resume.RESUME_PARAM: ["This export cannot be resumed"]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+    if resumable:
+        key = resume.export_key(
+            serializer.validated_data, es_interface.get_index_version()[0]
+        )
+        if token is not None:
+            point = resume.token_point(token, key)
+            if point is None:
+                return Response(
+                    {resume.RESUME_PARAM: ["This export cannot be resumed"]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        else:
+            point = resume.resume_point(request, key)
+            if point is not None:
+                offset, length = point[0], point[3]["length"]
+                if offset >= length:
+                    return _range_not_satisfiable(length)
+                headers["Content-Range"] = resume.content_range(
+                    offset, length
+                )
+                status_code = status.HTTP_206_PARTIAL_CONTENT
+        offset, start, sort, entry = point or (0, 0, None, None)
+        cursor = {}
+        results = resume.checkpointed(
+            es_interface.resumable_export(
+                agg_exclude=AGG_EXCLUDE_FIELDS,
+                cursor=cursor,
+                search_after=sort,
+                **serializer.validated_data,
+            ),
+            key,
+            resume.query_signature(request.query_params),
+            cursor,
+            start=start,
+            entry=entry,
+        )
+        if offset > start:
+            results = resume.skip_bytes(results, offset - start)
+        # The rest of an export sent for a token is not a representation
+        # that ranges or validators could refer to
+        if token is None:
+            headers["ETag"] = resume.etag(key)
+            headers["Accept-Ranges"] = "bytes"
+    else:
+        results = es_interface.search(
+            agg_exclude=AGG_EXCLUDE_FIELDS, **serializer.validated_data
+        )
+        if gzip_download:
+            results = compress_stream(results, "gzip", level)
+        elif encoding:
+            results = compress_stream(results, encoding, level)
+            headers["Content-Encoding"] = encoding
 
     # If format is in export formats, update its attachment response
     # with a filename
     response = StreamingHttpResponse(
-        streaming_content=results, content_type=FORMAT_CONTENT_TYPE_MAP[format]
+        streaming_content=results,
+        content_type=content_type,
+        status=status_code,
     )
     filename = "complaints-{}.{}".format(
-        datetime.now().strftime("%Y-%m-%d_%H_%M"), format
+        datetime.now().strftime("%Y-%m-%d_%H_%M"), extension
     )
     header_template = 'attachment; filename="{}"'
     response["Content-Disposition"] = header_template.format(filename)
     for header in headers:
         response[header] = headers[header]
+    if compressible:
+        patch_vary_headers(response, ("Accept-Encoding",))
 
     return response
 
@@ -251,6 +523,195 @@ def document(request, id):
     return Response(results, headers=_build_headers())
 
 
+# -----------------------------------------------------------------------------
+# Request Handlers: Filter sets
+#
+# Long lists of filter values are registered once, then referenced from
+# search, states and trends requests with the filter_set param.
+
+
+def _filter_set_result(request, record):
+    url = reverse(
+        "complaint_search:filter_set", kwargs={"set_id": record["id"]}
+    )
+    return {
+        "id": record["id"],
+        "name": record["name"],
+        "filters": record["filters"],
+        "url": request.build_absolute_uri(url),
+    }
+
+
+@api_view(["POST"])
+@throttle_classes([FilterSetAnonRateThrottle])
+@catch_es_error
+def register_filter_set(request):
+    if filter_sets.get_filter_sets() is None:
+        return Response(
+            {"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND
+        )
+    serializer = FilterSetSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    record = es_interface.register_filter_set(
+        serializer.validated_data["filters"],
+        name=serializer.validated_data.get("name"),
+    )
+    result = _filter_set_result(request, record)
+    headers = _build_headers()
+    headers["Location"] = result["url"]
+    return Response(result, status=status.HTTP_201_CREATED, headers=headers)
+
+
+@api_view(["GET"])
+def filter_set(request, set_id):
+    record = filter_sets.get_filter_set(set_id)
+    if record is None:
+        return Response(
+            {"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(
+        _filter_set_result(request, record), headers=_build_headers()
+    )
+
+
+# -----------------------------------------------------------------------------
+# Request Handlers: Export jobs
+#
+# An export requested with background=true is written to disk by a worker
+# pool. Clients poll its status and download the file once it is finished.
+
+
+def _export_job_status(request, job):
+    status_url = reverse(
+        "complaint_search:export_status", kwargs={"job_id": job["id"]}
+    )
+    result = {
+        "id": job["id"],
+        "status": job["status"],
+        "format": job["format"],
+        "bytes_written": job["bytes_written"],
+        "error": job["error"],
+        "status_url": request.build_absolute_uri(status_url),
+    }
+    if job["status"] == jobs.FINISHED:
+        download_url = reverse(
+            "complaint_search:export_download", kwargs={"job_id": job["id"]}
+        )
+        result["download_url"] = request.build_absolute_uri(download_url)
+    return result
+
+
+def _submit_export_job(request, params):
+    job = jobs.get_export_jobs().submit(params)
+    result = _export_job_status(request, job)
+    headers = _build_headers()
+    headers["Location"] = result["status_url"]
+    return Response(result, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+
+def _parse_range(range_header, size):
+    """
+    Return the (start, end) byte positions of a single-range Range header,
+    None to send the whole file, or False if the range cannot be satisfied.
+
+    Like a missing header, an invalid one is ignored (RFC 9110, 14.2).
+    """
+    units, _, ranges = (range_header or "").partition("=")
+    if units.strip() != "bytes" or "," in ranges:
+        return None
+    start, _, end = ranges.strip().partition("-")
+    if not (start + end).isdecimal():
+        return None
+    if not start:
+        if not int(end):
+            return False
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        return False
+    return start, min(int(end), size - 1) if end else size - 1
+
+
+def _range_not_satisfiable(size):
+    response = HttpResponse(
+        status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+    )
+    response["Content-Range"] = "bytes */{}".format(size)
+    return response
+
+
+def _read_range(f, start, length, chunk_size=EXPORT_CHUNK_SIZE):
+    with f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+@api_view(["GET"])
+def export_status(request, job_id):
+    job = jobs.get_export_jobs().get(job_id)
+    if job is None:
+        return Response(
+            {"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(_export_job_status(request, job), headers=_build_headers())
+
+
+def export_download(request, job_id):
+    export_jobs = jobs.get_export_jobs()
+    job = export_jobs.get(job_id)
+    if job is None or job["status"] != jobs.FINISHED:
+        raise Http404("No finished export found")
+    path = export_jobs.file_path(job)
+    try:
+        f = open(path, "rb")
+    except OSError:
+        raise Http404("No finished export found")
+    size = os.fstat(f.fileno()).st_size
+    content_type = FORMAT_CONTENT_TYPE_MAP[job["format"]]
+    filename = "complaints-{}.{}".format(
+        datetime.fromtimestamp(job["finished"]).strftime("%Y-%m-%d_%H_%M"),
+        job["format"],
+    )
+
+    byte_range = _parse_range(request.META.get("HTTP_RANGE"), size)
+    if byte_range is False:
+        f.close()
+        return _range_not_satisfiable(size)
+    if byte_range is None:
+        # FileResponse lets the server send the file with wsgi.file_wrapper
+        response = FileResponse(
+            f,
+            as_attachment=True,
+            filename=filename,
+            content_type=content_type,
+        )
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(f, start, end - start + 1),
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type=content_type,
+        )
+        response["Content-Range"] = "bytes {}-{}/{}".format(start, end, size)
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Disposition"] = 'attachment; filename="{}"'.format(
+            filename
+        )
+    response["Accept-Ranges"] = "bytes"
+    headers = _build_headers()
+    for header in headers:
+        response[header] = headers[header]
+    return response
+
+
 # -----------------------------------------------------------------------------
 # Request Handlers: Geo
 
@@ -264,12 +725,14 @@ def states(request):
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    results = es_interface.states_agg(
-        agg_exclude=AGG_EXCLUDE_FIELDS, **serializer.validated_data
+    return _cached_response(
+        request,
+        "states",
+        serializer.validated_data,
+        lambda: es_interface.states_agg(
+            agg_exclude=AGG_EXCLUDE_FIELDS, **serializer.validated_data
+        ),
     )
-    headers = _build_headers()
-
-    return Response(results, headers=headers)
 
 
 # -----------------------------------------------------------------------------
@@ -285,9 +748,11 @@ def trends(request):
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    results = es_interface.trends(
-        agg_exclude=AGG_EXCLUDE_FIELDS, **serializer.validated_data
+    return _cached_response(
+        request,
+        "trends",
+        serializer.validated_data,
+        lambda: es_interface.trends(
+            agg_exclude=AGG_EXCLUDE_FIELDS, **serializer.validated_data
+        ),
     )
-    headers = _build_headers()
-
-    return Response(results, headers=headers)
@@ -0,0 +1,173 @@
+from django.http import Http404, HttpResponse
+
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.exceptions import NotAcceptable, Throttled
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from complaint_search import es_interface_async, views
+from complaint_search.decorators import catch_es_error_async
+from complaint_search.defaults import AGG_EXCLUDE_FIELDS, EXPORT_FORMATS
+from complaint_search.serializer import (
+    SearchInputSerializer,
+    TrendsInputSerializer,
+)
+from complaint_search.throttling import (
+    ExportAnonRateThrottle,
+    ExportUIRateThrottle,
+    SearchAnonRateThrottle,
+)
+
+
+# -----------------------------------------------------------------------------
+# Async request handlers
+#
+# These replace the search, states and trends handlers in views when
+# settings.CCDB_ASYNC_VIEWS is set. They validate, throttle and cache
+# exactly like their synchronous counterparts, but await es_interface_async
+# so a worker can keep many OpenSearch requests in flight at once. Throttles
+# and the response cache may block on their cache backend, so they run in
+# a worker thread.
+
+
+def _json_response(data, status_code=status.HTTP_200_OK, headers=None):
+    response = HttpResponse(
+        JSONRenderer().render(data),
+        status=status_code,
+        content_type="application/json",
+    )
+    for header, value in (headers or {}).items():
+        response[header] = value
+    return response
+
+
+def _throttled_response(request, throttle_classes):
+    drf_request = Request(request)
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not throttle.allow_request(drf_request, None):
+            exception = Throttled(throttle.wait())
+            headers = {}
+            # Like DRF's exception handler
+            if exception.wait:
+                headers["Retry-After"] = "%d" % exception.wait
+            return _json_response(
+                {"detail": exception.detail}, exception.status_code, headers
+            )
+    return None
+
+
+async def _cached_response(request, endpoint, params, fetch):
+    headers = views._build_headers()
+    if not views._response_cache_enabled():
+        return _json_response(await fetch(), headers=headers)
+
+    index_version = await es_interface_async.get_index_version()
+    meta_flags = await es_interface_async.get_meta_flags()
+    key, not_modified, results = await sync_to_async(
+        views._response_cache_lookup
+    )(request, endpoint, params, headers, index_version, meta_flags)
+    if not_modified is not None:
+        return not_modified
+    if results is None:
+        results = await fetch()
+        await sync_to_async(views._response_cache_store)(
+            key, results, headers
+        )
+    return _json_response(results, headers=headers)
+
+
+def _validated(serializer_class, data):
+    # Validating a filter_set reads the registered set from disk
+    serializer = serializer_class(data=data)
+    if not serializer.is_valid():
+        return None, _json_response(
+            serializer.errors, status.HTTP_400_BAD_REQUEST
+        )
+    return serializer.validated_data, None
+
+
+# The APIView class behind views.search, whose negotiation search reuses
+_SEARCH_VIEW = views.search.cls
+
+
+def _is_export(request):
+    # Negotiate like views.search, from the format parameter or the Accept
+    # header. Requests it would refuse are left for it to answer.
+    renderers = [renderer() for renderer in _SEARCH_VIEW.renderer_classes]
+    negotiator = _SEARCH_VIEW.content_negotiation_class()
+    try:
+        renderer, _ = negotiator.select_renderer(Request(request), renderers)
+    except (Http404, NotAcceptable):
+        return True
+    return renderer.format in EXPORT_FORMATS
+
+
+@catch_es_error_async
+async def search(request):
+    # Exports stream from the synchronous client, so use the regular view
+    if _is_export(request):
+        return await sync_to_async(views.search)(request)
+
+    throttled = await sync_to_async(_throttled_response)(
+        request,
+        [SearchAnonRateThrottle, ExportUIRateThrottle, ExportAnonRateThrottle],
+    )
+    if throttled:
+        return throttled
+
+    data = views._parse_query_params(request.GET)
+    data["format"] = "default"
+    validated_data, error = await sync_to_async(_validated)(
+        SearchInputSerializer, data
+    )
+    if error:
+        return error
+
+    return await _cached_response(
+        request,
+        "search",
+        validated_data,
+        lambda: es_interface_async.search(
+            agg_exclude=AGG_EXCLUDE_FIELDS, **validated_data
+        ),
+    )
+
+
+@catch_es_error_async
+async def states(request):
+    data = views._parse_query_params(request.GET)
+    validated_data, error = await sync_to_async(_validated)(
+        SearchInputSerializer, data
+    )
+    if error:
+        return error
+
+    return await _cached_response(
+        request,
+        "states",
+        validated_data,
+        lambda: es_interface_async.states_agg(
+            agg_exclude=AGG_EXCLUDE_FIELDS, **validated_data
+        ),
+    )
+
+
+@catch_es_error_async
+async def trends(request):
+    data = views._parse_query_params(request.GET)
+    validated_data, error = await sync_to_async(_validated)(
+        TrendsInputSerializer, data
+    )
+    if error:
+        return error
+
+    return await _cached_response(
+        request,
+        "trends",
+        validated_data,
+        lambda: es_interface_async.trends(
+            agg_exclude=AGG_EXCLUDE_FIELDS, **validated_data
+        ),
+    )
@@ -64,6 +64,19 @@ testing_extras = [
 ]
 
 
+async_extras = [
+    "aiohttp>=3.9,<4",
+]
+
+parquet_extras = [
+    "pyarrow>=14",
+]
+
+zstd_extras = [
+    "zstandard>=0.22",
+]
+
+
 setup(
     name="ccdb5-api",
     version=get_git_version(),
@@ -87,6 +100,9 @@ setup(
     setup_requires=[],
     install_requires=install_requires,
     extras_require={
+        "async": async_extras,
+        "parquet": parquet_extras,
         "testing": testing_extras,
+        "zstd": zstd_extras,
     },
 )